@@ -2,6 +2,10 @@
 ASGI config for billing project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with any ASGI server, e.g. ``uvicorn billing.asgi:application``. The
+billing screen's lookup APIs are async views, so under ASGI requests waiting
+on the database don't queue for a fixed pool of worker threads;
+``manage.py load_test`` compares the concurrent capacity with WSGI.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
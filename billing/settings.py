@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'medical.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -95,6 +96,18 @@ DATABASES = {
     }
 }
 
+# Cache
+# Local-memory stand-in; point this at a shared backend such as Redis in
+# production so search index invalidation reaches every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'medical',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -148,3 +161,19 @@ EMAIL_USE_TLS = True
 
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
+
+# Billing
+# Bill numbers each process reserves per trip to the sequence table. 1 keeps
+# numbers strictly sequential; larger blocks cut contention on busy counters.
+BILL_NUMBER_BLOCK_SIZE = 1
+
+# Profiling
+# Per-view query counts and timings, a Server-Timing header and Prometheus
+# metrics at /metrics/ (staff or a bearer token only, see below). Off
+# by default; the middleware then unloads itself and costs nothing.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED') == '1'
+# Identical query shapes per request at which a view is flagged as N+1
+PROFILING_N_PLUS_ONE_THRESHOLD = 5
+# /metrics/ is served to staff users, and to scrapers sending
+# "Authorization: Bearer <token>" when this is set
+PROFILING_METRICS_TOKEN = os.getenv('PROFILING_METRICS_TOKEN', '')
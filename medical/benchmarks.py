@@ -0,0 +1,453 @@
+import asyncio
+import io
+import json
+import logging
+import random
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Bill, Customer, Medicine, MedicineBarcode
+from .profiling import RequestProfile
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class BenchmarkRunner:
+    """
+    Times the hot request paths end to end through the Django test client.
+
+    Each path is requested `iterations` times (after `warmup` untimed runs)
+    with inputs drawn from the data already in the database; every request
+    is profiled for its query count. Writes (create_bill, cancel_bill) run
+    inside one transaction that is rolled back at the end, so the dataset
+    is unchanged and runs stay comparable across commits. Results are plain
+    dicts, ready to dump as JSON.
+    """
+
+    PATHS = [
+        'create_bill', 'search_medicine_ajax', 'scan_barcode', 'resolve_barcodes', 'medicine_stock',
+        'bill_list', 'customer_detail', 'cancel_bill',
+    ]
+
+    # Each request flushes `sync_batch` offline bills, so these only run when asked for
+    THROUGHPUT_PATHS = ['sync_bills']
+
+    def __init__(self, iterations=50, warmup=3, seed=0, paths=None, sync_batch=1000):
+        self.iterations = iterations
+        self.warmup = warmup
+        self.rng = random.Random(seed)
+        self.paths = paths or self.PATHS
+        self.sync_batch = sync_batch
+
+    def run(self):
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with transaction.atomic(), override_settings(ALLOWED_HOSTS=['*']):
+                results = self._run()
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            request_logger.setLevel(level)
+        return {
+            'commit': _git_commit(),
+            'database': connection.vendor,
+            'timestamp': timezone.now().isoformat(),
+            'iterations': self.iterations,
+            'dataset': {
+                'medicines': Medicine.objects.count(),
+                'customers': Customer.objects.count(),
+                'bills': Bill.objects.count(),
+            },
+            'results': results,
+        }
+
+    def _run(self):
+        user, _ = User.objects.get_or_create(
+            username='benchmark-runner', defaults={'is_staff': True, 'is_superuser': True}
+        )
+        # Failing pages are reported through their status codes
+        self.client = Client(raise_request_exception=False)
+        self.client.force_login(user)
+
+        today = timezone.now().date()
+        self.medicines = list(
+            Medicine.objects.filter(quantity__gte=100, expiry_date__gt=today)
+            .order_by('pk').values_list('pk', 'name')[:2000]
+        )
+        if not self.medicines:
+            # Give some lots enough stock for the create_bill samples
+            ids = list(Medicine.objects.filter(expiry_date__gt=today).order_by('pk').values_list('pk', flat=True)[:2000])
+            Medicine.objects.filter(pk__in=ids).update(quantity=1000)
+            self.medicines = list(Medicine.objects.filter(pk__in=ids).values_list('pk', 'name'))
+        self.barcodes = list(
+            MedicineBarcode.objects.filter(name__in={name for _, name in self.medicines})
+            .order_by('code').values_list('code', flat=True)
+        )
+        self.customers = list(Customer.objects.order_by('pk').values_list('pk', flat=True)[:5000])
+        self.cancellable = list(
+            Bill.objects.filter(status='completed', refunded_amount=0).order_by('-pk')
+            .values_list('pk', flat=True)[:(self.iterations + self.warmup) * 2]
+        )
+
+        results = {path: self._measure(getattr(self, f'_request_{path}')) for path in self.paths}
+        flush = results.get('sync_bills', {})
+        if 'p50_ms' in flush:
+            flush['batch_size'] = self.sync_batch
+            flush['bills_per_second'] = round(self.sync_batch / flush['p50_ms'] * 1000, 1)
+        return results
+
+    def _measure(self, request):
+        samples, queries, statuses = [], [], {}
+        for attempt in range(self.warmup + self.iterations):
+            make_request = request()
+            if make_request is None:
+                return {'skipped': 'not enough data to drive this path'}
+            profile = RequestProfile()
+            start = time.perf_counter()
+            with connection.execute_wrapper(profile):
+                response = make_request()
+            elapsed = (time.perf_counter() - start) * 1000
+            if attempt < self.warmup:
+                continue
+            samples.append(elapsed)
+            queries.append(profile.queries)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return {
+            'p50_ms': round(statistics.median(samples), 3),
+            'p95_ms': round(percentile(samples, 95), 3),
+            'mean_ms': round(statistics.fmean(samples), 3),
+            'max_ms': round(max(samples), 3),
+            'queries_p50': statistics.median(queries),
+            'queries_max': max(queries),
+            'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+        }
+
+    # Each _request_<path> returns a zero-argument callable making one
+    # request, or None when the dataset can't drive that path
+
+    def _request_create_bill(self):
+        if not self.medicines:
+            return None
+        lines = self.rng.sample(self.medicines, min(3, len(self.medicines)))
+        body = json.dumps({
+            'items': [{'medicine_id': pk, 'quantity': 1} for pk, _ in lines],
+            'customer_name': 'Benchmark',
+            'customer_phone': '0000000000',
+            'payment_method': 'cash',
+        })
+        return lambda: self.client.post(reverse('create_bill'), body, content_type='application/json')
+
+    def _request_search_medicine_ajax(self):
+        if not self.medicines:
+            return None
+        name = self.rng.choice(self.medicines)[1]
+        query = name[:self.rng.randint(2, min(6, max(2, len(name))))]
+        return lambda: self.client.get(reverse('search_medicine_ajax'), {'q': query})
+
+    def _request_scan_barcode(self):
+        if not self.barcodes:
+            return None
+        code = self.rng.choice(self.barcodes)
+        return lambda: self.client.get(reverse('scan_barcode'), {'code': code})
+
+    def _request_resolve_barcodes(self):
+        if not self.barcodes:
+            return None
+        codes = self.rng.choices(self.barcodes, k=10)
+        return lambda: self.client.get(reverse('resolve_barcodes'), {'codes': ','.join(codes)})
+
+    def _request_medicine_stock(self):
+        return lambda: self.client.get(reverse('medicine_stock'))
+
+    def _request_bill_list(self):
+        return lambda: self.client.get(reverse('bill_list'))
+
+    def _request_customer_detail(self):
+        if not self.customers:
+            return None
+        customer_id = self.rng.choice(self.customers)
+        return lambda: self.client.get(reverse('customer_detail', args=[customer_id]))
+
+    def _request_sync_bills(self):
+        if not self.medicines:
+            return None
+        bills = [{
+            'client_reference': f'benchmark-{self.rng.getrandbits(64):016x}',
+            'items': [{'medicine_id': pk, 'quantity': 1}
+                      for pk, _ in self.rng.sample(self.medicines, min(3, len(self.medicines)))],
+            'customer_name': 'Benchmark',
+            'customer_phone': '0000000000',
+            'payment_method': 'cash',
+        } for _ in range(self.sync_batch)]
+        body = json.dumps({'bills': bills})
+        return lambda: self.client.post(reverse('sync_bills'), body, content_type='application/json')
+
+    def _request_cancel_bill(self):
+        if not self.cancellable:
+            return None
+        bill_id = self.cancellable.pop()
+        return lambda: self.client.post(reverse('cancel_bill', args=[bill_id]))
+
+
+def compare(baseline, current):
+    """Per path changes in p50/p95 latency (%) and median query count against a baseline run"""
+    changes = {}
+    for path, result in current['results'].items():
+        before = baseline.get('results', {}).get(path)
+        if not before or 'p50_ms' not in before or 'p50_ms' not in result:
+            continue
+        changes[path] = {
+            'p50_change_pct': round((result['p50_ms'] / before['p50_ms'] - 1) * 100, 1) if before['p50_ms'] else None,
+            'p95_change_pct': round((result['p95_ms'] / before['p95_ms'] - 1) * 100, 1) if before['p95_ms'] else None,
+            'queries_change': result['queries_p50'] - before['queries_p50'],
+        }
+    return changes
+
+
+# ============================================================================
+# CONCURRENCY LOAD TEST
+# ============================================================================
+
+def _summary(latencies, statuses, wall):
+    return {
+        'requests_per_second': round(len(latencies) / wall, 1),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'max_ms': round(max(latencies), 3),
+        'status_codes': {str(code): statuses.count(code) for code in sorted(set(statuses))},
+    }
+
+
+class _SharedWorkers(ThreadPoolExecutor):
+    """
+    One thread pool standing in for every executor asgiref creates.
+
+    Django's ASGI handler runs each request's sync work (sessions, queries)
+    on a thread of its own, so left alone the ASGI side gets a thread per
+    request in flight. Handing asgiref this pool instead caps it at the
+    same number of threads as the WSGI side. Requests shut down "their"
+    executor when they finish; the pool is shut down once, by close().
+    """
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def shutdown(self, wait=True, **kwargs):
+        pass
+
+    def close(self):
+        super().shutdown()
+
+
+class LoadTest:
+    """
+    Requests per second one process sustains on a billing lookup API, ASGI vs WSGI.
+
+    `concurrency` clients send requests back to back, in process, to
+    Django's WSGI handler behind `threads` worker threads (as with
+    `gunicorn --threads`) and to its ASGI handler (one event loop), whose
+    sync work runs on the same number of threads. Latencies are measured
+    from the client, so they include waiting for a free worker.
+    `db_latency_ms` adds a sleep to every query, standing in for a slow
+    database moment: a WSGI worker is then held for the whole request,
+    while an ASGI request only holds a thread for each query. The paths
+    are read-only; the only write is a login session for the benchmark user.
+    """
+
+    PATHS = ['search_medicine_ajax', 'get_medicine_details', 'lookup_customers']
+    MODES = ['wsgi', 'asgi']
+
+    def __init__(self, path='search_medicine_ajax', requests=2000, concurrency=100, threads=8,
+                 db_latency_ms=0, seed=0):
+        self.path = path
+        self.requests = requests
+        self.concurrency = concurrency
+        self.threads = threads
+        self.db_latency_ms = db_latency_ms
+        self.rng = random.Random(seed)
+
+    def run(self, modes=None):
+        targets = self._targets()
+        if not targets:
+            raise ValueError(f'Not enough data to drive {self.path}')
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self._session_key()}'
+
+        def add_latency(sender, connection, **kwargs):
+            # Worker threads keep their connection wrapper across reconnects
+            if self._slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(self._slow_query)
+
+        if self.db_latency_ms:
+            connection_created.connect(add_latency, weak=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['*']):
+                results = {mode: getattr(self, f'_run_{mode}')(targets, cookie) for mode in modes or self.MODES}
+        finally:
+            connection_created.disconnect(add_latency)
+
+        return {
+            'commit': _git_commit(),
+            'database': connection.vendor,
+            'timestamp': timezone.now().isoformat(),
+            'path': self.path,
+            'requests': self.requests,
+            'concurrency': self.concurrency,
+            'threads': self.threads,
+            'db_latency_ms': self.db_latency_ms,
+            'results': results,
+        }
+
+    def _slow_query(self, execute, sql, params, many, context):
+        time.sleep(self.db_latency_ms / 1000)
+        return execute(sql, params, many, context)
+
+    def _session_key(self):
+        user, _ = User.objects.get_or_create(
+            username='benchmark-runner', defaults={'is_staff': True, 'is_superuser': True}
+        )
+        client = Client()
+        client.force_login(user)
+        return client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def _targets(self):
+        """(path, query string) per request"""
+        if self.path == 'search_medicine_ajax':
+            names = list(Medicine.objects.order_by('pk').values_list('name', flat=True)[:5000])
+            url = reverse('search_medicine_ajax')
+            return [(url, f'q={name[:self.rng.randint(2, min(6, max(2, len(name))))]}')
+                    for name in (self.rng.choice(names) for _ in range(self.requests))] if names else []
+        if self.path == 'get_medicine_details':
+            ids = list(Medicine.objects.order_by('pk').values_list('pk', flat=True)[:5000])
+            return [(reverse('get_medicine_details', args=[self.rng.choice(ids)]), '')
+                    for _ in range(self.requests)] if ids else []
+        phones = [phone for phone in Customer.objects.order_by('pk').values_list('phone', flat=True)[:5000]
+                  if len(phone) >= 4]
+        url = reverse('lookup_customers')
+        return [(url, f'q={self.rng.choice(phones)[:4]}') for _ in range(self.requests)] if phones else []
+
+    def _run_wsgi(self, targets, cookie):
+        handler = WSGIHandler()
+
+        def call(path, query):
+            status = []
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie, 'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.input': io.BytesIO(), 'wsgi.errors': io.StringIO(), 'wsgi.url_scheme': 'http',
+                'wsgi.version': (1, 0), 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            response = handler(environ, lambda line, headers, exc_info=None: status.append(int(line[:3])))
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+            return status[0]
+
+        pending, lock = iter(targets), threading.Lock()
+        latencies, statuses = [], []
+
+        def client(workers):
+            while True:
+                with lock:
+                    target = next(pending, None)
+                if target is None:
+                    return
+                start = time.perf_counter()
+                status = workers.submit(call, *target).result()
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses.append(status)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.threads) as workers, ThreadPoolExecutor(self.concurrency) as clients:
+            for future in [clients.submit(client, workers) for _ in range(self.concurrency)]:
+                future.result()
+        return _summary(latencies, statuses, time.perf_counter() - start)
+
+    def _run_asgi(self, targets, cookie):
+        handler = ASGIHandler()
+
+        async def call(path, query):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+                'query_string': query.encode(), 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+                'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            }
+            status, finished, requested = [], asyncio.Event(), []
+
+            async def receive():
+                if not requested:
+                    requested.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await finished.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    finished.set()
+
+            await handler(scope, receive, send)
+            return status[0]
+
+        latencies, statuses = [], []
+        workers = _SharedWorkers(self.threads)
+
+        async def main():
+            asyncio.get_running_loop().set_default_executor(workers)
+            pending = iter(targets)
+
+            async def client():
+                for target in pending:
+                    start = time.perf_counter()
+                    statuses.append(await call(*target))
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(self.concurrency)))
+            return time.perf_counter() - start
+
+        try:
+            with mock.patch('asgiref.sync.ThreadPoolExecutor', workers):
+                wall = asyncio.run(main())
+        finally:
+            workers.close()
+        return _summary(latencies, statuses, wall)
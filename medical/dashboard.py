@@ -0,0 +1,149 @@
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.utils import timezone
+
+from .models import Bill, Customer, DailySalesSummary, Medicine
+
+DASHBOARD_VERSION_KEY = 'medical:dashboard-version'
+DASHBOARD_METRICS_KEY = 'medical:dashboard-metrics'
+DASHBOARD_REFRESH_KEY = 'medical:dashboard-refresh'
+
+# Cached figures are dropped after this many seconds even without a write,
+# so day rollovers and expiry dates passing show up on their own
+CACHE_TIMEOUT = 60
+
+# How long one worker may hold the refresh before another takes over
+REFRESH_TIMEOUT = 10
+
+RECENT_BILLS = 5
+LOW_STOCK_ALERTS = 5
+
+
+
+def invalidate():
+    """Mark the cached dashboard figures as stale (call after bill or stock writes commit)"""
+    try:
+        cache.incr(DASHBOARD_VERSION_KEY)
+    except ValueError:
+        cache.set(DASHBOARD_VERSION_KEY, 1, timeout=None)
+
+
+def compute_metrics():
+    """
+    Every dashboard KPI, straight from the database.
+
+    Seven queries whatever the data size: one aggregate over medicines
+    (counts and stock value), one over the daily sales rollup (today,
+    yesterday and month to date), one for outstanding credit, one grouped
+    over today's bills per cashier, the customer count, the latest bills
+    and the lowest-stocked lots. Values are plain dicts and lists so the
+    result pickles into the cache.
+    """
+    today = timezone.localdate()
+    yesterday = today - timedelta(days=1)
+    month_start = today.replace(day=1)
+
+    stock = Medicine.objects.stock_counts(
+        stock_value=Sum(
+            ExpressionWrapper(F('quantity') * F('unit_price'), output_field=DecimalField()),
+            filter=Q(quantity__gt=0),
+        ),
+    )
+
+    rollup = DailySalesSummary.objects.filter(date__gte=min(month_start, yesterday), date__lte=today).order_by()
+    sales = rollup.aggregate(
+        today_bills=Sum('bill_count', filter=Q(date=today) & ~Q(status='cancelled')),
+        today_completed=Sum('total_amount', filter=Q(date=today, status='completed')),
+        today_refunded=Sum('total_amount', filter=Q(date=today, status='refunded')),
+        yesterday_completed=Sum('total_amount', filter=Q(date=yesterday, status='completed')),
+        yesterday_refunded=Sum('total_amount', filter=Q(date=yesterday, status='refunded')),
+        month_completed=Sum('total_amount', filter=Q(date__gte=month_start, status='completed')),
+        month_refunded=Sum('total_amount', filter=Q(date__gte=month_start, status='refunded')),
+    )
+
+    def net(period):
+        return (sales[f'{period}_completed'] or 0) - (sales[f'{period}_refunded'] or 0)
+
+    credit = Bill.objects.filter(status='completed', amount_due__gt=0).order_by().aggregate(
+        pending_bills=Count('pk'), pending_amount=Sum('amount_due'),
+    )
+
+    day_start = timezone.make_aware(datetime.combine(today, time.min))
+    shifts = list(
+        Bill.objects.filter(status='completed', created_at__gte=day_start).order_by()
+        .values('created_by_id', 'created_by__username')
+        .annotate(bills=Count('pk'), sales=Sum(F('total_amount') - F('refunded_amount')))
+        .order_by('-sales')
+    )
+
+    recent_bills = list(
+        Bill.objects.order_by('-created_at').values(
+            'id', 'bill_number', 'customer_name', 'total_amount', 'status', 'amount_due', 'created_at',
+        )[:RECENT_BILLS]
+    )
+    low_stock = list(
+        Medicine.objects.low_stock().not_expired().order_by('quantity', 'name').values(
+            'id', 'name', 'batch_number', 'quantity', 'reorder_level',
+        )[:LOW_STOCK_ALERTS]
+    )
+
+    return {
+        'date': today,
+        'generated_at': timezone.now(),
+        'total_medicines': stock['total_medicines'],
+        'low_stock_count': stock['low_stock_count'],
+        'expired_count': stock['expired_count'],
+        'out_of_stock': stock['out_of_stock'],
+        'stock_value': stock['stock_value'] or 0,
+        'today_bills': sales['today_bills'] or 0,
+        'today_sales': net('today'),
+        'yesterday_sales': net('yesterday'),
+        'month_sales': net('month'),
+        'pending_bills': credit['pending_bills'],
+        'pending_amount': credit['pending_amount'] or 0,
+        'total_customers': Customer.objects.count(),
+        'cashier_shifts': [
+            {
+                'user_id': shift['created_by_id'],
+                'username': shift['created_by__username'] or 'Unassigned',
+                'bills': shift['bills'],
+                'sales': shift['sales'] or 0,
+            }
+            for shift in shifts
+        ],
+        'recent_bills': recent_bills,
+        'low_stock_medicines': low_stock,
+    }
+
+
+def dashboard_metrics():
+    """
+    The dashboard KPIs, usually from one cache round trip.
+
+    Figures are cached with a short timeout and tagged with the dashboard
+    version, which bill and stock writes bump (see invalidate()). A stale
+    entry is recomputed by only one worker at a time; while it does, the
+    others keep serving the previous figures rather than all hitting the
+    database at once during a burst of sales.
+    """
+    cached = cache.get_many([DASHBOARD_VERSION_KEY, DASHBOARD_METRICS_KEY])
+    version = cached.get(DASHBOARD_VERSION_KEY)
+    metrics = cached.get(DASHBOARD_METRICS_KEY)
+    today = timezone.localdate()
+
+    if metrics and metrics['date'] == today and metrics['version'] == version:
+        return metrics
+
+    refreshing = cache.add(DASHBOARD_REFRESH_KEY, 1, timeout=REFRESH_TIMEOUT)
+    if metrics and metrics['date'] == today and not refreshing:
+        return metrics
+
+    try:
+        metrics = dict(compute_metrics(), version=version)
+        cache.set(DASHBOARD_METRICS_KEY, metrics, timeout=CACHE_TIMEOUT)
+    finally:
+        if refreshing:
+            cache.delete(DASHBOARD_REFRESH_KEY)
+    return metrics
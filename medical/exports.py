@@ -0,0 +1,93 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Bill, BillItem, StockTransaction
+
+CHUNK_SIZE = 2000
+
+# kind -> (model, date field, exported columns); columns are values_list()
+# lookups, so rows are plain tuples and no model instances are built
+EXPORTS = {
+    'bills': (Bill, 'created_at', [
+        'id', 'bill_number', 'created_at', 'status', 'customer_id', 'customer_name',
+        'customer_phone', 'subtotal', 'discount_percentage', 'discount_amount',
+        'tax_percentage', 'tax_amount', 'total_amount', 'payment_method', 'amount_paid',
+        'amount_due', 'created_by__username', 'notes',
+    ]),
+    'bill-items': (BillItem, 'created_at', [
+        'id', 'bill_id', 'bill__bill_number', 'created_at', 'medicine_id', 'medicine_name',
+        'batch_number', 'quantity', 'unit_price', 'total_price',
+    ]),
+    'stock-transactions': (StockTransaction, 'transaction_date', [
+        'id', 'transaction_date', 'medicine_id', 'medicine__name', 'transaction_type',
+        'quantity', 'price_per_unit', 'total_amount', 'bill_reference',
+        'performed_by__username', 'notes',
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_rows(kind, date_from=None, date_to=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield the header and then one tuple per row for an export kind.
+
+    Rows are read in primary-key order, `chunk_size` at a time, each chunk
+    seeking past the last id of the previous one. Unlike a single
+    `.iterator()` this stays in constant memory on MySQL too, whose client
+    otherwise buffers the whole result set.
+    """
+    model, date_field, columns = EXPORTS[kind]
+    rows = model.objects.order_by('pk')
+    if date_from:
+        rows = rows.filter(**{f'{date_field}__gte': _day_start(date_from)})
+    if date_to:
+        rows = rows.filter(**{f'{date_field}__lt': _day_start(date_to + timedelta(days=1))})
+    rows = rows.values_list(*columns)
+
+    yield columns
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1][0]
+
+
+class _Echo:
+    """File-like object whose write() just returns the line, for csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    rows = iter(rows)
+    header = next(rows)
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), default=str) + '\n'
+
+
+def export_lines(kind, output_format='csv', **filters):
+    """Encoded lines for an export, ready to stream"""
+    rows = export_rows(kind, **filters)
+    if output_format == 'jsonl':
+        return jsonl_lines(rows)
+    return csv_lines(rows)
@@ -0,0 +1,289 @@
+import csv
+import io
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import dashboard, records
+from .barcodes import is_valid_gtin, normalize_code, register_barcodes
+from .models import Medicine, StockTransaction
+from .search import MedicineSearchIndex
+
+REQUIRED_COLUMNS = [
+    'name', 'category', 'manufacturer', 'quantity', 'unit_price', 'selling_price',
+    'manufacturing_date', 'expiry_date', 'batch_number',
+]
+OPTIONAL_COLUMNS = ['generic_name', 'description', 'reorder_level', 'rack_number', 'barcode']
+
+# A product's barcodes go in one cell, e.g. `8901234567890;08901234567890`
+BARCODE_SEPARATORS = re.compile(r'[;|]')
+
+# Fields overwritten on existing (name, batch_number) rows
+UPDATE_FIELDS = [
+    'generic_name', 'category', 'manufacturer', 'description', 'quantity', 'reorder_level',
+    'unit_price', 'selling_price', 'manufacturing_date', 'expiry_date', 'rack_number',
+]
+
+CATEGORIES = {}
+for _value, _label in Medicine.CATEGORY_CHOICES:
+    CATEGORIES[_value] = _value
+    CATEGORIES[_label.lower()] = _value
+
+
+class ImportResult:
+    """Counts and per-row errors from a medicine import"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []  # (row number, message)
+
+    @property
+    def processed(self):
+        return self.created + self.updated
+
+    def __str__(self):
+        return f'{self.created} created, {self.updated} updated, {len(self.errors)} errors'
+
+
+# ============================================================================
+# ROW SOURCES
+# ============================================================================
+
+def csv_rows(file_obj, encoding='utf-8-sig'):
+    """Stream dict rows from a CSV file (text or binary)"""
+    if isinstance(file_obj, io.TextIOBase):
+        text = file_obj
+    else:
+        text = io.TextIOWrapper(file_obj, encoding=encoding, newline='')
+    for row in csv.DictReader(text):
+        yield {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+
+
+def xlsx_rows(file_obj):
+    """Stream dict rows from the first sheet of an .xlsx workbook (requires openpyxl)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError('Excel import needs the openpyxl package; upload a CSV file instead')
+
+    workbook = load_workbook(file_obj, read_only=True, data_only=True)
+    try:
+        values = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell or '').strip().lower() for cell in next(values, [])]
+        for cells in values:
+            yield {
+                key: '' if cell is None else str(cell.date() if hasattr(cell, 'date') else cell).strip()
+                for key, cell in zip(header, cells)
+            }
+    finally:
+        workbook.close()
+
+
+def rows_for_upload(file_obj, filename):
+    """Pick a row reader from the uploaded file's extension"""
+    if filename.lower().endswith('.xlsx'):
+        return xlsx_rows(file_obj)
+    return csv_rows(file_obj)
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def _parse_int(row, column, default=None):
+    value = row.get(column, '')
+    if value == '' and default is not None:
+        return default
+    try:
+        number = int(Decimal(value))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f'{column} must be a whole number')
+    if number < 0:
+        raise ValueError(f'{column} cannot be negative')
+    return number
+
+
+def _parse_price(row, column):
+    try:
+        price = Decimal(row.get(column, '')).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ValueError(f'{column} must be a number')
+    if price < 0:
+        raise ValueError(f'{column} cannot be negative')
+    return price
+
+
+def _parse_date(row, column):
+    try:
+        return date.fromisoformat(row.get(column, '')[:10])
+    except ValueError:
+        raise ValueError(f'{column} must be a date in YYYY-MM-DD format')
+
+
+def clean_row(row):
+    """Validate one import row; returns Medicine field values plus `barcodes`, or raises ValueError"""
+    missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+    if missing:
+        raise ValueError(f'Missing {", ".join(missing)}')
+
+    category = CATEGORIES.get(row['category'].lower())
+    if category is None:
+        raise ValueError(f'Unknown category "{row["category"]}"')
+
+    values = {
+        'name': row['name'][:200],
+        'generic_name': row.get('generic_name', '')[:200],
+        'category': category,
+        'manufacturer': row['manufacturer'][:200],
+        'description': row.get('description', ''),
+        'quantity': _parse_int(row, 'quantity'),
+        'reorder_level': _parse_int(row, 'reorder_level', default=10),
+        'unit_price': _parse_price(row, 'unit_price'),
+        'selling_price': _parse_price(row, 'selling_price'),
+        'manufacturing_date': _parse_date(row, 'manufacturing_date'),
+        'expiry_date': _parse_date(row, 'expiry_date'),
+        'batch_number': row['batch_number'][:100],
+        'rack_number': row.get('rack_number', '')[:50],
+    }
+    if values['expiry_date'] < values['manufacturing_date']:
+        raise ValueError('expiry_date is before manufacturing_date')
+
+    values['barcodes'] = []
+    for code in BARCODE_SEPARATORS.split(row.get('barcode', '')):
+        normalized = normalize_code(code)
+        if not normalized:
+            continue
+        if len(normalized) > 64:
+            raise ValueError(f'barcode "{code.strip()[:20]}..." is longer than 64 characters')
+        if normalized.isdigit() and len(normalized) == 14 and not is_valid_gtin(normalized):
+            raise ValueError(f'barcode {code.strip()} has a wrong GTIN check digit')
+        values['barcodes'].append(normalized)
+    return values
+
+
+# ============================================================================
+# IMPORT
+# ============================================================================
+
+def _import_chunk(chunk, user, result):
+    """Upsert one chunk of cleaned rows and write its stock transactions and barcodes"""
+    rows, codes = {}, {}
+    for _, values in chunk:
+        codes.update(dict.fromkeys(values.pop('barcodes'), values['name']))
+        # A later row for the same key replaces an earlier one, so each lot
+        # gets one write and at most one stock adjustment
+        rows[(values['name'], values['batch_number'])] = values
+
+    now = timezone.now()
+    to_create, to_update, adjustments = {}, {}, []
+    with transaction.atomic():
+        # Existing lots are locked while their new quantity is written, so a
+        # sale can't commit between this read and the write and be lost
+        existing = {
+            (medicine.name, medicine.batch_number): medicine
+            # Filtering on name alone keeps this one index probe per name; a
+            # second IN on batch_number would probe every name/batch pair
+            for medicine in Medicine.objects.select_for_update().filter(
+                name__in={name for name, _ in rows}
+            ).order_by('pk')
+            if (medicine.name, medicine.batch_number) in rows
+        }
+
+        for key, values in rows.items():
+            medicine = existing.get(key)
+            if medicine is None:
+                to_create[key] = Medicine(created_by=user, **values)
+                continue
+            old_quantity = medicine.quantity
+            for field in UPDATE_FIELDS:
+                setattr(medicine, field, values[field])
+            medicine.updated_at = now
+            if old_quantity != medicine.quantity:
+                adjustments.append((medicine, old_quantity))
+            to_update[key] = medicine
+
+        Medicine.objects.bulk_create(to_create.values())
+        Medicine.objects.bulk_update(to_update.values(), UPDATE_FIELDS + ['updated_at'])
+
+        # bulk_create doesn't return ids on every backend (e.g. MySQL)
+        if to_create and any(medicine.pk is None for medicine in to_create.values()):
+            created_ids = {
+                (name, batch): pk
+                for pk, name, batch in Medicine.objects.filter(
+                    name__in={name for name, _ in to_create}
+                ).order_by('pk').values_list('pk', 'name', 'batch_number')
+                if (name, batch) in to_create
+            }
+            for key, medicine in to_create.items():
+                medicine.pk = created_ids[key]
+
+        transactions = [
+            StockTransaction(
+                medicine=medicine,
+                transaction_type='purchase',
+                quantity=medicine.quantity,
+                price_per_unit=medicine.unit_price,
+                total_amount=medicine.quantity * medicine.unit_price,
+                notes='Initial stock',
+                performed_by=user,
+            )
+            for medicine in to_create.values() if medicine.quantity > 0
+        ]
+        transactions += [
+            StockTransaction(
+                medicine=medicine,
+                transaction_type='purchase' if medicine.quantity > old_quantity else 'sale',
+                quantity=abs(medicine.quantity - old_quantity),
+                price_per_unit=medicine.unit_price,
+                total_amount=abs(medicine.quantity - old_quantity) * medicine.unit_price,
+                notes=f'Stock adjusted from {old_quantity} to {medicine.quantity} via import',
+                performed_by=user,
+            )
+            for medicine, old_quantity in adjustments
+        ]
+        StockTransaction.objects.bulk_create(transactions)
+        register_barcodes(codes)
+
+    result.created += len(to_create)
+    result.updated += len(to_update)
+
+
+def import_medicines(rows, user=None, batch_size=1000):
+    """
+    Upsert medicines from an iterable of dict rows, keyed on (name, batch_number).
+
+    Rows are consumed `batch_size` at a time, so memory stays bounded however
+    large the file is. Each chunk is one lookup query plus bulk inserts and
+    updates in its own transaction; new medicines get an "Initial stock"
+    purchase transaction and changed quantities an adjustment, as in
+    add_medicine. Barcodes in the optional `barcode` column are attached to
+    the row's product (see barcodes.register_barcodes). Invalid rows are
+    skipped and reported in the result.
+    """
+    result = ImportResult()
+    numbered = enumerate(rows, start=2)  # row 1 is the header
+
+    while True:
+        chunk, consumed = [], 0
+        for row_number, row in islice(numbered, batch_size):
+            consumed += 1
+            try:
+                chunk.append((row_number, clean_row(row)))
+            except ValueError as e:
+                result.errors.append((row_number, str(e)))
+        if chunk:
+            _import_chunk(chunk, user, result)
+        if consumed < batch_size:
+            break
+
+    # bulk writes don't send post_save, so tell the search index, dashboard and record cache directly
+    if result.processed:
+        MedicineSearchIndex.invalidate()
+        dashboard.invalidate()
+        records.invalidate_all()
+    return result
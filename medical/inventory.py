@@ -0,0 +1,253 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from . import dashboard, records
+from .models import Medicine, StockTransaction, is_past_expiry, sellable_q
+
+
+class InsufficientStock(Exception):
+    """Raised when a sale asks for more units than a medicine has in stock"""
+
+    def __init__(self, medicine, requested, available=None):
+        self.medicine = medicine
+        self.requested = requested
+        self.available = medicine.quantity if available is None else available
+        super().__init__(
+            f'Insufficient stock for {medicine.name}. Available: {self.available}'
+        )
+
+
+class _Short(Exception):
+    """Rolls back a partially applied take_stock()"""
+
+
+def _stock_changed(medicine_ids):
+    """Stock moved: refresh the dashboard and the moved records once the transaction commits"""
+    transaction.on_commit(dashboard.invalidate)
+    transaction.on_commit(partial(records.invalidate, list(medicine_ids)))
+
+
+def _shift(quantities, sign):
+    """Case expression moving each listed medicine's quantity by sign * n"""
+    return Case(
+        *[When(pk=medicine_id, then=F('quantity') + sign * quantity)
+          for medicine_id, quantity in quantities.items()],
+        default=F('quantity'),
+    )
+
+
+def take_stock(quantities):
+    """
+    Take stock out for {medicine_id: quantity} in one conditional UPDATE.
+
+    Each row is only changed while it still holds enough units
+    (`quantity = quantity - n WHERE quantity >= n`), so concurrent sales can
+    never oversell or overwrite each other, and no row is locked before the
+    write itself. If any medicine is short the whole decrement is rolled back
+    and InsufficientStock (or Medicine.DoesNotExist) is raised.
+    """
+    if not quantities:
+        return
+
+    condition = Q()
+    for medicine_id, quantity in quantities.items():
+        condition |= Q(pk=medicine_id, quantity__gte=quantity)
+
+    try:
+        with transaction.atomic():
+            updated = Medicine.objects.filter(condition).update(quantity=_shift(quantities, -1))
+            if updated != len(quantities):
+                raise _Short
+    except _Short:
+        pass
+    else:
+        _stock_changed(quantities)
+        return
+
+    # Locking read so we report the committed quantity, not our snapshot
+    medicines = Medicine.objects.select_for_update().in_bulk(list(quantities))
+    for medicine_id, quantity in quantities.items():
+        if medicine_id not in medicines:
+            raise Medicine.DoesNotExist(f'Medicine not found: {medicine_id}')
+        if medicines[medicine_id].quantity < quantity:
+            raise InsufficientStock(medicines[medicine_id], quantity)
+    raise RuntimeError('Stock changed while it was being taken, please retry')
+
+
+def return_stock(quantities):
+    """Put {medicine_id: quantity} back into stock in one UPDATE"""
+    if quantities:
+        Medicine.objects.filter(pk__in=list(quantities)).update(quantity=_shift(quantities, 1))
+        _stock_changed(quantities)
+
+
+def adjust_stock(deltas):
+    """Move each {medicine_id: delta} by its (signed) delta in one UPDATE"""
+    if deltas:
+        Medicine.objects.filter(pk__in=list(deltas)).update(quantity=_shift(deltas, 1))
+        _stock_changed(deltas)
+
+
+def record_adjustment(medicine, delta, notes, performed_by=None):
+    """
+    Move one medicine's stock by `delta` and write its ledger row, in one transaction.
+
+    A decrease goes through take_stock(), so it raises InsufficientStock
+    rather than taking the lot below zero.
+    """
+    with transaction.atomic():
+        if delta < 0:
+            take_stock({medicine.pk: -delta})
+        else:
+            adjust_stock({medicine.pk: delta})
+        StockTransaction.objects.create(
+            medicine=medicine,
+            transaction_type='purchase' if delta > 0 else 'sale',
+            quantity=abs(delta),
+            price_per_unit=medicine.unit_price,
+            notes=notes,
+            performed_by=performed_by,
+        )
+
+
+def receive_stock(quantities, unit_prices):
+    """Add {medicine_id: quantity} to stock and set {medicine_id: unit_price} in one UPDATE"""
+    if quantities:
+        Medicine.objects.filter(pk__in=list(quantities)).update(
+            quantity=_shift(quantities, 1),
+            unit_price=Case(
+                *[When(pk=medicine_id, then=Value(price)) for medicine_id, price in unit_prices.items()],
+                default=F('unit_price'),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ),
+        )
+        _stock_changed(quantities)
+
+
+# ============================================================================
+# FEFO LOT ALLOCATION
+# ============================================================================
+
+def sellable_lots(names):
+    """
+    In-stock, unexpired lots of the named products, earliest expiry first.
+
+    A product's lots are the Medicine rows sharing its name, one per batch;
+    the (name, expiry_date) index serves this range directly.
+    """
+    return Medicine.objects.sellable().filter(name__in=names).order_by('name', 'expiry_date', 'id')
+
+
+def allocate_fefo(requests):
+    """
+    Spread each (medicine_id, quantity) over its product's lots, first expiry first out.
+
+    The requested rows and every sellable lot of their products are read and
+    locked in one query, so the allocation holds until the bill commits.
+    Returns one [(lot, quantity), ...] list per request, in order. Raises
+    Medicine.DoesNotExist for unknown ids and InsufficientStock when a
+    product's unexpired lots can't cover it.
+    """
+    ids = {medicine_id for medicine_id, _ in requests}
+    names = Medicine.objects.filter(pk__in=ids).values('name')
+    today = timezone.now().date()
+
+    lots = Medicine.objects.select_for_update().filter(
+        Q(pk__in=ids) | (Q(name__in=names) & sellable_q(today))
+    ).order_by('name', 'expiry_date', 'id')
+
+    requested_rows, lots_by_name = {}, {}
+    for lot in lots:
+        if lot.pk in ids:
+            requested_rows[lot.pk] = lot
+        if lot.quantity > 0 and not is_past_expiry(lot.expiry_date, today):
+            lots_by_name.setdefault(lot.name, []).append(lot)
+
+    missing = ids - set(requested_rows)
+    if missing:
+        raise Medicine.DoesNotExist(f'Medicine not found: {sorted(missing)}')
+
+    remaining = {}
+    allocations = []
+    for medicine_id, quantity in requests:
+        product = requested_rows[medicine_id]
+        product_lots = lots_by_name.get(product.name, [])
+        available = sum(remaining.get(lot.pk, lot.quantity) for lot in product_lots)
+        if available < quantity:
+            raise InsufficientStock(product, quantity, available=available)
+
+        allocation, needed = [], quantity
+        for lot in product_lots:
+            if needed == 0:
+                break
+            left = remaining.get(lot.pk, lot.quantity)
+            if left == 0:
+                continue
+            taken = min(left, needed)
+            remaining[lot.pk] = left - taken
+            allocation.append((lot, taken))
+            needed -= taken
+        allocations.append(allocation)
+
+    return allocations
+
+
+# ============================================================================
+# EXPIRY WRITE-OFF
+# ============================================================================
+
+def _write_off_transactions(rows, performed_by, note):
+    """One unsaved `expired` transaction per (pk, quantity, unit_price) lot row"""
+    return [
+        StockTransaction(
+            medicine_id=pk,
+            transaction_type='expired',
+            quantity=quantity,
+            price_per_unit=unit_price,
+            total_amount=quantity * unit_price,
+            notes=note,
+            performed_by=performed_by,
+        )
+        for pk, quantity, unit_price in rows
+    ]
+
+
+def write_off_expired(performed_by=None, batch_size=1000):
+    """
+    Take every expired lot's remaining stock out with an `expired` transaction.
+
+    A lot is written off from its expiry date on, the same day checkout
+    stops selling it (models.expired_q). Candidates come from one scan of
+    the expiry_date index. They are then written off `batch_size` at a
+    time: a locking read of the chunk, one bulk_create of its transactions
+    and one UPDATE. Written-off lots are left at
+    quantity 0, so running it again (e.g. from a nightly cron) does nothing
+    until more stock expires. Returns (lots written off, units written off).
+    """
+    candidates = list(
+        Medicine.objects.expired().filter(quantity__gt=0).order_by().values_list('pk', flat=True)
+    )
+
+    lots = units = 0
+    note = f'Expired stock written off {timezone.now().date():%Y-%m-%d}'
+    for start in range(0, len(candidates), batch_size):
+        with transaction.atomic():
+            rows = list(
+                Medicine.objects.select_for_update()
+                .filter(pk__in=candidates[start:start + batch_size], quantity__gt=0)
+                .order_by()
+                .values_list('pk', 'quantity', 'unit_price')
+            )
+            if not rows:
+                continue
+            ids = [pk for pk, _, _ in rows]
+            StockTransaction.objects.bulk_create(_write_off_transactions(rows, performed_by, note))
+            Medicine.objects.filter(pk__in=ids).update(quantity=0)
+            _stock_changed(ids)
+        lots += len(rows)
+        units += sum(quantity for _, quantity, _ in rows)
+
+    return lots, units
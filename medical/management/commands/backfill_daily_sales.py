@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.services import rebuild_daily_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DailySalesSummary rollup from bills'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+
+        written = rebuild_daily_sales(since=since)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} daily sales summary rows'))
@@ -0,0 +1,73 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from medical.models import Medicine
+from medical.services import post_bill, refund_bill
+
+
+class _Rollback(Exception):
+    pass
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Measure refund throughput and queries per refund for a recall-day style burst (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refunds', type=int, default=500)
+        parser.add_argument('--lines', type=int, default=5, help='Lines per bill, all refunded')
+
+    def handle(self, *args, **options):
+        medicines = list(Medicine.objects.filter(quantity__gt=0).order_by('pk')[:options['lines']])
+        if len(medicines) < options['lines']:
+            self.stderr.write(f'Need {options["lines"]} medicines in stock; load some data first.')
+            return
+
+        try:
+            with transaction.atomic():
+                self._run(medicines, options['refunds'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    def _run(self, medicines, count):
+        # Give every medicine enough stock for the sales posted below
+        Medicine.objects.filter(pk__in=[m.pk for m in medicines]).update(quantity=count + 1)
+
+        bills = [
+            post_bill(
+                [{'medicine_id': m.pk, 'quantity': 1} for m in medicines],
+                customer_name='Benchmark',
+            )
+            for _ in range(count)
+        ]
+        lines = {bill.pk: [{'item_id': pk, 'quantity': 1} for pk in bill.items.values_list('pk', flat=True)]
+                 for bill in bills}
+
+        samples, queries = [], []
+        start = time.perf_counter()
+        for bill in bills:
+            began = time.perf_counter()
+            counter = _QueryCounter()
+            with connection.execute_wrapper(counter):
+                refund_bill(bill.pk, lines[bill.pk], reason='Recall')
+            samples.append((time.perf_counter() - began) * 1000)
+            queries.append(counter.count)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{count} refunds of {len(medicines)} lines in {elapsed:.2f}s '
+            f'({count / elapsed:.0f} refunds/s), p50={statistics.median(samples):.2f}ms, '
+            f'queries per refund: min={min(queries)} max={max(queries)}'
+        )
@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.models import Medicine
+from medical.search import medicine_search_index, orm_search
+
+
+# The typeahead's latency budget per keystroke (search_products p99)
+TARGET_P99_MS = 5
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = 'Compare medicine typeahead latency: prefix index vs. ORM icontains scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=500, help='Number of searches per path')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--max-p99-ms', type=float, default=TARGET_P99_MS,
+                            help='Fail when the products p99 is slower than this (0 to only report)')
+
+    def handle(self, *args, **options):
+        names = list(Medicine.objects.values_list('name', flat=True)[:5000])
+        if not names:
+            self.stderr.write('No medicines to search; load some data first.')
+            return
+
+        rng = random.Random(options['seed'])
+        # Typeahead-style prefixes of 2-6 characters
+        queries = []
+        for _ in range(options['queries']):
+            name = rng.choice(names)
+            queries.append(name[:rng.randint(2, min(6, max(2, len(name))))])
+
+        start = time.perf_counter()
+        medicine_search_index.build()
+        build_ms = (time.perf_counter() - start) * 1000
+
+        # products is what the billing screen's typeahead calls; lots and orm
+        # are the index and the substring scans it replaced, one row per lot
+        paths = (
+            ('products', medicine_search_index.search_products),
+            ('lots', medicine_search_index.search),
+            ('orm', orm_search),
+        )
+        p99 = {}
+        for label, search in paths:
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                search(query, limit=10)
+                samples.append((time.perf_counter() - start) * 1000)
+            p99[label] = _percentile(samples, 99)
+            self.stdout.write(
+                f'{label:>8}: p50={statistics.median(samples):.3f}ms '
+                f'p99={_percentile(samples, 99):.3f}ms max={max(samples):.3f}ms'
+            )
+
+        # The first search after a name, batch or expiry edit rebuilds the
+        # index, in every process; dropped locally so other processes keep theirs
+        medicine_search_index._snapshot = None
+        start = time.perf_counter()
+        medicine_search_index.search_products(queries[0], limit=10)
+        stale_ms = (time.perf_counter() - start) * 1000
+
+        self.stdout.write(f'index build: {build_ms:.1f}ms for {Medicine.objects.count()} medicines')
+        self.stdout.write(f'first search after an edit (rebuild included): {stale_ms:.1f}ms')
+
+        if options['max_p99_ms'] and p99['products'] > options['max_p99_ms']:
+            raise CommandError(
+                f'products p99 {p99["products"]:.3f}ms is over the {options["max_p99_ms"]}ms budget'
+            )
@@ -0,0 +1,84 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.db import connection, transaction
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.inventory import InsufficientStock, take_stock
+from medical.models import Medicine
+
+
+def _naive_take(medicine_id, quantity):
+    """The old BillItem.save pattern: read, subtract in Python, save"""
+    medicine = Medicine.objects.get(pk=medicine_id)
+    if medicine.quantity < quantity:
+        raise InsufficientStock(medicine, quantity)
+    medicine.quantity -= quantity
+    medicine.save(update_fields=['quantity'])
+
+
+def _conditional_take(medicine_id, quantity):
+    with transaction.atomic():
+        take_stock({medicine_id: quantity})
+
+
+class Command(BaseCommand):
+    help = 'Hammer one hot SKU from many threads and report sale throughput and lost updates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--sales', type=int, default=200, help='Sales per thread')
+        parser.add_argument('--stock', type=int, default=None,
+                            help='Opening stock (default: enough for every sale)')
+        parser.add_argument('--naive', action='store_true',
+                            help='Also run the old read-modify-write decrement for comparison')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError('SQLite serializes writers; run this against MySQL')
+
+        threads, sales = options['threads'], options['sales']
+        attempts = threads * sales
+        opening = options['stock'] if options['stock'] is not None else attempts
+
+        modes = [('conditional', _conditional_take)]
+        if options['naive']:
+            modes.append(('naive', _naive_take))
+
+        for label, take in modes:
+            medicine = Medicine.objects.create(
+                name='Benchmark SKU', category='tablet', manufacturer='Benchmark',
+                quantity=opening, unit_price=1, selling_price=1,
+                manufacturing_date=date.today(), expiry_date=date.today() + timedelta(days=365),
+                batch_number=f'BENCH-{label}',
+            )
+
+            def worker(_):
+                sold = rejected = 0
+                try:
+                    for _ in range(sales):
+                        try:
+                            take(medicine.pk, 1)
+                            sold += 1
+                        except InsufficientStock:
+                            rejected += 1
+                finally:
+                    connection.close()
+                return sold, rejected
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                results = list(pool.map(worker, range(threads)))
+            elapsed = time.perf_counter() - start
+
+            sold = sum(s for s, _ in results)
+            rejected = sum(r for _, r in results)
+            medicine.refresh_from_db()
+            lost = (opening - sold) - medicine.quantity
+            self.stdout.write(
+                f'{label:>11}: {sold} sold, {rejected} rejected in {elapsed:.2f}s '
+                f'({attempts / elapsed:.0f} sales/s), final stock {medicine.quantity}, '
+                f'lost updates {lost}'
+            )
+            medicine.delete()
@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.inventory import write_off_expired
+from medical.models import Medicine
+
+
+class Command(BaseCommand):
+    help = (
+        'Write off expired stock and list lots expiring soon. '
+        'Safe to schedule (e.g. nightly cron): reruns only touch newly expired stock.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help='Alert horizon in days')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--user', help='Username recorded on the write-off transactions')
+        parser.add_argument('--dry-run', action='store_true', help='Only report, write nothing')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user named "{options["user"]}"')
+
+        start = time.perf_counter()
+
+        expiring = Medicine.objects.expiring_within(options['days']).filter(quantity__gt=0)
+        alerts = list(expiring.order_by('expiry_date', 'name').values_list(
+            'name', 'batch_number', 'quantity', 'expiry_date'
+        ))
+        for name, batch_number, quantity, expiry_date in alerts:
+            self.stdout.write(f'{expiry_date:%Y-%m-%d}  {name} ({batch_number}): {quantity} units')
+        self.stdout.write(f'{len(alerts)} lot(s) with stock expire within {options["days"]} days')
+
+        if options['dry_run']:
+            pending = Medicine.objects.expired().filter(quantity__gt=0).count()
+            self.stdout.write(f'{pending} expired lot(s) would be written off')
+            return
+
+        lots, units = write_off_expired(performed_by=user, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote off {units} units across {lots} expired lot(s) '
+            f'in {time.perf_counter() - start:.2f}s'
+        ))
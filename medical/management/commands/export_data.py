@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.exports import EXPORTS, FORMATS, export_lines
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'"{value}" is not a date in YYYY-MM-DD format')
+
+
+class Command(BaseCommand):
+    help = 'Stream bills, bill items or stock transactions to CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--date-from', type=_date)
+        parser.add_argument('--date-to', type=_date)
+        parser.add_argument('--output', help='File to write (defaults to stdout)')
+
+    def handle(self, *args, **options):
+        lines = export_lines(
+            options['kind'],
+            options['format'],
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+        )
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                out.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.dataset import DatasetGenerator
+from medical.models import Bill, Medicine
+
+
+class Command(BaseCommand):
+    help = 'Fill an empty database with a synthetic pharmacy dataset for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--medicines', type=int, default=100000, help='Medicine lots')
+        parser.add_argument('--customers', type=int, default=20000)
+        parser.add_argument('--bills', type=int, default=1000000)
+        parser.add_argument('--items-per-bill', type=int, default=5, help='Average lines per bill')
+        parser.add_argument('--days', type=int, default=365, help='Days of history the bills cover')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if Medicine.objects.exists() or Bill.objects.exists():
+            raise CommandError('The database already has medicines or bills; point this at an empty database')
+        if min(options['medicines'], options['days'], options['items_per_bill']) < 1:
+            raise CommandError('--medicines, --days and --items-per-bill must be at least 1')
+
+        start = time.perf_counter()
+        generator = DatasetGenerator(
+            medicines=options['medicines'],
+            customers=options['customers'],
+            bills=options['bills'],
+            days=options['days'],
+            items_per_bill=options['items_per_bill'],
+            seed=options['seed'],
+            progress=lambda message: self.stdout.write(f'{time.perf_counter() - start:8.1f}s  {message}'),
+        )
+        counts = generator.run()
+
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{count} {name.replace("_", " ")}' for name, count in counts.items())
+            + f' in {time.perf_counter() - start:.1f}s'
+        ))
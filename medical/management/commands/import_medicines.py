@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.importers import import_medicines, rows_for_upload
+
+
+class Command(BaseCommand):
+    help = 'Bulk add/update medicines from a CSV or .xlsx file, keyed on (name, batch_number)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or .xlsx file to import')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--user', help='Username recorded as creator of the stock transactions')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'Unknown user "{options["user"]}"')
+
+        with open(options['path'], 'rb') as file_obj:
+            try:
+                result = import_medicines(
+                    rows_for_upload(file_obj, options['path']),
+                    user=user,
+                    batch_size=options['batch_size'],
+                )
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        for row_number, message in result.errors:
+            self.stderr.write(f'Row {row_number}: {message}')
+        self.stdout.write(self.style.SUCCESS(f'Import finished: {result}'))
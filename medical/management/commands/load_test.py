@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.benchmarks import LoadTest
+
+
+class Command(BaseCommand):
+    help = (
+        'Concurrent load on one billing lookup API through the ASGI and WSGI handlers in this '
+        'process; prints requests per second and latency per mode as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', choices=LoadTest.PATHS, default='search_medicine_ajax')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=100, help='Clients sending requests at once')
+        parser.add_argument('--threads', type=int, default=8, help='Worker threads (WSGI workers; ASGI sync work)')
+        parser.add_argument('--db-latency-ms', type=float, default=0,
+                            help='Sleep added to every query, to simulate a slow database')
+        parser.add_argument('--mode', action='append', choices=LoadTest.MODES, dest='modes',
+                            help='Only run this handler (repeatable)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if min(options['requests'], options['concurrency'], options['threads']) < 1:
+            raise CommandError('--requests, --concurrency and --threads must be at least 1')
+
+        try:
+            report = LoadTest(
+                path=options['path'],
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                threads=options['threads'],
+                db_latency_ms=options['db_latency_ms'],
+                seed=options['seed'],
+            ).run(options['modes'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,43 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.reorder import rebuild_daily_demand, refresh_daily_demand, reorder_suggestions, write_report
+
+
+class Command(BaseCommand):
+    help = 'Update sales velocity from the stock ledger and write a purchase suggestion report (CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lead-time', type=int, default=7, help='Supplier lead time in days')
+        parser.add_argument('--review-days', type=int, default=14, help='Days of demand each order should cover')
+        parser.add_argument('--service-level', type=float, default=0.95)
+        parser.add_argument('--output', help='CSV file to write (defaults to stdout)')
+        parser.add_argument('--all', action='store_true', help='Include products that need no order')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute velocity from the whole ledger')
+
+    def handle(self, *args, **options):
+        if not 0 < options['service_level'] < 1:
+            raise CommandError('--service-level must be between 0 and 1')
+
+        start = time.perf_counter()
+        processed = rebuild_daily_demand() if options['rebuild'] else refresh_daily_demand()
+        suggestions = reorder_suggestions(
+            lead_time_days=options['lead_time'],
+            review_days=options['review_days'],
+            service_level=options['service_level'],
+        )
+        if not options['all']:
+            suggestions = [s for s in suggestions if s['suggested_quantity']]
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                write_report(suggestions, out)
+        else:
+            write_report(suggestions, sys.stdout)
+
+        self.stderr.write(
+            f'{processed} new ledger rows, {len(suggestions)} products in report, '
+            f'{time.perf_counter() - start:.2f}s'
+        )
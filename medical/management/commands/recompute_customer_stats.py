@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from medical.services import recompute_customer_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Customer purchase aggregates (bill count, lifetime spend, last purchase) from bills'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        updated = recompute_customer_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed stats for {updated} customers with purchases'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from medical.models import Medicine
+from medical.reconciliation import reconcile_stock
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare medicine stock with the stock ledger since the last checkpoint, '
+        'report discrepancies and store a new checkpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help='Move drifted medicines back to the ledger quantity')
+        parser.add_argument('--no-checkpoint', action='store_true',
+                            help='Only report; the next run starts from the same checkpoint')
+        parser.add_argument('--limit', type=int, default=50, help='Discrepancies to list')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = reconcile_stock(repair=options['repair'], checkpoint=not options['no_checkpoint'])
+
+        listed = result.discrepancies[:options['limit']]
+        medicines = Medicine.objects.in_bulk([medicine_id for medicine_id, _, _ in listed])
+        for medicine_id, expected, stock in listed:
+            medicine = medicines.get(medicine_id)
+            label = f'{medicine.name} ({medicine.batch_number})' if medicine else f'#{medicine_id}'
+            self.stdout.write(f'{label}: ledger {expected}, stock {stock}, drift {stock - expected:+d}')
+        if len(result.discrepancies) > len(listed):
+            self.stdout.write(f'... and {len(result.discrepancies) - len(listed)} more')
+
+        style = self.style.WARNING if result.discrepancies and not result.repaired else self.style.SUCCESS
+        self.stdout.write(style(f'{result} in {time.perf_counter() - start:.2f}s'))
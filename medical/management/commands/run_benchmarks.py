@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from medical.benchmarks import BenchmarkRunner, compare
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the key request paths (p50/p95 latency and query counts) against the current '
+        'database and print the results as JSON; writes are rolled back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per path')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--path', action='append', dest='paths',
+                            choices=BenchmarkRunner.PATHS + BenchmarkRunner.THROUGHPUT_PATHS,
+                            help='Only benchmark this path (repeatable); sync_bills only runs when named')
+        parser.add_argument('--sync-batch', type=int, default=1000, help='Bills per sync_bills flush')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1')
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read baseline: {e}')
+
+        report = BenchmarkRunner(
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            seed=options['seed'],
+            paths=options['paths'],
+            sync_batch=options['sync_batch'],
+        ).run()
+        if baseline:
+            report['compared_to'] = baseline.get('commit')
+            report['changes'] = compare(baseline, report)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
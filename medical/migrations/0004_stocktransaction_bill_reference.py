@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0003_bill_billrefund_customer_bill_customer_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stocktransaction',
+            name='bill_reference',
+            field=models.CharField(blank=True, db_index=True, max_length=50),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0004_stocktransaction_bill_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('last_number', models.PositiveIntegerField(default=0, help_text='Highest bill number handed out for this day')),
+            ],
+            options={
+                'ordering': ['-date'],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0005_billnumbersequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['created_at', 'id'], name='medical_cus_created_8a4af2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['created_at', 'id'], name='medical_med_created_27c122_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffprofile',
+            index=models.Index(fields=['created_at', 'id'], name='medical_sta_created_85c6c2_idx'),
+        ),
+    ]
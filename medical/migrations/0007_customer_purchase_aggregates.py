@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='completed_bills',
+            field=models.PositiveIntegerField(default=0, help_text='Number of completed bills'),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='last_purchase_at',
+            field=models.DateTimeField(blank=True, help_text='Date of the latest completed bill', null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_spend',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Total of completed bills less refunds', max_digits=12),
+        ),
+    ]
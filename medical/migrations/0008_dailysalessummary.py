@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0007_customer_purchase_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_method', models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('upi', 'UPI'), ('cheque', 'Cheque'), ('credit', 'Credit'), ('other', 'Other')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('refunded', 'Refunded')], max_length=20)),
+                ('bill_count', models.IntegerField(default=0)),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('discount_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tax_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('items_sold', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Daily sales summaries',
+                'ordering': ['-date'],
+                'unique_together': {('date', 'payment_method', 'status')},
+            },
+        ),
+    ]
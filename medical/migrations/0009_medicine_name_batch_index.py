@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0008_dailysalessummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['name', 'batch_number'], name='medical_med_name_97ca35_idx'),
+        ),
+    ]
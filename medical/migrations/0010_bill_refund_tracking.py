@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0009_medicine_name_batch_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='refunded_amount',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Total of refunds issued against this bill', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='refunded_quantity',
+            field=models.PositiveIntegerField(default=0, help_text='Units of this line refunded so far'),
+        ),
+    ]
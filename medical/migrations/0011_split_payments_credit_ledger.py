@@ -0,0 +1,34 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:47
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0010_bill_refund_tracking'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bill',
+            name='payment_method',
+            field=models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('upi', 'UPI'), ('cheque', 'Cheque'), ('credit', 'Credit'), ('other', 'Other'), ('split', 'Split')], db_index=True, default='cash', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dailysalessummary',
+            name='payment_method',
+            field=models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('upi', 'UPI'), ('cheque', 'Cheque'), ('credit', 'Credit'), ('other', 'Other'), ('split', 'Split')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='paymenttransaction',
+            name='payment_method',
+            field=models.CharField(choices=[('cash', 'Cash'), ('card', 'Card'), ('upi', 'UPI'), ('cheque', 'Cheque'), ('credit', 'Credit'), ('other', 'Other'), ('split', 'Split')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['status', 'amount_due'], name='medical_bil_status_dc5fc1_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0011_split_payments_credit_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicine',
+            index=models.Index(fields=['name', 'expiry_date'], name='medical_med_name_93eafa_idx'),
+        ),
+    ]
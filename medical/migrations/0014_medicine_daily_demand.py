@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0013_medicine_expiry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MedicineDailyDemand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units_sold', models.IntegerField(default=0)),
+                ('units_returned', models.IntegerField(default=0)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_demand', to='medical.medicine')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date'], name='medical_med_date_defd68_idx')],
+                'unique_together': {('medicine', 'date')},
+            },
+        ),
+    ]
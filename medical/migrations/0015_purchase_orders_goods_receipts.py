@@ -0,0 +1,88 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:03
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0014_medicine_daily_demand'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodsReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('supplier_name', models.CharField(max_length=200)),
+                ('invoice_number', models.CharField(blank=True, help_text="Supplier's invoice or delivery note number", max_length=100)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('notes', models.TextField(blank=True)),
+                ('received_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('received_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-received_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='GoodsReceiptItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('unit_cost', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('total_cost', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='medical.medicine')),
+                ('receipt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='medical.goodsreceipt')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PurchaseOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('supplier_name', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('ordered', 'Ordered'), ('partially_received', 'Partially Received'), ('received', 'Received'), ('cancelled', 'Cancelled')], default='ordered', max_length=20)),
+                ('notes', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='goodsreceipt',
+            name='purchase_order',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='receipts', to='medical.purchaseorder'),
+        ),
+        migrations.CreateModel(
+            name='PurchaseOrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity_ordered', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('quantity_received', models.PositiveIntegerField(default=0)),
+                ('unit_cost', models.DecimalField(decimal_places=2, help_text='Agreed cost per unit', max_digits=10, validators=[django.core.validators.MinValueValidator(0)])),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='medical.medicine')),
+                ('purchase_order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='medical.purchaseorder')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['status', 'created_at'], name='medical_pur_status_62ca28_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='purchaseorderitem',
+            unique_together={('purchase_order', 'medicine')},
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0015_purchase_orders_goods_receipts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.BigIntegerField(help_text='Highest StockTransaction id included')),
+                ('taken_at', models.DateTimeField(auto_now_add=True)),
+                ('discrepancies', models.PositiveIntegerField(default=0, help_text='Medicines whose stock disagreed with the ledger')),
+            ],
+            options={
+                'ordering': ['-last_transaction_id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField()),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='medical.stockcheckpoint')),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='medical.medicine')),
+            ],
+            options={
+                'unique_together': {('checkpoint', 'medicine')},
+            },
+        ),
+    ]
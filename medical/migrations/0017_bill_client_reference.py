@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0016_stock_checkpoints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='client_reference',
+            field=models.CharField(blank=True, editable=False, help_text='Idempotency key from the counter that queued this bill offline', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0017_bill_client_reference'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicineBarcode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(help_text='As normalized by barcodes.normalize_code', max_length=64, unique=True)),
+                ('name', models.CharField(help_text='Product the code identifies: every Medicine lot with this name', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name', 'code'],
+            },
+        ),
+    ]
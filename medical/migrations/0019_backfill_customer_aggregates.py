@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:05
+
+from django.db import migrations
+
+
+def backfill_customer_aggregates(apps, schema_editor):
+    """Fill the purchase aggregates added in 0007 from the bills already on file"""
+    from medical.services import recompute_customer_stats
+
+    recompute_customer_stats(
+        bill_model=apps.get_model('medical', 'Bill'),
+        customer_model=apps.get_model('medical', 'Customer'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0018_medicinebarcode'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_customer_aggregates, migrations.RunPython.noop),
+    ]
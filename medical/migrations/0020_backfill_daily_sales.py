@@ -0,0 +1,25 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:20
+
+from django.db import migrations
+
+
+def backfill_daily_sales(apps, schema_editor):
+    """Build the rollup added in 0008 from the bills already on file"""
+    from medical.services import rebuild_daily_sales
+
+    rebuild_daily_sales(
+        bill_model=apps.get_model('medical', 'Bill'),
+        item_model=apps.get_model('medical', 'BillItem'),
+        summary_model=apps.get_model('medical', 'DailySalesSummary'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical', '0019_backfill_customer_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
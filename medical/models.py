@@ -1,5 +1,8 @@
+from datetime import timedelta
+from decimal import Decimal
+
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 # Create your models here.
 from django.db import models
 from django.contrib.auth.models import User
@@ -8,6 +11,71 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 
 
 
+# A lot counts as expired from its expiry date on: that day it can no
+# longer be sold, shows as expired and is written off. Every expiry check
+# goes through these helpers so the rule can't drift between screens.
+
+def is_past_expiry(expiry_date, today=None):
+    return expiry_date <= (today or timezone.now().date())
+
+
+def expired_q(today=None):
+    return models.Q(expiry_date__lte=today or timezone.now().date())
+
+
+def unexpired_q(today=None):
+    return models.Q(expiry_date__gt=today or timezone.now().date())
+
+
+def sellable_q(today=None):
+    """In stock and not expired"""
+    return models.Q(quantity__gt=0) & unexpired_q(today)
+
+
+class MedicineQuerySet(models.QuerySet):
+    """Stock classification done in the database instead of per instance"""
+    
+    def expired(self):
+        return self.filter(expired_q())
+    
+    def not_expired(self):
+        return self.filter(unexpired_q())
+    
+    def sellable(self):
+        return self.filter(sellable_q())
+    
+    def expiring_within(self, days):
+        """Not yet expired, but expiring in the next `days` days"""
+        today = timezone.now().date()
+        return self.filter(unexpired_q(today), expiry_date__lte=today + timedelta(days=days))
+    
+    def low_stock(self):
+        return self.filter(quantity__lte=models.F('reorder_level'))
+    
+    def out_of_stock(self):
+        return self.filter(quantity=0)
+    
+    def with_stock_status(self):
+        """Annotate `stock_status` using the same rules as Medicine.stock_status"""
+        return self.annotate(stock_status=models.Case(
+            models.When(expired_q(), then=models.Value('expired')),
+            models.When(quantity=0, then=models.Value('out_of_stock')),
+            models.When(quantity__lte=models.F('reorder_level'), then=models.Value('low_stock')),
+            default=models.Value('in_stock'),
+            output_field=models.CharField(),
+        ))
+    
+    def stock_counts(self, **extra):
+        """Total, low stock, expired and out of stock counts (plus any `extra` aggregates) in one query"""
+        return self.aggregate(
+            total_medicines=models.Count('pk'),
+            low_stock_count=models.Count('pk', filter=models.Q(quantity__lte=models.F('reorder_level'))),
+            expired_count=models.Count('pk', filter=expired_q()),
+            out_of_stock=models.Count('pk', filter=models.Q(quantity=0)),
+            **extra,
+        )
+
+
 class Medicine(models.Model):
     CATEGORY_CHOICES = [
         ('tablet', 'Tablet'),
@@ -45,22 +113,84 @@ class Medicine(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     
+    objects = MedicineQuerySet.as_manager()
+    
+    # What the search index (medical.search) holds for a lot besides its id:
+    # the text it matches, then the rest of what the typeahead shows
+    SEARCH_FIELDS = (
+        'name', 'generic_name', 'batch_number', 'expiry_date', 'category', 'manufacturer', 'selling_price',
+    )
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['name', 'batch_number']),
+            # A product's lots share its name; FEFO allocation walks them by expiry
+            models.Index(fields=['name', 'expiry_date']),
+            # Expiry alerts and write-offs scan by date across all products
+            models.Index(fields=['expiry_date']),
+        ]
         
     def __str__(self):
         return f"{self.name} ({self.generic_name})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_search_fields()
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._remember_search_fields()
+    
+    def _search_values(self):
+        """Loaded search field values, as their fields store them"""
+        return {
+            field: self._meta.get_field(field).to_python(self.__dict__[field])
+            for field in self.SEARCH_FIELDS if field in self.__dict__
+        }
+    
+    def _remember_search_fields(self):
+        self._saved_search_values = self._search_values()
+    
+    def search_fields_changed(self):
+        """
+        Whether the last save changed what the search index holds.
+
+        Compares against the values loaded or last saved (read from the
+        post_save signal, before save() records the new ones); a lot that
+        wasn't loaded from the database always counts as changed. Values
+        are compared as their fields would store them, so a form's date
+        string matches the date it came from.
+        """
+        saved = getattr(self, '_saved_search_values', None)
+        if saved is None:
+            return True
+        # Deferred fields that were never set aren't written, so aren't compared
+        return any(field not in saved or saved[field] != value for field, value in self._search_values().items())
+    
+    def renamed_from(self):
+        """The name before the last save, when that save changed it (read from post_save)"""
+        saved = getattr(self, '_saved_search_values', {})
+        if 'name' in saved and 'name' in self.__dict__ and saved['name'] != self.name:
+            return saved['name']
+        return None
+    
     @property
     def is_low_stock(self):
         return self.quantity <= self.reorder_level
     
     @property
     def is_expired(self):
-        return self.expiry_date < timezone.now().date()
+        return is_past_expiry(self.expiry_date)
     
     @property
     def stock_status(self):
+        # Set by MedicineQuerySet.with_stock_status()
+        if '_stock_status' in self.__dict__:
+            return self._stock_status
         if self.is_expired:
             return 'expired'
         elif self.quantity == 0:
@@ -68,6 +198,28 @@ class Medicine(models.Model):
         elif self.is_low_stock:
             return 'low_stock'
         return 'in_stock'
+    
+    @stock_status.setter
+    def stock_status(self, value):
+        self._stock_status = value
+
+
+class MedicineBarcode(models.Model):
+    """A barcode (usually a GTIN) printed on a product; a product can carry several"""
+    code = models.CharField(max_length=64, unique=True, help_text="As normalized by barcodes.normalize_code")
+    name = models.CharField(max_length=200, help_text="Product the code identifies: every Medicine lot with this name")
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name', 'code']
+    
+    def __str__(self):
+        return f"{self.code} - {self.name}"
+    
+    def save(self, *args, **kwargs):
+        from .barcodes import normalize_code
+        self.code = normalize_code(self.code)
+        super().save(*args, **kwargs)
 
 
 class StockTransaction(models.Model):
@@ -87,6 +239,7 @@ class StockTransaction(models.Model):
     
     transaction_date = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(blank=True)
+    bill_reference = models.CharField(max_length=50, blank=True, db_index=True)
     performed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     
     class Meta:
@@ -118,6 +271,12 @@ class Customer(models.Model):
     doctor_name = models.CharField(max_length=200, blank=True, help_text="Prescribing doctor's name")
     prescription_number = models.CharField(max_length=100, blank=True, help_text="Prescription reference number")
     
+    # Purchase aggregates, maintained by the bill posting/cancellation/refund services only;
+    # bills changed any other way leave them stale until `manage.py recompute_customer_stats`
+    completed_bills = models.PositiveIntegerField(default=0, help_text="Number of completed bills")
+    lifetime_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text="Total of completed bills less refunds")
+    last_purchase_at = models.DateTimeField(null=True, blank=True, help_text="Date of the latest completed bill")
+    
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -128,6 +287,7 @@ class Customer(models.Model):
         indexes = [
             models.Index(fields=['phone']),
             models.Index(fields=['name']),
+            models.Index(fields=['created_at', 'id']),
         ]
         unique_together = [['phone', 'name']]  # Prevent duplicate customers
     
@@ -137,22 +297,17 @@ class Customer(models.Model):
     @property
     def total_purchases(self):
         """Get total number of purchases"""
-        return self.bills.filter(status='completed').count()
+        return self.completed_bills
     
     @property
     def total_spent(self):
         """Get total amount spent"""
-        from django.db.models import Sum
-        total = self.bills.filter(status='completed').aggregate(
-            total=Sum('total_amount')
-        )['total']
-        return total or Decimal('0.00')
+        return self.lifetime_spend
     
     @property
     def last_purchase_date(self):
         """Get date of last purchase"""
-        last_bill = self.bills.filter(status='completed').order_by('-created_at').first()
-        return last_bill.created_at if last_bill else None
+        return self.last_purchase_at
 
 
 # ============================================================================
@@ -169,6 +324,7 @@ class Bill(models.Model):
         ('cheque', 'Cheque'),
         ('credit', 'Credit'),
         ('other', 'Other'),
+        ('split', 'Split'),
     ]
     
     STATUS_CHOICES = [
@@ -257,6 +413,12 @@ class Bill(models.Model):
         default=0,
         help_text="Remaining amount (can be negative for change)"
     )
+    refunded_amount = models.DecimalField(
+        max_digits=10, 
+        decimal_places=2, 
+        default=0,
+        help_text="Total of refunds issued against this bill"
+    )
     
     # Bill status and notes
     status = models.CharField(
@@ -266,6 +428,14 @@ class Bill(models.Model):
         db_index=True
     )
     notes = models.TextField(blank=True, help_text="Additional notes or comments")
+    client_reference = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Idempotency key from the counter that queued this bill offline"
+    )
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
@@ -284,6 +454,8 @@ class Bill(models.Model):
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['payment_method', 'created_at']),
             models.Index(fields=['customer', 'created_at']),
+            # Credit ledger: outstanding balances (amount_due > 0)
+            models.Index(fields=['status', 'amount_due']),
         ]
         
     def __str__(self):
@@ -301,24 +473,9 @@ class Bill(models.Model):
     
     def generate_bill_number(self):
         """Generate unique bill number: BILL-YYYYMMDD-XXXX"""
-        from django.db.models import Max
-        
-        today = timezone.now().date()
-        date_str = today.strftime('%Y%m%d')
-        prefix = f'BILL-{date_str}'
-        
-        # Get last bill number for today
-        last_bill = Bill.objects.filter(
-            bill_number__startswith=prefix
-        ).aggregate(Max('bill_number'))
+        from .numbering import bill_number_allocator
         
-        if last_bill['bill_number__max']:
-            last_number = int(last_bill['bill_number__max'].split('-')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-        
-        return f'{prefix}-{new_number:04d}'
+        return bill_number_allocator.allocate()
     
     def calculate_amounts(self):
         """Calculate discount, tax, and total amounts"""
@@ -390,6 +547,7 @@ class BillItem(models.Model):
     
     # Quantity and pricing
     quantity = models.IntegerField(validators=[MinValueValidator(1)], help_text="Quantity sold")
+    refunded_quantity = models.PositiveIntegerField(default=0, help_text="Units of this line refunded so far")
     unit_price = models.DecimalField(
         max_digits=10, 
         decimal_places=2,
@@ -431,25 +589,33 @@ class BillItem(models.Model):
         # Check if this is a new item (not being updated)
         is_new = self.pk is None
         
-        super().save(*args, **kwargs)
-        
-        # Only update stock and create transaction for new items
-        if is_new and self.medicine:
-            # Update medicine stock
-            self.medicine.quantity -= self.quantity
-            self.medicine.save()
+        with transaction.atomic():
+            if is_new and self.medicine:
+                # Conditional UPDATE rather than a read-modify-write on a
+                # possibly stale instance, so concurrent sales can't oversell
+                from .inventory import take_stock
+                take_stock({self.medicine_id: self.quantity})
+                self.medicine.refresh_from_db(fields=['quantity'])
             
-            # Create stock transaction
-            StockTransaction.objects.create(
-                medicine=self.medicine,
-                transaction_type='sale',
-                quantity=self.quantity,
-                price_per_unit=self.unit_price,
-                total_amount=self.total_price,
-                notes=f'Bill: {self.bill.bill_number}',
-                bill_reference=self.bill.bill_number,
-                performed_by=self.bill.created_by
-            )
+            super().save(*args, **kwargs)
+            
+            # Only create a stock transaction for new items
+            if is_new and self.medicine:
+                StockTransaction.objects.create(
+                    medicine=self.medicine,
+                    transaction_type='sale',
+                    quantity=self.quantity,
+                    price_per_unit=self.unit_price,
+                    total_amount=self.total_price,
+                    notes=f'Bill: {self.bill.bill_number}',
+                    bill_reference=self.bill.bill_number,
+                    performed_by=self.bill.created_by
+                )
+    
+    @property
+    def refundable_quantity(self):
+        """Units of this line that can still be refunded"""
+        return self.quantity - self.refunded_quantity
     
     @property
     def profit(self):
@@ -494,7 +660,189 @@ class BillRefund(models.Model):
     
     def __str__(self):
         return f"Refund for {self.original_bill.bill_number} - ₹{self.refund_amount}"
+
+
+class DailySalesSummary(models.Model):
+    """Per day, payment method and status bill totals, maintained as bills are posted/cancelled"""
+    date = models.DateField()
+    payment_method = models.CharField(max_length=20, choices=Bill.PAYMENT_METHODS)
+    status = models.CharField(max_length=20, choices=Bill.STATUS_CHOICES)
+    
+    bill_count = models.IntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    discount_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    items_sold = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = [['date', 'payment_method', 'status']]
+        verbose_name_plural = 'Daily sales summaries'
+    
+    def __str__(self):
+        return f"{self.date} - {self.payment_method} - {self.status}: ₹{self.total_amount}"
+
+
+class MedicineDailyDemand(models.Model):
+    """Units sold and returned through bills per medicine per day, rolled up from the stock ledger"""
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='daily_demand')
+    date = models.DateField()
+    units_sold = models.IntegerField(default=0)
+    units_returned = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        unique_together = [['medicine', 'date']]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.medicine_id} - {self.date}: {self.units_sold} sold, {self.units_returned} returned"
+
+
+class DemandRollupState(models.Model):
+    """High-water mark of the stock ledger rows already in MedicineDailyDemand (single row)"""
+    last_transaction_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Demand rollup up to transaction {self.last_transaction_id}"
+
+
+class StockCheckpoint(models.Model):
+    """Stock ledger position at which every medicine's ledger quantity was snapshotted"""
+    last_transaction_id = models.BigIntegerField(help_text="Highest StockTransaction id included")
+    taken_at = models.DateTimeField(auto_now_add=True)
+    discrepancies = models.PositiveIntegerField(default=0, help_text="Medicines whose stock disagreed with the ledger")
+
+    class Meta:
+        ordering = ['-last_transaction_id']
+
+    def __str__(self):
+        return f"Checkpoint at transaction {self.last_transaction_id}"
+
+
+class StockSnapshot(models.Model):
+    """A medicine's quantity according to the ledger as of a checkpoint (zero quantities are not stored)"""
+    checkpoint = models.ForeignKey(StockCheckpoint, on_delete=models.CASCADE, related_name='snapshots')
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField()
+
+    class Meta:
+        unique_together = [['checkpoint', 'medicine']]
+
+    def __str__(self):
+        return f"{self.medicine_id} @ {self.checkpoint_id}: {self.quantity}"
+
+
+class BillNumberSequence(models.Model):
+    """Per-day counter backing bill number allocation"""
+    date = models.DateField(unique=True)
+    last_number = models.PositiveIntegerField(default=0, help_text="Highest bill number handed out for this day")
     
+    class Meta:
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.date} - {self.last_number}"
+
+
+# ============================================================================
+# PURCHASING MODELS
+# ============================================================================
+
+class PurchaseOrder(models.Model):
+    """Stock ordered from a supplier, received through one or more goods receipts"""
+    STATUS_CHOICES = [
+        ('ordered', 'Ordered'),
+        ('partially_received', 'Partially Received'),
+        ('received', 'Received'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    supplier_name = models.CharField(max_length=200)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ordered')
+    notes = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.number} - {self.supplier_name}"
+
+    @property
+    def number(self):
+        return f"PO-{self.pk:06d}"
+
+
+class PurchaseOrderItem(models.Model):
+    """One medicine on a purchase order"""
+    purchase_order = models.ForeignKey(PurchaseOrder, on_delete=models.CASCADE, related_name='items')
+    medicine = models.ForeignKey(Medicine, on_delete=models.PROTECT)
+    quantity_ordered = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    quantity_received = models.PositiveIntegerField(default=0)
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)],
+                                    help_text="Agreed cost per unit")
+
+    class Meta:
+        ordering = ['id']
+        unique_together = [['purchase_order', 'medicine']]
+
+    def __str__(self):
+        return f"{self.medicine_id} × {self.quantity_ordered}"
+
+    @property
+    def quantity_pending(self):
+        return self.quantity_ordered - self.quantity_received
+
+
+class GoodsReceipt(models.Model):
+    """A supplier delivery taken into stock"""
+    purchase_order = models.ForeignKey(
+        PurchaseOrder, on_delete=models.SET_NULL, null=True, blank=True, related_name='receipts'
+    )
+    supplier_name = models.CharField(max_length=200)
+    invoice_number = models.CharField(max_length=100, blank=True, help_text="Supplier's invoice or delivery note number")
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    notes = models.TextField(blank=True)
+
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    received_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+
+    class Meta:
+        ordering = ['-received_at']
+
+    def __str__(self):
+        return f"{self.number} - {self.supplier_name}"
+
+    @property
+    def number(self):
+        return f"GRN-{self.pk:06d}"
+
+
+class GoodsReceiptItem(models.Model):
+    """Units of one medicine lot received on a goods receipt"""
+    receipt = models.ForeignKey(GoodsReceipt, on_delete=models.CASCADE, related_name='items')
+    medicine = models.ForeignKey(Medicine, on_delete=models.PROTECT)
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.medicine_id} × {self.quantity} @ ₹{self.unit_cost}"
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -562,6 +910,9 @@ class StaffProfile(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
         
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.employee_id}"
@@ -0,0 +1,101 @@
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(obj):
+    """Opaque cursor for a row's (created_at, id) position"""
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (created_at, id) for a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+class KeysetPage:
+    """One page of rows, newest first, with cursors to the neighbouring pages"""
+
+    def __init__(self, object_list, has_next, has_previous, params):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self._params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
+
+    def _querystring(self, key, cursor):
+        params = self._params.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[key] = cursor
+        return params.urlencode()
+
+    @property
+    def next_querystring(self):
+        return self._querystring('after', self.next_cursor)
+
+    @property
+    def previous_querystring(self):
+        return self._querystring('before', self.previous_cursor)
+
+
+def paginate_keyset(request, queryset, per_page=PAGE_SIZE):
+    """
+    Seek-paginate `queryset` on (created_at, id), newest first.
+
+    The `after`/`before` GET parameters carry the cursor of the last/first
+    row of the page the user came from. Each page is a range scan on the
+    created_at index, so deep pages cost the same as the first one.
+    """
+    after = decode_cursor(request.GET.get('after'))
+    before = decode_cursor(request.GET.get('before'))
+    queryset = queryset.order_by('-created_at', '-id')
+
+    if before:
+        created_at, pk = before
+        rows = list(queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+        ).reverse()[:per_page + 1])
+        has_previous = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_next = True
+    else:
+        if after:
+            created_at, pk = after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+        rows = list(queryset[:per_page + 1])
+        has_next = len(rows) > per_page
+        rows = rows[:per_page]
+        has_previous = after is not None
+
+    return KeysetPage(rows, has_next, has_previous, request.GET.copy())
@@ -0,0 +1,201 @@
+import functools
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template.backends.django import Template as DjangoTemplate
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# `IN (%s, %s, ...)` lists vary in length with the data; collapse them so
+# the same query over different rows has one shape
+_PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+
+_current_profile = ContextVar('medical_request_profile', default=None)
+
+
+def profiling_enabled():
+    return getattr(settings, 'PROFILING_ENABLED', False)
+
+
+def sql_shape(sql):
+    """SQL with its IN lists collapsed, so repeats of one query compare equal"""
+    return _PLACEHOLDER_LIST.sub('(...)', sql)
+
+
+class RequestProfile:
+    """
+    SQL and template timings for one request.
+
+    Installed as a database execute wrapper, so it sees every query the
+    request runs on the default connection, with its parameters already
+    separated from the SQL.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated_queries(self, threshold):
+        """(shape, count) of query shapes run at least `threshold` times: likely N+1 loops"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def server_timing(self, total):
+        """Server-Timing header value, durations in milliseconds"""
+        return (
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries", '
+            f'tpl;dur={self.template_time * 1000:.1f}, '
+            f'total;dur={total * 1000:.1f}'
+        )
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, *args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile.template_time += time.perf_counter() - start
+    wrapper.profiled = True
+    return wrapper
+
+
+def install_template_timer():
+    """Time Django template rendering for the request being profiled (idempotent)"""
+    if not getattr(DjangoTemplate.render, 'profiled', False):
+        DjangoTemplate.render = _timed_render(DjangoTemplate.render)
+
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class ViewMetrics:
+    """Per-process counters per (view, method), rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, method, profile, duration, repeated):
+        with self._lock:
+            stats = self._views.setdefault((view, method), {
+                'requests': 0, 'duration': 0.0, 'buckets': [0] * len(DURATION_BUCKETS),
+                'queries': 0, 'db': 0.0, 'template': 0.0, 'n_plus_one': 0,
+            })
+            stats['requests'] += 1
+            stats['duration'] += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats['buckets'][i] += 1
+            stats['queries'] += profile.queries
+            stats['db'] += profile.db_time
+            stats['template'] += profile.template_time
+            stats['n_plus_one'] += len(repeated)
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def render(self):
+        with self._lock:
+            views = {key: dict(stats, buckets=list(stats['buckets'])) for key, stats in self._views.items()}
+
+        counters = [
+            ('medical_view_requests_total', 'requests', 'Requests handled'),
+            ('medical_view_queries_total', 'queries', 'SQL queries run'),
+            ('medical_view_db_seconds_total', 'db', 'Time spent in SQL queries'),
+            ('medical_view_template_seconds_total', 'template', 'Time spent rendering templates'),
+            ('medical_view_n_plus_one_total', 'n_plus_one', 'Query shapes repeated past the N+1 threshold'),
+        ]
+        lines = []
+        for name, field, help_text in counters:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for (view, method), stats in sorted(views.items()):
+                lines.append(f'{name}{{view="{_label(view)}",method="{method}"}} {stats[field]}')
+
+        name = 'medical_view_duration_seconds'
+        lines += [f'# HELP {name} Request duration', f'# TYPE {name} histogram']
+        for (view, method), stats in sorted(views.items()):
+            labels = f'view="{_label(view)}",method="{method}"'
+            for bound, count in zip(DURATION_BUCKETS, stats['buckets']):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {stats["requests"]}')
+            lines.append(f'{name}_sum{{{labels}}} {stats["duration"]}')
+            lines.append(f'{name}_count{{{labels}}} {stats["requests"]}')
+        return '\n'.join(lines) + '\n'
+
+
+view_metrics = ViewMetrics()
+
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+
+class ProfilingMiddleware:
+    """
+    Per-view query count, DB time, template time and total time.
+
+    Opt-in with PROFILING_ENABLED; when it is off the middleware removes
+    itself at startup (MiddlewareNotUsed), so requests pay nothing. When on,
+    every response gets a Server-Timing header, totals are exposed at the
+    metrics endpoint, and query shapes repeated PROFILING_N_PLUS_ONE_THRESHOLD
+    times in one request are logged as likely N+1 loops. Streamed response
+    bodies (exports) run after the middleware returns and aren't counted.
+    """
+
+    def __init__(self, get_response):
+        if not profiling_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'PROFILING_N_PLUS_ONE_THRESHOLD', 5)
+        install_template_timer()
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        duration = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        repeated = profile.repeated_queries(self.threshold)
+        for shape, count in repeated:
+            logger.warning('Possible N+1 in %s: %d x %s', view, count, shape)
+
+        view_metrics.observe(view, request.method, profile, duration, repeated)
+        response['Server-Timing'] = profile.server_timing(duration)
+        return response
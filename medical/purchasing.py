@@ -0,0 +1,193 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, When
+
+from .inventory import receive_stock
+from .models import (
+    GoodsReceipt, GoodsReceiptItem, Medicine, PurchaseOrder, PurchaseOrderItem, StockTransaction,
+)
+
+CENT = Decimal('0.01')
+
+
+# ============================================================================
+# VALIDATION
+# ============================================================================
+
+def clean_lines(lines):
+    """
+    Validate order/receipt lines into {medicine_id: (quantity, total cost)}.
+
+    A medicine listed on several lines is merged into one, its cost summed,
+    so the weighted average below sees the whole delivery.
+    """
+    merged = {}
+    for line in lines or []:
+        try:
+            medicine_id = int(line['medicine_id'])
+            quantity = int(line['quantity'])
+            unit_cost = Decimal(str(line['unit_cost'])).quantize(CENT)
+        except KeyError as e:
+            raise ValueError(f'Each line needs medicine_id, quantity and unit_cost (missing {e})')
+        except (InvalidOperation, TypeError, ValueError):
+            raise ValueError('Line quantities must be whole numbers and costs numbers')
+        if quantity <= 0:
+            raise ValueError('Line quantities must be positive')
+        if unit_cost < 0:
+            raise ValueError('Unit costs cannot be negative')
+        quantity_so_far, cost_so_far = merged.get(medicine_id, (0, Decimal('0.00')))
+        merged[medicine_id] = (quantity_so_far + quantity, cost_so_far + quantity * unit_cost)
+    if not merged:
+        raise ValueError('No items given')
+    return merged
+
+
+def _unit_cost(quantity, cost):
+    return (cost / quantity).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def weighted_unit_price(on_hand, unit_price, quantity, cost):
+    """Average cost per unit of the stock on hand plus `quantity` units costing `cost`"""
+    on_hand = max(on_hand, 0)
+    return ((on_hand * unit_price + cost) / (on_hand + quantity)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+# ============================================================================
+# PURCHASE ORDERS
+# ============================================================================
+
+def create_purchase_order(supplier_name, lines, created_by=None, notes=''):
+    """Record a purchase order for existing medicine lots; returns the PurchaseOrder"""
+    if not supplier_name:
+        raise ValueError('Supplier name is required')
+    lines = clean_lines(lines)
+
+    missing = set(lines) - set(Medicine.objects.filter(pk__in=list(lines)).values_list('pk', flat=True))
+    if missing:
+        raise Medicine.DoesNotExist(f'Medicine not found: {sorted(missing)}')
+
+    with transaction.atomic():
+        order = PurchaseOrder.objects.create(
+            supplier_name=supplier_name[:200], notes=notes, created_by=created_by,
+        )
+        PurchaseOrderItem.objects.bulk_create([
+            PurchaseOrderItem(
+                purchase_order=order,
+                medicine_id=medicine_id,
+                quantity_ordered=quantity,
+                unit_cost=_unit_cost(quantity, cost),
+            )
+            for medicine_id, (quantity, cost) in lines.items()
+        ])
+    return order
+
+
+def _receive_against_order(order_id, lines):
+    """Book received quantities on a locked purchase order and move its status"""
+    order = PurchaseOrder.objects.select_for_update().get(pk=order_id)
+    if order.status not in ('ordered', 'partially_received'):
+        raise ValueError(f'Purchase order {order.number} is {order.get_status_display().lower()}')
+
+    items = {item.medicine_id: item for item in order.items.all()}
+    for medicine_id, (quantity, _) in lines.items():
+        item = items.get(medicine_id)
+        if item is None:
+            raise ValueError(f'Medicine {medicine_id} is not on purchase order {order.number}')
+        if quantity > item.quantity_pending:
+            raise ValueError(
+                f'Only {item.quantity_pending} units of medicine {medicine_id} are still '
+                f'due on purchase order {order.number}'
+            )
+
+    PurchaseOrderItem.objects.filter(pk__in=[items[medicine_id].pk for medicine_id in lines]).update(
+        quantity_received=Case(
+            *[When(medicine_id=medicine_id, then=F('quantity_received') + quantity)
+              for medicine_id, (quantity, _) in lines.items()],
+            default=F('quantity_received'),
+            output_field=PositiveIntegerField(),
+        )
+    )
+    complete = all(
+        item.quantity_received + lines.get(medicine_id, (0, None))[0] >= item.quantity_ordered
+        for medicine_id, item in items.items()
+    )
+    order.status = 'received' if complete else 'partially_received'
+    order.save(update_fields=['status', 'updated_at'])
+    return order
+
+
+# ============================================================================
+# GOODS RECEIPT
+# ============================================================================
+
+def receive_goods(lines, received_by=None, purchase_order_id=None, supplier_name='',
+                  invoice_number='', notes=''):
+    """
+    Take a supplier delivery into stock in one transaction.
+
+    However many lines the receipt has, the work is a fixed number of
+    statements: one locking read of the lots, one UPDATE adding the units
+    and setting each lot's unit_price (cost) to the weighted average of the
+    stock on hand and the delivery, and bulk inserts of the receipt lines
+    and their `purchase` stock transactions. Against a purchase order the
+    received quantities are booked on it too, and over-delivery is refused.
+    Lines must name existing lots; new batches are added through
+    add_medicine or the medicine import. Returns the GoodsReceipt.
+    """
+    lines = clean_lines(lines)
+
+    with transaction.atomic():
+        order = None
+        if purchase_order_id is not None:
+            order = _receive_against_order(purchase_order_id, lines)
+            supplier_name = supplier_name or order.supplier_name
+        if not supplier_name:
+            raise ValueError('Supplier name is required')
+
+        medicines = Medicine.objects.select_for_update().in_bulk(list(lines))
+        missing = set(lines) - set(medicines)
+        if missing:
+            raise Medicine.DoesNotExist(f'Medicine not found: {sorted(missing)}')
+
+        quantities, unit_prices = {}, {}
+        for medicine_id, (quantity, cost) in lines.items():
+            medicine = medicines[medicine_id]
+            quantities[medicine_id] = quantity
+            unit_prices[medicine_id] = weighted_unit_price(
+                medicine.quantity, medicine.unit_price, quantity, cost
+            )
+        receive_stock(quantities, unit_prices)
+
+        receipt = GoodsReceipt.objects.create(
+            purchase_order=order,
+            supplier_name=supplier_name[:200],
+            invoice_number=invoice_number[:100],
+            total_amount=sum(cost for _, cost in lines.values()),
+            notes=notes,
+            received_by=received_by,
+        )
+        GoodsReceiptItem.objects.bulk_create([
+            GoodsReceiptItem(
+                receipt=receipt,
+                medicine_id=medicine_id,
+                quantity=quantity,
+                unit_cost=_unit_cost(quantity, cost),
+                total_cost=cost,
+            )
+            for medicine_id, (quantity, cost) in lines.items()
+        ])
+        StockTransaction.objects.bulk_create([
+            StockTransaction(
+                medicine_id=medicine_id,
+                transaction_type='purchase',
+                quantity=quantity,
+                price_per_unit=_unit_cost(quantity, cost),
+                total_amount=cost,
+                bill_reference=receipt.number,
+                notes=f'Received on {receipt.number} from {receipt.supplier_name}',
+                performed_by=received_by,
+            )
+            for medicine_id, (quantity, cost) in lines.items()
+        ])
+    return receipt
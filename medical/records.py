@@ -0,0 +1,115 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+
+from .models import Medicine
+
+RECORDS_VERSION_KEY = 'medical:medicine-records-version'
+RECORD_KEY = 'medical:medicine-record:{}'
+ROW_VERSION_KEY = 'medical:medicine-record-version:{}'
+
+# Records are invalidated explicitly; the timeout only bounds how long one
+# could outlive an evicted version key
+RECORD_TIMEOUT = 60 * 60
+
+# Ids accepted by one multi-get
+MAX_RECORDS = 200
+
+
+def serialize(medicine):
+    """The billing screen's view of one medicine (what get_medicine_details returns)"""
+    return {
+        'id': medicine.id,
+        'name': medicine.name,
+        'generic_name': medicine.generic_name,
+        'batch_number': medicine.batch_number,
+        'category': medicine.get_category_display(),
+        'selling_price': str(medicine.selling_price),
+        'available_quantity': medicine.quantity,
+        'manufacturer': medicine.manufacturer,
+        'expiry_date': medicine.expiry_date.strftime('%Y-%m-%d'),
+        'rack_number': medicine.rack_number,
+    }
+
+
+def etag(data):
+    """Strong ETag for JSON-serializable data"""
+    digest = hashlib.md5(json.dumps(data, sort_keys=True).encode(), usedforsecurity=False)
+    return f'"{digest.hexdigest()}"'
+
+
+def invalidate(medicine_ids):
+    """Mark the listed medicines' cached records as stale (one cache write)"""
+    if medicine_ids:
+        # A fresh token rather than incr(), so a whole batch is one set_many
+        token = uuid.uuid4().hex
+        cache.set_many({ROW_VERSION_KEY.format(pk): token for pk in medicine_ids}, timeout=None)
+
+
+def invalidate_all():
+    """Mark every cached record as stale (after bulk writes that bypass the signals)"""
+    try:
+        cache.incr(RECORDS_VERSION_KEY)
+    except ValueError:
+        cache.set(RECORDS_VERSION_KEY, 1, timeout=None)
+
+
+def _keys(ids):
+    return [RECORDS_VERSION_KEY] + [
+        key for pk in ids for key in (RECORD_KEY.format(pk), ROW_VERSION_KEY.format(pk))
+    ]
+
+
+def _split(ids, cached):
+    """(records still current, ids to load, {id: version to tag fresh records with})"""
+    generation = cached.get(RECORDS_VERSION_KEY)
+    hits, misses, versions = {}, [], {}
+    for pk in ids:
+        version = (generation, cached.get(ROW_VERSION_KEY.format(pk)))
+        record = cached.get(RECORD_KEY.format(pk))
+        if record and record['version'] == version:
+            hits[pk] = record
+        else:
+            misses.append(pk)
+            versions[pk] = version
+    return hits, misses, versions
+
+
+def _fresh(medicines, versions):
+    return {
+        pk: {'version': versions[pk], 'etag': etag(data), 'data': data}
+        for pk, data in ((pk, serialize(medicine)) for pk, medicine in medicines.items())
+    }
+
+
+def get_records(ids):
+    """
+    {id: {'etag', 'data'}} for the listed medicines; unknown ids are left out.
+
+    A cart's worth of records comes from one get_many, which fetches each
+    record together with its row's version and the global version; a record
+    tagged with any other version is stale. Misses are loaded with one
+    in_bulk query and written back with one set_many. Versions are read
+    before the database, so a write committing in between leaves the record
+    tagged with the old version, and the next read reloads it.
+    """
+    ids = list(dict.fromkeys(ids))
+    hits, misses, versions = _split(ids, cache.get_many(_keys(ids)))
+    if misses:
+        fresh = _fresh(Medicine.objects.in_bulk(misses), versions)
+        cache.set_many({RECORD_KEY.format(pk): record for pk, record in fresh.items()}, timeout=RECORD_TIMEOUT)
+        hits.update(fresh)
+    return {pk: hits[pk] for pk in ids if pk in hits}
+
+
+async def aget_records(ids):
+    """get_records() for async views"""
+    ids = list(dict.fromkeys(ids))
+    hits, misses, versions = _split(ids, await cache.aget_many(_keys(ids)))
+    if misses:
+        fresh = _fresh(await Medicine.objects.ain_bulk(misses), versions)
+        await cache.aset_many({RECORD_KEY.format(pk): record for pk, record in fresh.items()}, timeout=RECORD_TIMEOUT)
+        hits.update(fresh)
+    return {pk: hits[pk] for pk in ids if pk in hits}
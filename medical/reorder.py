@@ -0,0 +1,189 @@
+import csv
+import math
+from datetime import timedelta
+from statistics import NormalDist, pstdev
+
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import DemandRollupState, Medicine, MedicineDailyDemand, StockTransaction
+
+# Ledger rows younger than this are left for the next run, so rows from
+# transactions still committing (ids are handed out before commit) aren't
+# skipped by the high-water mark
+SETTLE_LAG = timedelta(minutes=5)
+
+WINDOWS = (7, 30, 90)
+
+REPORT_COLUMNS = [
+    'product', 'on_hand', 'units_7d', 'units_30d', 'units_90d', 'daily_demand',
+    'reorder_point', 'suggested_quantity',
+]
+
+
+# ============================================================================
+# DAILY DEMAND ROLLUP
+# ============================================================================
+
+def _bill_movements():
+    """Ledger rows that are sales or returns of bills (not stock edits or imports)"""
+    return StockTransaction.objects.filter(
+        transaction_type__in=['sale', 'return']
+    ).exclude(bill_reference='')
+
+
+def _demand_totals(after_id, up_to_id):
+    """Units sold/returned per (medicine, day) for ledger ids in (after_id, up_to_id]"""
+    return _bill_movements().filter(pk__gt=after_id, pk__lte=up_to_id).order_by().annotate(
+        day=TruncDate('transaction_date')
+    ).values('medicine_id', 'day').annotate(
+        sold=Coalesce(Sum('quantity', filter=Q(transaction_type='sale')), 0),
+        returned=Coalesce(Sum('quantity', filter=Q(transaction_type='return')), 0),
+    )
+
+
+def _insert_demand(totals):
+    """Create a MedicineDailyDemand row per grouped total in an empty rollup"""
+    MedicineDailyDemand.objects.bulk_create(
+        [
+            MedicineDailyDemand(
+                medicine_id=row['medicine_id'], date=row['day'],
+                units_sold=row['sold'], units_returned=row['returned'],
+            )
+            for row in totals.iterator(chunk_size=5000)
+        ],
+        batch_size=1000,
+    )
+
+
+def _merge_demand(totals):
+    """Add grouped totals into existing MedicineDailyDemand rows, creating missing ones"""
+    totals = {(row['medicine_id'], row['day']): (row['sold'], row['returned']) for row in totals}
+    if not totals:
+        return
+    existing = {
+        (row.medicine_id, row.date): row
+        for row in MedicineDailyDemand.objects.filter(
+            medicine_id__in={medicine_id for medicine_id, _ in totals},
+            date__in={day for _, day in totals},
+        )
+    }
+    to_create, to_update = [], []
+    for (medicine_id, day), (sold, returned) in totals.items():
+        row = existing.get((medicine_id, day))
+        if row is None:
+            to_create.append(MedicineDailyDemand(
+                medicine_id=medicine_id, date=day, units_sold=sold, units_returned=returned,
+            ))
+        else:
+            row.units_sold += sold
+            row.units_returned += returned
+            to_update.append(row)
+    MedicineDailyDemand.objects.bulk_create(to_create, batch_size=1000)
+    MedicineDailyDemand.objects.bulk_update(to_update, ['units_sold', 'units_returned'], batch_size=1000)
+
+
+def refresh_daily_demand(settle_lag=SETTLE_LAG):
+    """
+    Fold ledger rows added since the last run into the daily demand rollup.
+
+    Only rows past the stored high-water mark are aggregated (one grouped
+    query on the primary key range), so a run costs the same with years of
+    history as with a week. The first run bulk-creates the rollup from the
+    same grouped query.
+    Returns the number of ledger rows folded in.
+    """
+    with transaction.atomic():
+        state, _ = DemandRollupState.objects.select_for_update().get_or_create(pk=1)
+        cutoff = timezone.now() - settle_lag
+        new_rows = StockTransaction.objects.filter(
+            pk__gt=state.last_transaction_id, transaction_date__lt=cutoff
+        )
+        high_water = new_rows.order_by('-pk').values_list('pk', flat=True).first()
+        if high_water is None:
+            return 0
+
+        totals = _demand_totals(state.last_transaction_id, high_water)
+        if state.last_transaction_id == 0:
+            MedicineDailyDemand.objects.all().delete()
+            _insert_demand(totals)
+        else:
+            _merge_demand(totals)
+
+        processed = new_rows.filter(pk__lte=high_water).count()
+        state.last_transaction_id = high_water
+        state.save()
+    return processed
+
+
+def rebuild_daily_demand(settle_lag=SETTLE_LAG):
+    """Recompute the rollup from the whole ledger, then continue incrementally"""
+    DemandRollupState.objects.update_or_create(pk=1, defaults={'last_transaction_id': 0})
+    return refresh_daily_demand(settle_lag)
+
+
+# ============================================================================
+# SUGGESTIONS
+# ============================================================================
+
+def reorder_suggestions(lead_time_days=7, review_days=14, service_level=0.95):
+    """
+    Reorder point and order quantity per product from recent sales velocity.
+
+    Demand comes from the daily rollup (net of returns), grouped by product
+    name across lots; on-hand stock counts sellable lots only. Daily demand
+    is the 30 day average and safety stock z * sigma * sqrt(lead time), with
+    sigma taken over the same 30 days. Returns one dict per product with any
+    demand in the last 90 days, those that need ordering first.
+    """
+    today = timezone.now().date()
+    net = F('units_sold') - F('units_returned')
+    recent = MedicineDailyDemand.objects.filter(date__gt=today - timedelta(days=max(WINDOWS)))
+
+    windows = recent.order_by().values('medicine__name').annotate(**{
+        f'units_{days}d': Sum(net, filter=Q(date__gt=today - timedelta(days=days)))
+        for days in WINDOWS
+    })
+
+    daily = {}
+    for name, day, units in recent.filter(date__gt=today - timedelta(days=30)).order_by().values_list(
+        'medicine__name', 'date'
+    ).annotate(units=Sum(net)):
+        daily.setdefault(name, []).append(units)
+
+    on_hand = dict(
+        Medicine.objects.sellable().order_by()
+        .values('name').annotate(units=Sum('quantity')).values_list('name', 'units')
+    )
+
+    z = NormalDist().inv_cdf(service_level)
+    suggestions = []
+    for row in windows:
+        name = row['medicine__name']
+        units_30d = row['units_30d'] or 0
+        series = daily.get(name, []) + [0] * (30 - len(daily.get(name, [])))
+        demand = max(units_30d, 0) / 30
+        safety = z * pstdev(series) * math.sqrt(lead_time_days)
+        reorder_point = math.ceil(demand * lead_time_days + safety)
+        stock = on_hand.get(name, 0)
+        order_up_to = reorder_point + math.ceil(demand * review_days)
+        suggestions.append({
+            'product': name,
+            'on_hand': stock,
+            **{f'units_{days}d': row[f'units_{days}d'] or 0 for days in WINDOWS},
+            'daily_demand': round(demand, 2),
+            'reorder_point': reorder_point,
+            'suggested_quantity': max(order_up_to - stock, 0) if stock <= reorder_point else 0,
+        })
+
+    suggestions.sort(key=lambda s: (-s['suggested_quantity'], s['product']))
+    return suggestions
+
+
+def write_report(suggestions, file_obj):
+    """Write suggestions as CSV"""
+    writer = csv.DictWriter(file_obj, fieldnames=REPORT_COLUMNS)
+    writer.writeheader()
+    writer.writerows(suggestions)
@@ -0,0 +1,254 @@
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Medicine, is_past_expiry, sellable_q
+
+INDEX_VERSION_KEY = 'medical:medicine-search-version'
+
+_EXPIRY = Medicine.SEARCH_FIELDS.index('expiry_date')
+
+# Ranked candidates checked against the database per round trip
+CANDIDATE_BATCH = 20
+
+
+def _words(text):
+    return text.lower().split()
+
+
+def _group_lots(names, products, stock, today):
+    """
+    (FEFO lot, units, lot count) per product name that has sellable stock.
+
+    `products` maps names to their indexed lots in FEFO order and `stock`
+    lot ids to their quantity. Only the FEFO lot is built as a Medicine,
+    from its indexed fields and current quantity.
+    """
+    grouped = []
+    for name in names:
+        lots = [(medicine_id, values) for medicine_id, values in products[name]
+                if medicine_id in stock and not is_past_expiry(values[_EXPIRY], today)]
+        if lots:
+            medicine_id, values = lots[0]
+            first = Medicine(id=medicine_id, quantity=stock[medicine_id], **dict(zip(Medicine.SEARCH_FIELDS, values)))
+            grouped.append((first, sum(stock[medicine_id] for medicine_id, _ in lots), len(lots)))
+    return grouped
+
+
+def _stock(products, names):
+    """(id, quantity) of the named products' lots in stock; expiry is checked against the index"""
+    ids = [medicine_id for name in names for medicine_id, _ in products[name]]
+    return Medicine.objects.filter(pk__in=ids, quantity__gt=0).order_by().values_list('id', 'quantity')
+
+
+class _PrefixTable:
+    """Sorted (key, medicine_id) pairs supporting prefix range scans"""
+
+    def __init__(self, pairs):
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.ids = [medicine_id for _, medicine_id in pairs]
+
+    def scan(self, prefix):
+        i = bisect_left(self.keys, prefix)
+        keys, ids = self.keys, self.ids
+        while i < len(keys) and keys[i].startswith(prefix):
+            yield ids[i]
+            i += 1
+
+
+class MedicineSearchIndex:
+    """
+    In-process prefix index for the billing screen's medicine typeahead.
+
+    Medicines are indexed by lowercased name, name words, generic name words
+    and batch number. Each is a sorted table, so a keystroke is a binary
+    search plus a short range scan instead of three `LIKE '%q%'` scans.
+    Tables are scanned in rank order (name prefix, name word, generic name,
+    batch number), so results come out ranked without sorting.
+
+    The index also holds each product's lots, in FEFO order, with the fields
+    the typeahead shows (Medicine.SEARCH_FIELDS), but not their stock: that
+    moves on every sale, so the top candidates are re-checked for stock with
+    one primary-key query. Changes to those fields bump a version number in
+    the Django cache (see medical.signals); stock-only saves don't. Every
+    process compares that number on each search and rebuilds when it is
+    stale, which keeps all workers consistent when the cache is shared
+    (e.g. Redis).
+    """
+
+    def __init__(self):
+        # (version, tables, rows, products), swapped in one assignment so concurrent
+        # searches never see a half-built index
+        self._snapshot = None
+
+    @staticmethod
+    def current_version():
+        return cache.get_or_set(INDEX_VERSION_KEY, 1, timeout=None)
+
+    @staticmethod
+    async def acurrent_version():
+        return await cache.aget_or_set(INDEX_VERSION_KEY, 1, timeout=None)
+
+    @staticmethod
+    def invalidate():
+        """Mark every process's index as stale"""
+        try:
+            cache.incr(INDEX_VERSION_KEY)
+        except ValueError:
+            cache.set(INDEX_VERSION_KEY, 1, timeout=None)
+
+    def build(self):
+        """(Re)build the index from the database"""
+        version = self.current_version()
+        full_names, name_words, generic_words, batches = [], [], [], []
+        rows, products = {}, {}
+
+        medicines = Medicine.objects.order_by().values_list('id', *Medicine.SEARCH_FIELDS)
+        for medicine_id, *values in medicines.iterator():
+            name, generic_name, batch_number, expiry_date = values[:4]
+            words = _words(name) + _words(generic_name)
+            full_names.append((' '.join(_words(name)), medicine_id))
+            name_words.extend((word, medicine_id) for word in _words(name)[1:])
+            generic_words.extend((word, medicine_id) for word in _words(generic_name))
+            batches.append((batch_number.lower(), medicine_id))
+            rows[medicine_id] = (expiry_date, words + [batch_number.lower()], name)
+            products.setdefault(name, []).append((medicine_id, tuple(values)))
+
+        for lots in products.values():
+            lots.sort(key=lambda lot: (lot[1][_EXPIRY], lot[0]))  # FEFO
+        tables = [_PrefixTable(pairs) for pairs in (full_names, name_words, generic_words, batches)]
+        self._snapshot = (version, tables, rows, products)
+        return self._snapshot
+
+    def _fresh_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != self.current_version():
+            snapshot = self.build()
+        return snapshot
+
+    async def _afresh_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is None or snapshot[0] != await self.acurrent_version():
+            # A rebuild reads every medicine; keep it off the event loop
+            snapshot = await sync_to_async(self.build)()
+        return snapshot
+
+    def ranked_ids(self, query, snapshot=None):
+        """Yield matching, non-expired medicine ids, best match first"""
+        tokens = _words(query)
+        if not tokens:
+            return
+
+        _, tables, rows, _ = snapshot or self._fresh_snapshot()
+        today = timezone.now().date()
+        lead = max(tokens, key=len)
+        seen = set()
+
+        scans = [tables[0].scan(tokens[0])]
+        scans += [table.scan(lead) for table in tables[1:]]
+        for scan in scans:
+            for medicine_id in scan:
+                if medicine_id in seen:
+                    continue
+                seen.add(medicine_id)
+                expiry_date, words, _ = rows[medicine_id]
+                if is_past_expiry(expiry_date, today):
+                    continue
+                if all(any(word.startswith(token) for word in words) for token in tokens):
+                    yield medicine_id
+
+    def ranked_names(self, query, snapshot=None):
+        """Yield the product names of ranked_ids(), each once, best match first"""
+        snapshot = snapshot or self._fresh_snapshot()
+        rows, seen = snapshot[2], set()
+        for medicine_id in self.ranked_ids(query, snapshot):
+            name = rows[medicine_id][2]
+            if name not in seen:
+                seen.add(name)
+                yield name
+
+    def search(self, query, limit=10):
+        """Up to `limit` in-stock, non-expired medicines matching `query`, ranked"""
+        today = timezone.now().date()
+        results = []
+        candidates = self.ranked_ids(query)
+
+        while len(results) < limit:
+            batch = [medicine_id for _, medicine_id in zip(range(CANDIDATE_BATCH), candidates)]
+            if not batch:
+                break
+            found = Medicine.objects.filter(sellable_q(today), pk__in=batch).order_by().in_bulk()
+            results.extend(found[medicine_id] for medicine_id in batch if medicine_id in found)
+
+        return results[:limit]
+
+    async def asearch(self, query, limit=10):
+        """search() for async views: the version check and stock re-check don't block the event loop"""
+        today = timezone.now().date()
+        results = []
+        candidates = self.ranked_ids(query, snapshot=await self._afresh_snapshot())
+
+        while len(results) < limit:
+            batch = [medicine_id for _, medicine_id in zip(range(CANDIDATE_BATCH), candidates)]
+            if not batch:
+                break
+            found = await Medicine.objects.filter(sellable_q(today), pk__in=batch).order_by().ain_bulk()
+            results.extend(found[medicine_id] for medicine_id in batch if medicine_id in found)
+
+        return results[:limit]
+
+    def search_products(self, query, limit=10):
+        """
+        Up to `limit` matching products rather than batches.
+
+        Each result is (FEFO lot, units across sellable lots, lot count): the
+        lot a sale would draw from first, so the counter sees one row per
+        product and the batch is chosen at posting time. Names and lots come
+        from the index, so a keystroke is usually one query: the stock of the
+        top CANDIDATE_BATCH products' lots.
+        """
+        snapshot = self._fresh_snapshot()
+        today = timezone.now().date()
+        results = []
+        candidates = self.ranked_names(query, snapshot)
+
+        while len(results) < limit:
+            names = [name for _, name in zip(range(CANDIDATE_BATCH), candidates)]
+            if not names:
+                break
+            stock = dict(_stock(snapshot[3], names))
+            results.extend(_group_lots(names, snapshot[3], stock, today))
+
+        return results[:limit]
+
+    async def asearch_products(self, query, limit=10):
+        """search_products() for async views"""
+        snapshot = await self._afresh_snapshot()
+        today = timezone.now().date()
+        results = []
+        candidates = self.ranked_names(query, snapshot)
+
+        while len(results) < limit:
+            names = [name for _, name in zip(range(CANDIDATE_BATCH), candidates)]
+            if not names:
+                break
+            stock = {medicine_id: quantity async for medicine_id, quantity in _stock(snapshot[3], names)}
+            results.extend(_group_lots(names, snapshot[3], stock, today))
+
+        return results[:limit]
+
+
+def orm_search(query, limit=10):
+    """Reference ORM search: substring scans over name, generic name and batch number"""
+    return list(Medicine.objects.filter(
+        Q(name__icontains=query) |
+        Q(generic_name__icontains=query) |
+        Q(batch_number__icontains=query)
+    ).sellable()[:limit])
+
+
+medicine_search_index = MedicineSearchIndex()
@@ -0,0 +1,884 @@
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Max, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import dashboard
+from .inventory import InsufficientStock, allocate_fefo, return_stock, take_stock
+from .models import (
+    Medicine, Bill, BillItem, BillRefund, Customer, DailySalesSummary, PaymentTransaction,
+    StockTransaction,
+)
+from .numbering import bill_number_allocator, format_bill_number
+
+
+# ============================================================================
+# CUSTOMER AGGREGATES
+# ============================================================================
+
+def _latest_purchase(customer_ref):
+    """Subquery: created_at of a customer's latest completed bill"""
+    return Subquery(
+        Bill.objects.filter(customer=customer_ref, status='completed')
+        .order_by('-created_at').values('created_at')[:1]
+    )
+
+
+def record_customer_purchase(bill):
+    """Count a newly completed bill towards its customer's aggregates"""
+    if bill.customer_id and bill.status == 'completed':
+        Customer.objects.filter(pk=bill.customer_id).update(
+            completed_bills=F('completed_bills') + 1,
+            lifetime_spend=F('lifetime_spend') + bill.total_amount,
+            # An offline bill synced late may be older than the latest one
+            last_purchase_at=Greatest(Coalesce('last_purchase_at', Value(bill.created_at)), Value(bill.created_at)),
+        )
+
+
+def customer_for(details, customers=None):
+    """
+    The customer with details['phone'], created from the other details if new.
+
+    `customers` optionally caches them by phone across a batch.
+    """
+    phone = details['phone']
+    customer = customers.get(phone) if customers is not None else None
+    if customer is None:
+        customer, _ = Customer.objects.get_or_create(
+            phone=phone, defaults={name: value for name, value in details.items() if name != 'phone'},
+        )
+        if customers is not None:
+            customers[phone] = customer
+    return customer
+
+
+def revert_customer_purchase(bill):
+    """Take a bill that is no longer completed out of its customer's aggregates"""
+    revert_customer_purchases([bill])
+
+
+def revert_customer_purchases(bills):
+    """Take bills that are no longer completed out of their customers' aggregates"""
+    per_customer = {}
+    for bill in bills:
+        if bill.customer_id:
+            count, spend = per_customer.get(bill.customer_id, (0, 0))
+            per_customer[bill.customer_id] = (count + 1, spend + bill.total_amount)
+
+    for customer_id, (count, spend) in per_customer.items():
+        Customer.objects.filter(pk=customer_id).update(
+            completed_bills=F('completed_bills') - count,
+            lifetime_spend=F('lifetime_spend') - spend,
+            last_purchase_at=_latest_purchase(customer_id),
+        )
+
+
+def record_customer_refund(bill, amount):
+    """Take a refund off its customer's lifetime spend"""
+    if bill.customer_id:
+        Customer.objects.filter(pk=bill.customer_id).update(
+            lifetime_spend=F('lifetime_spend') - amount,
+        )
+
+
+def recompute_customer_stats(batch_size=1000, bill_model=Bill, customer_model=Customer):
+    """
+    Rebuild every customer's aggregates from completed bills less refunds; returns customers updated.
+
+    The aggregates are only kept current by the posting, cancellation and refund
+    services above; a bill saved or edited any other way (shell, admin, raw SQL)
+    leaves them stale until this runs again. Migrations pass their historical
+    models in as `bill_model`/`customer_model`.
+    """
+    completed, refunded = Q(status='completed'), Q(status='refunded')
+    totals = (
+        bill_model.objects.filter(completed | refunded, customer__isnull=False)
+        .order_by()
+        .values('customer')
+        .annotate(
+            count=Count('pk', filter=completed),
+            spend=Coalesce(Sum('total_amount', filter=completed), Decimal('0'))
+            - Coalesce(Sum('total_amount', filter=refunded), Decimal('0')),
+            last=Max('created_at', filter=completed),
+        )
+    )
+
+    updated = 0
+    with transaction.atomic():
+        customer_model.objects.update(completed_bills=0, lifetime_spend=0, last_purchase_at=None)
+
+        batch = []
+        for row in totals.iterator(chunk_size=batch_size):
+            batch.append(customer_model(
+                pk=row['customer'],
+                completed_bills=row['count'],
+                lifetime_spend=row['spend'],
+                last_purchase_at=row['last'],
+            ))
+            if len(batch) >= batch_size:
+                updated += len(batch)
+                customer_model.objects.bulk_update(batch, ['completed_bills', 'lifetime_spend', 'last_purchase_at'])
+                batch = []
+        if batch:
+            updated += len(batch)
+            customer_model.objects.bulk_update(batch, ['completed_bills', 'lifetime_spend', 'last_purchase_at'])
+
+    return updated
+
+
+# ============================================================================
+# DAILY SALES ROLLUP
+# ============================================================================
+
+SUMMARY_AMOUNTS = ['subtotal', 'discount_amount', 'tax_amount', 'total_amount']
+
+
+def _add_to_summary(day, payment_method, status, bill_count, amounts, items_sold):
+    """Add deltas to one DailySalesSummary row, creating it on first use"""
+    deltas = {
+        'bill_count': F('bill_count') + bill_count,
+        'items_sold': F('items_sold') + items_sold,
+        **{field: F(field) + amounts[field] for field in SUMMARY_AMOUNTS},
+    }
+    row = DailySalesSummary.objects.filter(date=day, payment_method=payment_method, status=status)
+    if row.update(**deltas):
+        return
+    try:
+        with transaction.atomic():
+            DailySalesSummary.objects.create(
+                date=day, payment_method=payment_method, status=status,
+                bill_count=bill_count, items_sold=items_sold, **amounts,
+            )
+    except IntegrityError:
+        # Created concurrently by another counter
+        row.update(**deltas)
+
+
+def record_bill_sales(bill, items_sold):
+    """Add a newly posted bill to the daily sales rollup"""
+    # At the 2dp the bill's columns store, so the rollup sums what a rebuild would
+    amounts = {field: getattr(bill, field).quantize(Decimal('0.01'), ROUND_HALF_UP) for field in SUMMARY_AMOUNTS}
+    _add_to_summary(
+        timezone.localdate(bill.created_at), bill.payment_method, bill.status,
+        1, amounts, items_sold,
+    )
+
+
+def move_bill_sales(bill, old_status, items_sold):
+    """Move a bill between status buckets of the daily sales rollup"""
+    move_bills_sales([(bill, old_status, items_sold)])
+
+
+def move_bills_sales(moves):
+    """
+    Move bills between status buckets of the daily sales rollup.
+
+    `moves` holds (bill, old_status, items_sold) with bill.status already
+    set to the new status. Deltas are summed per rollup row first, so the
+    writes grow with the days and payment methods touched, not the bills.
+    """
+    deltas = {}
+    for bill, old_status, items_sold in moves:
+        day = timezone.localdate(bill.created_at)
+        for status, sign in ((old_status, -1), (bill.status, 1)):
+            key = (day, bill.payment_method, status)
+            bill_count, amounts, sold = deltas.get(key, (0, dict.fromkeys(SUMMARY_AMOUNTS, 0), 0))
+            for field in SUMMARY_AMOUNTS:
+                amounts[field] += sign * getattr(bill, field)
+            deltas[key] = (bill_count + sign, amounts, sold + sign * items_sold)
+
+    for (day, payment_method, status), (bill_count, amounts, sold) in deltas.items():
+        _add_to_summary(day, payment_method, status, bill_count, amounts, sold)
+
+
+def rebuild_daily_sales(since=None, bill_model=Bill, item_model=BillItem, summary_model=DailySalesSummary):
+    """
+    Recompute the daily sales rollup from bills (from `since` onwards); returns rows written.
+
+    Migrations pass their historical models in as `bill_model`/`item_model`/`summary_model`.
+    """
+    bills = bill_model.objects.order_by()
+    items = item_model.objects.order_by()
+    if since:
+        bills = bills.filter(created_at__date__gte=since)
+        items = items.filter(bill__created_at__date__gte=since)
+
+    totals = bills.annotate(day=TruncDate('created_at')).values(
+        'day', 'payment_method', 'status'
+    ).annotate(
+        bill_count=Count('pk'),
+        **{field: Sum(field) for field in SUMMARY_AMOUNTS},
+    )
+    sold = {
+        (row['day'], row['bill__payment_method'], row['bill__status']): row['items_sold']
+        for row in items.annotate(day=TruncDate('bill__created_at')).values(
+            'day', 'bill__payment_method', 'bill__status'
+        ).annotate(items_sold=Sum('quantity'))
+    }
+
+    rows = [
+        summary_model(
+            date=row['day'],
+            payment_method=row['payment_method'],
+            status=row['status'],
+            bill_count=row['bill_count'],
+            items_sold=sold.get((row['day'], row['payment_method'], row['status'])) or 0,
+            **{field: row[field] or 0 for field in SUMMARY_AMOUNTS},
+        )
+        for row in totals
+    ]
+
+    with transaction.atomic():
+        stale = summary_model.objects.all()
+        if since:
+            stale = stale.filter(date__gte=since)
+        stale.delete()
+        summary_model.objects.bulk_create(rows, batch_size=1000)
+
+    return len(rows)
+
+
+def sales_totals(date_from=None, date_to=None, status=None, payment_method=None):
+    """Bill count and net sales (completed less refunds) for a filter, read from the daily rollup"""
+    summaries = DailySalesSummary.objects.order_by()
+    if date_from:
+        summaries = summaries.filter(date__gte=date_from)
+    if date_to:
+        summaries = summaries.filter(date__lte=date_to)
+    if status:
+        summaries = summaries.filter(status=status)
+    if payment_method:
+        summaries = summaries.filter(payment_method=payment_method)
+
+    totals = summaries.aggregate(
+        total_bills=Sum('bill_count'),
+        completed=Sum('total_amount', filter=Q(status='completed')),
+        refunded=Sum('total_amount', filter=Q(status='refunded')),
+    )
+    return {
+        'total_bills': totals['total_bills'] or 0,
+        'total_sales': (totals['completed'] or 0) - (totals['refunded'] or 0),
+    }
+
+
+# ============================================================================
+# PAYMENTS
+# ============================================================================
+
+TENDERS = {method for method, _ in Bill.PAYMENT_METHODS} - {'credit', 'split'}
+
+
+def clean_payments(payments):
+    """
+    Validate checkout/collection tenders into (method, amount, reference) tuples.
+
+    Credit is not a tender: whatever isn't paid stays on the bill as
+    amount_due and shows up in the credit ledger.
+    """
+    tenders = []
+    for payment in payments or []:
+        method = payment.get('payment_method', '')
+        if method not in TENDERS:
+            raise ValueError(f'Unknown payment method "{method}"')
+        try:
+            amount = _to_decimal(payment.get('amount', 0))
+        except InvalidOperation:
+            raise ValueError('Payment amounts must be numbers')
+        if amount <= 0:
+            raise ValueError('Payment amounts must be positive')
+        tenders.append((method, amount, payment.get('transaction_reference', '')[:100]))
+    return tenders
+
+
+def _payment_rows(bill, tenders, created_by):
+    return [
+        PaymentTransaction(
+            bill=bill,
+            payment_method=method,
+            amount=amount,
+            transaction_reference=reference,
+            created_by=created_by,
+        )
+        for method, amount, reference in tenders
+    ]
+
+
+def record_payments(bill_id, payments, created_by=None):
+    """
+    Collect payments against an existing bill (e.g. settling credit).
+
+    The tenders are bulk-inserted and the bill's balance moves with one F()
+    update, so it never has to re-sum its payments. Returns the updated bill.
+    """
+    tenders = clean_payments(payments)
+    if not tenders:
+        raise ValueError('Enter at least one payment')
+    paid = sum(amount for _, amount, _ in tenders)
+
+    with transaction.atomic():
+        updated = Bill.objects.filter(pk=bill_id, status='completed').update(
+            amount_paid=F('amount_paid') + paid,
+            amount_due=F('amount_due') - paid,
+        )
+        if not updated:
+            if Bill.objects.filter(pk=bill_id).exists():
+                raise ValueError('Payments can only be taken on completed bills')
+            raise Bill.DoesNotExist(f'Bill not found: {bill_id}')
+        bill = Bill.objects.get(pk=bill_id)
+        PaymentTransaction.objects.bulk_create(_payment_rows(bill, tenders, created_by))
+        transaction.on_commit(dashboard.invalidate)
+
+    return bill
+
+
+def outstanding_bills():
+    """Completed bills with a balance still due, served by the (status, amount_due) index"""
+    return Bill.objects.filter(status='completed', amount_due__gt=0)
+
+
+# ============================================================================
+# BILL POSTING
+# ============================================================================
+
+def _to_decimal(value):
+    """Convert a JSON number/string to a 2dp Decimal"""
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+def _requested_quantities(lines):
+    """Total requested quantity per medicine id (a medicine may appear on several lines)"""
+    requested = {}
+    for line in lines:
+        requested[line['medicine_id']] = requested.get(line['medicine_id'], 0) + line['quantity']
+    return requested
+
+
+def _check_stock(medicines, requested):
+    """Validate {medicine_id: quantity} against already-fetched medicines"""
+    missing = set(requested) - set(medicines)
+    if missing:
+        raise Medicine.DoesNotExist(f'Medicine not found: {sorted(missing)}')
+
+    for medicine_id, quantity in requested.items():
+        medicine = medicines[medicine_id]
+        if medicine.is_expired:
+            raise ValueError(f'{medicine.name} (batch {medicine.batch_number}) has expired')
+        if medicine.quantity < quantity:
+            raise InsufficientStock(medicine, quantity)
+
+
+def _allocate_lines(lines):
+    """Replace FEFO lines with one line per lot they were allocated from"""
+    fefo = [line for line in lines if line['fefo']]
+    if not fefo:
+        return lines
+
+    allocations = iter(allocate_fefo([(line['medicine_id'], line['quantity']) for line in fefo]))
+    allocated = []
+    for line in lines:
+        if not line['fefo']:
+            allocated.append(line)
+            continue
+        allocated.extend(
+            {'medicine_id': lot.pk, 'quantity': quantity, 'unit_price': line['unit_price'], 'fefo': False}
+            for lot, quantity in next(allocations)
+        )
+    return allocated
+
+
+def post_bill(items, created_by=None, payments=None, **bill_fields):
+    """
+    Create a bill with all its line items in one transaction.
+
+    `items` is a list of dicts with `medicine_id`, `quantity` and optionally
+    `unit_price` (defaults to the medicine's selling price). Medicines are
+    fetched in one query and checked in memory for a friendly error; the
+    stock itself is taken with one conditional UPDATE (inventory.take_stock),
+    so no medicine row is locked until it is written. Items and stock
+    transactions are written with bulk statements, so the query count does
+    not grow with the number of lines.
+
+    A line with a true `fefo` flag sells `quantity` units of the medicine's
+    product rather than of that exact batch: they are allocated from its
+    unexpired lots, earliest expiry first, with one extra locked query for
+    all such lines (inventory.allocate_fefo). Expired batches are never
+    sold.
+
+    `payments` optionally splits the checkout across tenders (list of dicts
+    with `payment_method`, `amount` and `transaction_reference`). They are
+    bulk-inserted as PaymentTransaction rows; the bill's amount_paid is
+    their sum and its payment method "split" when more than one method is
+    used. Without payments or an amount paid, a bill on a real tender
+    (cash, card, ...) is taken as paid in full; only "credit" and split
+    sales are left owing.
+
+    A `created_at` bill field books the sale at that time (an offline sale
+    synced later) instead of now.
+
+    Raises Medicine.DoesNotExist for unknown medicines and InsufficientStock
+    when a line asks for more than is available.
+    """
+    lines = [{
+        'medicine_id': int(item['medicine_id']),
+        'quantity': int(item['quantity']),
+        'unit_price': item.get('unit_price'),
+        'fefo': bool(item.get('fefo')),
+    } for item in items]
+
+    for line in lines:
+        if line['quantity'] < 1:
+            raise ValueError('Item quantity must be at least 1')
+
+    tenders = clean_payments(payments)
+    if tenders:
+        methods = {method for method, _, _ in tenders}
+        bill_fields['payment_method'] = methods.pop() if len(methods) == 1 else 'split'
+        bill_fields['amount_paid'] = sum(amount for _, amount, _ in tenders)
+
+    # Taken before the transaction so the sequence row is not locked for the
+    # whole posting; a failed post leaves a gap in the day's numbering.
+    if not bill_fields.get('bill_number'):
+        bill_fields['bill_number'] = bill_number_allocator.allocate()
+
+    with transaction.atomic():
+        lines = _allocate_lines(lines)
+        requested = _requested_quantities(lines)
+        medicines = Medicine.objects.in_bulk(list(requested))
+        _check_stock(medicines, requested)
+        take_stock(requested)
+
+        # Build line items in memory
+        bill_items = []
+        subtotal = Decimal('0.00')
+        for line in lines:
+            medicine = medicines[line['medicine_id']]
+            if line['unit_price'] in (None, ''):
+                unit_price = medicine.selling_price
+            else:
+                unit_price = _to_decimal(line['unit_price'])
+            total_price = line['quantity'] * unit_price
+            subtotal += total_price
+            bill_items.append(BillItem(
+                medicine=medicine,
+                medicine_name=medicine.name,
+                batch_number=medicine.batch_number,
+                quantity=line['quantity'],
+                unit_price=unit_price,
+                total_price=total_price,
+            ))
+
+        bill_fields.pop('subtotal', None)
+        sold_at = bill_fields.pop('created_at', None)
+        bill = Bill(subtotal=subtotal, created_by=created_by, **bill_fields)
+        bill.calculate_amounts()
+        if not tenders and bill.payment_method in TENDERS and not bill.amount_paid:
+            # A cash/card sale with no amount entered was paid in full;
+            # only an explicit credit (or split) sale leaves a balance due
+            paid = bill.total_amount.quantize(Decimal('0.01'), ROUND_HALF_UP)
+            tenders = [(bill.payment_method, paid, '')]
+            bill.amount_paid = paid
+        bill.save(force_insert=True)
+        if sold_at:
+            # auto_now_add stamps the insert with the current time
+            Bill.objects.filter(pk=bill.pk).update(created_at=sold_at)
+            bill.created_at = sold_at
+
+        for bill_item in bill_items:
+            bill_item.bill = bill
+        BillItem.objects.bulk_create(bill_items)
+
+        StockTransaction.objects.bulk_create([
+            StockTransaction(
+                medicine=bill_item.medicine,
+                transaction_type='sale',
+                quantity=bill_item.quantity,
+                price_per_unit=bill_item.unit_price,
+                total_amount=bill_item.total_price,
+                notes=f'Bill: {bill.bill_number}',
+                bill_reference=bill.bill_number,
+                performed_by=created_by,
+            )
+            for bill_item in bill_items
+        ])
+
+        if tenders:
+            PaymentTransaction.objects.bulk_create(_payment_rows(bill, tenders, created_by))
+
+        record_customer_purchase(bill)
+        record_bill_sales(bill, sum(requested.values()))
+
+        # Keep the in-memory instances in line with the database
+        for medicine_id, quantity in requested.items():
+            medicines[medicine_id].quantity -= quantity
+
+    return bill
+
+
+# ============================================================================
+# OFFLINE BILL SYNC
+# ============================================================================
+
+# Most bills one sync request may carry
+SYNC_BATCH_LIMIT = 1000
+
+# What an offline bill may carry: post_bill()'s arguments, the bill fields a
+# counter sets, the customer to file it under and when the sale was made
+SYNC_BILL_FIELDS = {
+    'client_reference', 'items', 'payments', 'customer_details', 'customer_name', 'customer_phone',
+    'discount_percentage', 'tax_percentage', 'payment_method', 'amount_paid', 'notes', 'created_at',
+}
+
+# How far ahead of the server a counter's clock may run
+SYNC_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def _sync_result(key, status, bill=None, message=''):
+    result = {'client_reference': key, 'status': status}
+    if bill:
+        result['bill_id'], result['bill_number'] = bill
+    if message:
+        result['message'] = message
+    return result
+
+
+def _sale_time(value):
+    """An offline bill's `created_at` (ISO 8601) as an aware datetime, checked"""
+    sold_at = parse_datetime(value) if isinstance(value, str) else None
+    if sold_at is None:
+        raise ValueError('created_at must be an ISO 8601 date and time')
+    if timezone.is_naive(sold_at):
+        sold_at = timezone.make_aware(sold_at)
+    if sold_at > timezone.now() + SYNC_CLOCK_SKEW:
+        raise ValueError('created_at is in the future')
+    return sold_at
+
+
+def _sync_fields(bill):
+    """post_bill() bill fields of an offline bill; raises ValueError for fields it may not set"""
+    unknown = set(bill) - SYNC_BILL_FIELDS
+    if unknown:
+        raise ValueError(f'Unknown bill fields: {", ".join(sorted(unknown))}')
+    fields = {name: value for name, value in bill.items() if name not in ('items', 'payments', 'customer_details')}
+    if fields.get('created_at') is None:
+        fields.pop('created_at', None)
+    else:
+        fields['created_at'] = _sale_time(fields['created_at'])
+    return fields
+
+
+def sync_bills(bills, created_by=None):
+    """
+    Post bills queued by an offline counter, each exactly once.
+
+    Every bill carries its `client_reference`, a key generated on the
+    counter when the sale was made, plus post_bill()'s arguments (`items`,
+    `payments` and the bill fields in SYNC_BILL_FIELDS). `created_at` is
+    when the sale was made, so it lands on the right day of the sales
+    rollup; `customer_details` (customer_for()) files it under a customer,
+    created inside the batch's transaction. Keys already posted, by an earlier flush or
+    earlier in this batch, are reported as duplicates and take no stock; the
+    unique index on Bill.client_reference catches a concurrent flush of the
+    same queue. Bill numbers for the whole batch are reserved in one
+    statement, then the bills are posted in one transaction, each in its own
+    savepoint so a bill that can't be posted (unknown field or medicine,
+    not enough stock, stock contended) is reported without losing the rest.
+
+    Returns one result dict per bill, in order, with `status` "created",
+    "duplicate" or "failed".
+    """
+    if len(bills) > SYNC_BATCH_LIMIT:
+        raise ValueError(f'At most {SYNC_BATCH_LIMIT} bills can be synced at once')
+    keys = []
+    for bill in bills:
+        key = bill.get('client_reference')
+        if not isinstance(key, str) or not key.strip() or len(key) > 64:
+            raise ValueError('Each bill needs a client_reference of up to 64 characters')
+        keys.append(key)
+
+    posted = {
+        key: (pk, number) for key, pk, number in
+        Bill.objects.filter(client_reference__in=keys).order_by().values_list('client_reference', 'pk', 'bill_number')
+    }
+    new_keys = set(keys) - set(posted)
+    if new_keys:
+        day = timezone.now().date()
+        last = bill_number_allocator.reserve(day, len(new_keys))
+        numbers = (format_bill_number(day, n) for n in range(last - len(new_keys) + 1, last + 1))
+
+    results, failed, customers = [], {}, {}
+    with transaction.atomic():
+        for key, bill in zip(keys, bills):
+            if key in posted:
+                results.append(_sync_result(key, 'duplicate', posted[key]))
+                continue
+            if key in failed:
+                # Repeated within the batch after failing: fails the same way
+                results.append(failed[key])
+                continue
+
+            details = bill.get('customer_details')
+            try:
+                fields = _sync_fields(bill)
+                fields['bill_number'] = next(numbers)
+                if not bill.get('items'):
+                    raise ValueError('Please add at least one item to the bill')
+                with transaction.atomic():
+                    if details:
+                        fields['customer'] = customer_for(details, customers)
+                    created = post_bill(bill['items'], created_by=created_by, payments=bill.get('payments'), **fields)
+            except IntegrityError:
+                # Posted by a concurrent flush of the same queue
+                existing = Bill.objects.filter(client_reference=key).values_list('pk', 'bill_number').first()
+                if existing is None:
+                    raise
+                posted[key] = existing
+                result = _sync_result(key, 'duplicate', existing)
+            except (Medicine.DoesNotExist, InsufficientStock, ValueError, TypeError, ArithmeticError) as e:
+                result = failed[key] = _sync_result(key, 'failed', message=str(e))
+            except RuntimeError as e:
+                # Stock contended (take_stock); not remembered, the next flush retries it
+                result = _sync_result(key, 'failed', message=str(e))
+            else:
+                posted[key] = (created.pk, created.bill_number)
+                result = _sync_result(key, 'created', posted[key])
+            if result['status'] == 'failed' and isinstance(details, dict):
+                # Its savepoint may have rolled back a customer it created
+                customers.pop(details.get('phone'), None)
+            results.append(result)
+
+    return results
+
+
+# ============================================================================
+# BILL CANCELLATION
+# ============================================================================
+
+def cancel_bills(bill_ids, performed_by=None):
+    """
+    Cancel bills and put their stock back in one transaction.
+
+    The bills are locked, their items read in one query, stock restored with
+    a single F() update across all medicines and the return transactions
+    bulk-created, so the query count doesn't grow with the number of items.
+    Unknown and already cancelled ids are skipped, as are refund bills and
+    bills with refunds (refund their remaining lines instead); returns the
+    bills that were cancelled.
+    """
+    with transaction.atomic():
+        bills = list(
+            Bill.objects.select_for_update()
+            .filter(pk__in=list(bill_ids))
+            .exclude(status__in=['cancelled', 'refunded'])
+            .exclude(pk__in=BillRefund.objects.values('original_bill'))
+            .order_by('pk')
+        )
+        if not bills:
+            return []
+
+        by_id = {bill.pk: bill for bill in bills}
+        items = list(BillItem.objects.filter(bill__in=list(by_id)).order_by())
+
+        restored, sold = {}, {}
+        for item in items:
+            restored[item.medicine_id] = restored.get(item.medicine_id, 0) + item.quantity
+            sold[item.bill_id] = sold.get(item.bill_id, 0) + item.quantity
+        return_stock(restored)
+
+        StockTransaction.objects.bulk_create([
+            StockTransaction(
+                medicine_id=item.medicine_id,
+                transaction_type='return',
+                quantity=item.quantity,
+                price_per_unit=item.unit_price,
+                total_amount=item.total_price,
+                notes=f'Bill Cancelled: {by_id[item.bill_id].bill_number}',
+                bill_reference=by_id[item.bill_id].bill_number,
+                performed_by=performed_by,
+            )
+            for item in items
+        ])
+
+        now = timezone.now()
+        Bill.objects.filter(pk__in=list(by_id)).update(status='cancelled', updated_at=now)
+        moves = []
+        for bill in bills:
+            moves.append((bill, bill.status, sold.get(bill.pk, 0)))
+            bill.status = 'cancelled'
+            bill.updated_at = now
+
+        revert_customer_purchases([bill for bill, old_status, _ in moves if old_status == 'completed'])
+        move_bills_sales(moves)
+
+    return bills
+
+
+# ============================================================================
+# REFUNDS
+# ============================================================================
+
+def _amounts_for(bill, subtotal):
+    """Discount, tax and total that `bill`'s rates give on `subtotal`, rounded as the columns store them"""
+    part = Bill(subtotal=subtotal, discount_percentage=bill.discount_percentage, tax_percentage=bill.tax_percentage)
+    part.calculate_amounts()
+    return {field: getattr(part, field).quantize(Decimal('0.01'), ROUND_HALF_UP) for field in SUMMARY_AMOUNTS}
+
+
+def _refund_amounts(bill, items, requested):
+    """
+    Amounts for refunding `requested` ({item_id: quantity}) of `bill`.
+
+    Each refund is priced as the difference between the rounded amounts for
+    everything refunded after it and before it, so the paise of several
+    partial refunds add up to what one refund would have been. The refund
+    that returns the last unit takes whatever of the bill is still unrefunded.
+    """
+    before = sum(item.refunded_quantity * item.unit_price for item in items)
+    after = sum((item.refunded_quantity + requested.get(item.pk, 0)) * item.unit_price for item in items)
+    refunded = _amounts_for(bill, before)
+    if all(item.refunded_quantity + requested.get(item.pk, 0) == item.quantity for item in items):
+        amounts = {
+            field: getattr(bill, field).quantize(Decimal('0.01'), ROUND_HALF_UP) - refunded[field]
+            for field in SUMMARY_AMOUNTS
+        }
+        amounts['total_amount'] = bill.total_amount.quantize(Decimal('0.01'), ROUND_HALF_UP) - bill.refunded_amount
+        return amounts
+    refunding = _amounts_for(bill, after)
+    return {field: refunding[field] - refunded[field] for field in SUMMARY_AMOUNTS}
+
+
+def refund_bill(bill_id, lines, reason='', processed_by=None):
+    """
+    Refund some units of a completed bill.
+
+    `lines` is a list of dicts with the original `item_id` and the
+    `quantity` to return. A refund Bill (status "refunded") is created with
+    matching items at the original prices, discount and tax, plus a
+    BillRefund row linking the two. Stock comes back with one set-based
+    update, and the bill's refunded amounts, the customer's lifetime spend
+    and the daily rollup are adjusted with F() updates, so a refund costs
+    the same number of queries however many lines it returns. A refund
+    first settles any balance still owed on the bill; only the rest is paid
+    back (the refund bill's amount_paid).
+
+    The original bill row is locked for the duration, so concurrent refunds
+    of the same bill can't return a unit twice. Raises Bill.DoesNotExist
+    and ValueError for requests that can't be refunded.
+    """
+    requested = {}
+    for line in lines:
+        item_id, quantity = int(line['item_id']), int(line['quantity'])
+        if quantity < 1:
+            raise ValueError('Refund quantity must be at least 1')
+        requested[item_id] = requested.get(item_id, 0) + quantity
+    if not requested:
+        raise ValueError('Select at least one item to refund')
+
+    bill_number = bill_number_allocator.allocate()
+
+    with transaction.atomic():
+        bill = Bill.objects.select_for_update().get(pk=bill_id)
+        if bill.status != 'completed':
+            raise ValueError(f'Only completed bills can be refunded (bill is {bill.status})')
+
+        items = {item.pk: item for item in bill.items.order_by()}
+        missing = set(requested) - set(items)
+        if missing:
+            raise ValueError(f'Items not on this bill: {sorted(missing)}')
+        for item_id, quantity in requested.items():
+            item = items[item_id]
+            if quantity > item.refundable_quantity:
+                raise ValueError(
+                    f'Only {item.refundable_quantity} of {item.medicine_name} can be refunded'
+                )
+
+        refund_items = []
+        for item_id, quantity in requested.items():
+            item = items[item_id]
+            refund_items.append(BillItem(
+                medicine_id=item.medicine_id,
+                medicine_name=item.medicine_name,
+                batch_number=item.batch_number,
+                quantity=quantity,
+                unit_price=item.unit_price,
+                total_price=quantity * item.unit_price,
+            ))
+
+        refund = Bill(
+            bill_number=bill_number,
+            customer_id=bill.customer_id,
+            customer_name=bill.customer_name,
+            customer_phone=bill.customer_phone,
+            discount_percentage=bill.discount_percentage,
+            tax_percentage=bill.tax_percentage,
+            payment_method=bill.payment_method,
+            status='refunded',
+            notes=f'Refund of {bill.bill_number}',
+            created_by=processed_by,
+        )
+        amounts = _refund_amounts(bill, items.values(), requested)
+        # The refund first comes off what the customer still owes; only the
+        # rest is paid back, so a credit bill's refund pays out nothing
+        written_off = min(amounts['total_amount'], max(bill.amount_due, Decimal('0.00')))
+        refund.subtotal = amounts['subtotal']
+        refund.amount_paid = amounts['total_amount'] - written_off
+        refund.save()
+        # Bill.save() prices the subtotal afresh; where that rounds differently
+        # from the apportioned amounts, store those over it
+        amounts['amount_due'] = written_off
+        if any(getattr(refund, field).quantize(Decimal('0.01'), ROUND_HALF_UP) != value
+               for field, value in amounts.items()):
+            Bill.objects.filter(pk=refund.pk).update(**amounts)
+        for field, value in amounts.items():
+            setattr(refund, field, value)
+
+        for refund_item in refund_items:
+            refund_item.bill = refund
+        BillItem.objects.bulk_create(refund_items)
+
+        BillItem.objects.filter(pk__in=list(requested)).update(
+            refunded_quantity=Case(
+                *[When(pk=item_id, then=F('refunded_quantity') + quantity)
+                  for item_id, quantity in requested.items()],
+                default=F('refunded_quantity'),
+                output_field=PositiveIntegerField(),
+            )
+        )
+        Bill.objects.filter(pk=bill.pk).update(
+            refunded_amount=F('refunded_amount') + refund.total_amount,
+            amount_due=F('amount_due') - written_off,
+        )
+
+        restocked = {}
+        for refund_item in refund_items:
+            restocked[refund_item.medicine_id] = restocked.get(refund_item.medicine_id, 0) + refund_item.quantity
+        return_stock(restocked)
+        StockTransaction.objects.bulk_create([
+            StockTransaction(
+                medicine_id=refund_item.medicine_id,
+                transaction_type='return',
+                quantity=refund_item.quantity,
+                price_per_unit=refund_item.unit_price,
+                total_amount=refund_item.total_price,
+                notes=f'Refund of {bill.bill_number}',
+                bill_reference=refund.bill_number,
+                performed_by=processed_by,
+            )
+            for refund_item in refund_items
+        ])
+
+        bill_refund = BillRefund.objects.create(
+            original_bill=bill,
+            refund_bill=refund,
+            reason=reason,
+            refund_amount=refund.total_amount,
+            processed_by=processed_by,
+        )
+
+        record_customer_refund(bill, refund.total_amount)
+        record_bill_sales(refund, sum(requested.values()))
+
+    return bill_refund
@@ -0,0 +1,48 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import barcodes, dashboard, records
+from .models import Bill, Medicine
+from .search import MedicineSearchIndex
+
+
+@receiver(post_save, sender=Medicine)
+def invalidate_medicine_search(sender, instance, created, **kwargs):
+    """Medicine added, or its text or expiry edited: rebuild search indexes on next use"""
+    # Stock isn't indexed (searches re-check it), and every process rebuilds
+    # the whole index on a version bump, so stock-only saves leave it alone
+    if created or instance.search_fields_changed():
+        MedicineSearchIndex.invalidate()
+
+
+@receiver(post_save, sender=Medicine)
+def move_renamed_medicine_barcodes(sender, instance, created, **kwargs):
+    """Medicine renamed: its product's barcodes follow the new name"""
+    old_name = None if created else instance.renamed_from()
+    if old_name is not None:
+        barcodes.rename_product(old_name, instance.name)
+
+
+@receiver(post_delete, sender=Medicine)
+def invalidate_deleted_medicine_search(sender, **kwargs):
+    """Medicine deleted: rebuild search indexes on next use"""
+    MedicineSearchIndex.invalidate()
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def invalidate_medicine_record(sender, instance, **kwargs):
+    """Medicine edited or deleted: drop its cached detail record after commit"""
+    transaction.on_commit(partial(records.invalidate, [instance.pk]))
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+@receiver(post_save, sender=Bill)
+@receiver(post_delete, sender=Bill)
+def invalidate_dashboard(sender, **kwargs):
+    """Bill or medicine edited: recompute the dashboard figures after commit"""
+    transaction.on_commit(dashboard.invalidate)
@@ -1,3 +1,1842 @@
-from django.test import TestCase
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from statistics import pstdev
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import F, Sum
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Medicine, Bill, BillItem, BillRefund, Customer, DailySalesSummary, GoodsReceipt,
+    MedicineBarcode, MedicineDailyDemand, StockCheckpoint, StockSnapshot, StockTransaction,
+)
+from . import dashboard, reconciliation, records, services
+from .barcodes import is_valid_gtin, normalize_code, register_barcodes, resolve_code, resolve_codes
+from .benchmarks import BenchmarkRunner, compare
+from .exports import export_rows
+from .importers import csv_rows, import_medicines
+from .inventory import return_stock, take_stock, write_off_expired
+from .numbering import BillNumberAllocator
+from .pagination import decode_cursor, paginate_keyset
+from .profiling import ProfilingMiddleware, RequestProfile, view_metrics
+from .purchasing import create_purchase_order, receive_goods
+from .reconciliation import KEEP_CHECKPOINTS, reconcile_stock
+from .reorder import rebuild_daily_demand, refresh_daily_demand, reorder_suggestions
+from .search import MedicineSearchIndex
+from .services import (
+    InsufficientStock, cancel_bills, post_bill, rebuild_daily_sales, recompute_customer_stats,
+    outstanding_bills, record_payments, refund_bill, sales_totals, sync_bills,
+)
+
+
+def make_medicine(name='Paracetamol', quantity=100, **kwargs):
+    today = timezone.now().date()
+    fields = {
+        'name': name,
+        'generic_name': 'Acetaminophen',
+        'category': 'tablet',
+        'manufacturer': 'Acme Pharma',
+        'quantity': quantity,
+        'unit_price': Decimal('1.50'),
+        'selling_price': Decimal('2.00'),
+        'manufacturing_date': today - timedelta(days=30),
+        'expiry_date': today + timedelta(days=365),
+        'batch_number': f'B-{name}',
+    }
+    fields.update(kwargs)
+    return Medicine.objects.create(**fields)
+
+
+class PostBillTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='secret')
+
+    def _post(self, medicines, quantity=1):
+        return post_bill(
+            [{'medicine_id': m.id, 'quantity': quantity, 'unit_price': '2.00'} for m in medicines],
+            created_by=self.user,
+            customer_name='Walk-in Customer',
+        )
+
+    def test_posts_items_stock_and_transactions(self):
+        medicine = make_medicine(quantity=10)
+        bill = post_bill(
+            [{'medicine_id': medicine.id, 'quantity': 3, 'unit_price': 2.5},
+             {'medicine_id': medicine.id, 'quantity': 2}],
+            created_by=self.user,
+            customer_name='Walk-in Customer',
+            tax_percentage=Decimal('10'),
+        )
+
+        medicine.refresh_from_db()
+        self.assertEqual(medicine.quantity, 5)
+        self.assertEqual(bill.items.count(), 2)
+        self.assertEqual(bill.subtotal, Decimal('11.50'))
+        self.assertEqual(bill.total_amount, Decimal('12.65'))
+        sales = StockTransaction.objects.filter(bill_reference=bill.bill_number)
+        self.assertEqual(sales.count(), 2)
+        self.assertEqual(sum(t.quantity for t in sales), 5)
+
+    def test_insufficient_stock_rolls_back(self):
+        plenty = make_medicine('Plenty', quantity=10)
+        scarce = make_medicine('Scarce', quantity=1)
+
+        with self.assertRaises(InsufficientStock):
+            post_bill(
+                [{'medicine_id': plenty.id, 'quantity': 2},
+                 {'medicine_id': scarce.id, 'quantity': 2}],
+                customer_name='Walk-in Customer',
+            )
+
+        plenty.refresh_from_db()
+        self.assertEqual(plenty.quantity, 10)
+        self.assertFalse(Bill.objects.exists())
+        self.assertFalse(StockTransaction.objects.exists())
+
+    def test_unknown_medicine(self):
+        with self.assertRaises(Medicine.DoesNotExist):
+            post_bill([{'medicine_id': 999, 'quantity': 1}], customer_name='X')
+
+    def test_query_count_independent_of_line_count(self):
+        small = [make_medicine(f'Small {i}') for i in range(1)]
+        large = [make_medicine(f'Large {i}') for i in range(20)]
+        self._post(small)  # creates today's bill number sequence row
+
+        with CaptureQueriesContext(connection) as one_line:
+            self._post(small)
+        with CaptureQueriesContext(connection) as twenty_lines:
+            self._post(large)
+
+        self.assertEqual(len(one_line), len(twenty_lines))
+        # Includes the cash tender row of a sale paid in full
+        self.assertLessEqual(len(twenty_lines), 15)
+        self.assertEqual(BillItem.objects.count(), 22)
+
+    def test_only_credit_sales_are_left_owing(self):
+        medicine = make_medicine(quantity=10)
+        line = [{'medicine_id': medicine.id, 'quantity': 1, 'unit_price': '10.00'}]
+        cash = post_bill(line, customer_name='X', payment_method='cash', amount_paid=Decimal('0'))
+        credit = post_bill(line, customer_name='X', payment_method='credit')
+
+        self.assertEqual((cash.amount_paid, cash.amount_due), (Decimal('10.00'), Decimal('0.00')))
+        self.assertEqual(cash.payments.get().amount, Decimal('10.00'))
+        self.assertEqual(list(outstanding_bills()), [credit])
+
+
+class CreateBillViewTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+
+    def test_create_bill(self):
+        medicine = make_medicine(quantity=5)
+        response = self.client.post(
+            reverse('create_bill'),
+            data=json.dumps({
+                'items': [{'medicine_id': medicine.id, 'quantity': 2, 'unit_price': 2.0}],
+                'customer_name': 'Asha',
+                'customer_phone': '9999999999',
+                'payment_method': 'cash',
+                'amount_paid': 4,
+            }),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+        bill = Bill.objects.get()
+        self.assertEqual(bill.customer.name, 'Asha')
+        self.assertEqual(bill.amount_due, Decimal('0.00'))
+
+    def test_create_bill_insufficient_stock(self):
+        medicine = make_medicine(quantity=1)
+        response = self.client.post(
+            reverse('create_bill'),
+            data=json.dumps({'items': [{'medicine_id': medicine.id, 'quantity': 2, 'unit_price': 2.0}]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Insufficient stock', response.json()['message'])
+
+
+class SyncBillsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        self.medicine = make_medicine(quantity=5)
+
+    def _bill(self, key, quantity=1):
+        return {
+            'client_reference': key,
+            'items': [{'medicine_id': self.medicine.id, 'quantity': quantity, 'unit_price': 2.0}],
+            'customer_name': 'Asha',
+            'customer_phone': '9999999999',
+            'payment_method': 'cash',
+            'amount_paid': 2 * quantity,
+        }
+
+    def _sync(self, bills):
+        return self.client.post(reverse('sync_bills'), data=json.dumps({'bills': bills}), content_type='application/json')
+
+    def test_each_bill_posts_once(self):
+        bills = [self._bill('a'), self._bill('b', quantity=2), self._bill('a'), self._bill('big', quantity=50)]
+        response = self._sync(bills)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['created'], body['duplicate'], body['failed']), (2, 1, 1))
+        self.assertEqual([r['status'] for r in body['results']], ['created', 'created', 'duplicate', 'failed'])
+        self.assertEqual(body['results'][2]['bill_id'], body['results'][0]['bill_id'])
+        self.assertIn('Insufficient stock', body['results'][3]['message'])
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 2)
+        self.assertEqual(Customer.objects.count(), 1)
+
+        # Replaying the flush (e.g. after a timeout) takes no more stock
+        body = self._sync(bills).json()
+        self.assertEqual([r['status'] for r in body['results']], ['duplicate', 'duplicate', 'duplicate', 'failed'])
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 2)
+        self.assertEqual(Bill.objects.count(), 2)
+        self.assertEqual(StockTransaction.objects.filter(transaction_type='sale').count(), 2)
+
+    def test_bill_numbers_reserved_per_batch(self):
+        self.medicine.quantity = 100
+        self.medicine.save()
+        sync_bills([self._bill('first')])  # creates today's sequence row
+
+        with CaptureQueriesContext(connection) as ctx:
+            results = sync_bills([self._bill(f'k{i}') for i in range(10)], created_by=self.user)
+        numbers = [Bill.objects.get(pk=r['bill_id']).bill_number for r in results]
+        self.assertEqual(len(set(numbers)), 10)
+        # One reservation (UPDATE + read back) for the whole batch
+        self.assertEqual(sum('billnumbersequence' in q['sql'] for q in ctx.captured_queries), 2)
+
+    def test_bad_or_contended_bills_fail_alone(self):
+        tampered = {**self._bill('tampered'), 'status': 'cancelled'}
+        new_customer = {**self._bill('new-customer', quantity=50), 'customer_details': {'phone': '8888', 'name': 'Ravi'}}
+        take, calls = services.take_stock, []
+
+        def contended_once(quantities):
+            calls.append(quantities)
+            if len(calls) == 1:
+                raise RuntimeError('Stock changed while it was being taken, please retry')
+            return take(quantities)
+
+        with mock.patch.object(services, 'take_stock', side_effect=contended_once):
+            results = sync_bills([self._bill('contended'), tampered, new_customer, self._bill('ok')])
+
+        self.assertEqual([r['status'] for r in results], ['failed', 'failed', 'failed', 'created'])
+        self.assertEqual(results[1]['message'], 'Unknown bill fields: status')
+        # The failed bill's customer went with its savepoint
+        self.assertFalse(Customer.objects.filter(phone='8888').exists())
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 4)
+        # A contended bill isn't remembered as failed, so a retry posts it
+        self.assertEqual(sync_bills([self._bill('contended')])[0]['status'], 'created')
+
+    def test_offline_bills_are_booked_on_their_sale_date(self):
+        sold_at = timezone.now() - timedelta(days=2)
+        yesterday = timezone.localdate() - timedelta(days=1)
+
+        results = sync_bills([
+            {**self._bill('old'), 'created_at': sold_at.isoformat()},
+            {**self._bill('ahead'), 'created_at': (timezone.now() + timedelta(hours=1)).isoformat()},
+            {**self._bill('garbled'), 'created_at': 'yesterday'},
+        ])
+
+        self.assertEqual([r['status'] for r in results], ['created', 'failed', 'failed'])
+        self.assertEqual(Bill.objects.get(pk=results[0]['bill_id']).created_at, sold_at)
+        self.assertEqual(sales_totals(date_to=yesterday)['total_sales'], Decimal('2.00'))
+        self.assertEqual(sales_totals(date_from=timezone.localdate())['total_bills'], 0)
+
+    def test_rejects_bills_without_a_key(self):
+        response = self._sync([self._bill('')])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Bill.objects.exists())
+
+
+class BillNumberAllocatorTests(TestCase):
+
+    def test_sequential_numbers(self):
+        allocator = BillNumberAllocator(block_size=1)
+        day = date(2026, 1, 2)
+
+        self.assertEqual(allocator.allocate(day), 'BILL-20260102-0001')
+        self.assertEqual(allocator.allocate(day), 'BILL-20260102-0002')
+        self.assertEqual(allocator.allocate(date(2026, 1, 3)), 'BILL-20260103-0001')
+
+    def test_continues_after_existing_bills(self):
+        Bill.objects.create(bill_number='BILL-20260102-0041', customer_name='X')
+
+        allocator = BillNumberAllocator(block_size=1)
+        self.assertEqual(allocator.allocate(date(2026, 1, 2)), 'BILL-20260102-0042')
+
+    def test_block_reservation_across_workers(self):
+        day = date(2026, 1, 2)
+        workers = [BillNumberAllocator(block_size=10) for _ in range(5)]
+
+        numbers = [workers[i % 5].allocate(day) for i in range(50)]
+
+        self.assertEqual(len(set(numbers)), 50)
+
+    def test_bill_save_uses_allocator(self):
+        first = Bill.objects.create(customer_name='A')
+        second = Bill.objects.create(customer_name='B')
+
+        self.assertNotEqual(first.bill_number, second.bill_number)
+
+
+@skipIf(connection.vendor == 'sqlite', 'SQLite serializes writers with table locks')
+class ConcurrentBillPostingTests(TransactionTestCase):
+
+    def test_concurrent_posts_get_unique_numbers(self):
+        medicine = make_medicine(quantity=1000)
+
+        def post(_):
+            try:
+                return post_bill(
+                    [{'medicine_id': medicine.id, 'quantity': 1}],
+                    customer_name='Walk-in Customer',
+                ).bill_number
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=50) as pool:
+            numbers = list(pool.map(post, range(50)))
+
+        self.assertEqual(len(set(numbers)), 50)
+        medicine.refresh_from_db()
+        self.assertEqual(medicine.quantity, 950)
+
+    def test_hot_sku_is_never_oversold(self):
+        medicine = make_medicine(quantity=50)
+
+        def sell(_):
+            sold = 0
+            try:
+                for _ in range(5):
+                    try:
+                        with transaction.atomic():
+                            take_stock({medicine.id: 1})
+                        sold += 1
+                    except InsufficientStock:
+                        pass
+            finally:
+                connection.close()
+            return sold
+
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            sold = sum(pool.map(sell, range(20)))
+
+        medicine.refresh_from_db()
+        self.assertEqual(sold, 50)
+        self.assertEqual(medicine.quantity, 0)
+
+
+class InventoryTests(TestCase):
+
+    def test_edit_form_moves_stock_by_the_change_made(self):
+        user = User.objects.create_user('admin', password='secret')
+        self.client.force_login(user)
+        medicine = make_medicine(quantity=100)
+        form = {
+            'name': 'Paracetamol 650', 'generic_name': 'Acetaminophen', 'category': 'tablet',
+            'manufacturer': 'Acme Pharma', 'description': '', 'reorder_level': 10, 'unit_price': '1.50',
+            'selling_price': '2.00', 'manufacturing_date': '2026-01-01', 'expiry_date': '2028-01-01',
+            'batch_number': 'B-Paracetamol', 'rack_number': '', 'original_quantity': 100,
+        }
+        # Sold after the form was opened
+        take_stock({medicine.pk: 5})
+
+        self.client.post(reverse('edit_medicine', args=[medicine.pk]), {**form, 'quantity': 120})
+        medicine.refresh_from_db()
+        self.assertEqual((medicine.name, medicine.quantity), ('Paracetamol 650', 115))
+        self.assertEqual(
+            list(StockTransaction.objects.values_list('transaction_type', 'quantity')), [('purchase', 20)],
+        )
+
+        # A decrease can't take the lot below zero
+        self.client.post(reverse('edit_medicine', args=[medicine.pk]), {**form, 'original_quantity': 200, 'quantity': 0})
+        medicine.refresh_from_db()
+        self.assertEqual(medicine.quantity, 115)
+        self.assertEqual(StockTransaction.objects.count(), 1)
+
+    def test_take_stock_is_all_or_nothing(self):
+        plenty = make_medicine('Plenty', quantity=10)
+        scarce = make_medicine('Scarce', quantity=1)
+
+        with self.assertRaises(InsufficientStock) as raised:
+            take_stock({plenty.id: 3, scarce.id: 2})
+
+        self.assertEqual(raised.exception.medicine, scarce)
+        self.assertEqual(
+            dict(Medicine.objects.values_list('name', 'quantity')), {'Plenty': 10, 'Scarce': 1}
+        )
+
+    def test_sale_after_the_checkout_read_is_caught_by_the_update(self):
+        plenty = make_medicine('Plenty', quantity=10)
+        scarce = make_medicine('Scarce', quantity=5)
+        read = Medicine.objects.in_bulk([plenty.id, scarce.id])
+        take_stock({scarce.id: 4})  # another counter sells after post_bill read the stock
+
+        # post_bill's friendly check passes on what it read; take_stock's UPDATE must not
+        with mock.patch.object(Medicine.objects, 'in_bulk', return_value=read):
+            with self.assertRaises(InsufficientStock) as raised:
+                post_bill(
+                    [{'medicine_id': plenty.id, 'quantity': 2}, {'medicine_id': scarce.id, 'quantity': 3}],
+                    customer_name='Walk-in Customer',
+                )
+
+        self.assertEqual((raised.exception.medicine, raised.exception.available), (scarce, 1))
+        self.assertEqual(
+            dict(Medicine.objects.values_list('name', 'quantity')), {'Plenty': 10, 'Scarce': 1}
+        )
+        self.assertFalse(Bill.objects.exists())
+        self.assertFalse(StockTransaction.objects.filter(transaction_type='sale').exists())
+
+    def test_restock_after_a_short_update_asks_for_a_retry(self):
+        scarce = make_medicine('Scarce', quantity=1)
+        restocked = []
+
+        def restock_before_locking_read(execute, sql, params, many, context):
+            if sql.startswith('SELECT') and not restocked:
+                restocked.append(sql)
+                Medicine.objects.filter(pk=scarce.id).update(quantity=F('quantity') + 10)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(restock_before_locking_read):
+            with self.assertRaisesMessage(RuntimeError, 'please retry'):
+                take_stock({scarce.id: 3})
+
+        scarce.refresh_from_db()
+        self.assertEqual(scarce.quantity, 11)
+
+    def test_take_and_return_stock(self):
+        first = make_medicine('First', quantity=10)
+        second = make_medicine('Second', quantity=5)
+
+        take_stock({first.id: 4, second.id: 5})
+        return_stock({first.id: 1})
+
+        self.assertEqual(
+            dict(Medicine.objects.values_list('name', 'quantity')), {'First': 7, 'Second': 0}
+        )
+
+    def test_bill_item_save_uses_conditional_decrement(self):
+        medicine = make_medicine(quantity=3)
+        stale = Medicine.objects.get(pk=medicine.pk)
+        bill = Bill.objects.create(customer_name='Walk-in Customer')
+        Medicine.objects.filter(pk=medicine.pk).update(quantity=2)  # another counter sold one
+
+        BillItem.objects.create(bill=bill, medicine=stale, quantity=2)
+        with self.assertRaises(InsufficientStock):
+            BillItem.objects.create(bill=bill, medicine=stale, quantity=1)
+
+        medicine.refresh_from_db()
+        self.assertEqual(medicine.quantity, 0)
+        self.assertEqual(stale.quantity, 0)
+        self.assertEqual(bill.items.count(), 1)
+        self.assertEqual(StockTransaction.objects.filter(bill_reference=bill.bill_number).count(), 1)
+
+
+class CancelBillsTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        self.customer = Customer.objects.create(name='Asha', phone='9999999999')
+
+    def _post(self, medicines, quantity=2):
+        return post_bill(
+            [{'medicine_id': m.id, 'quantity': quantity} for m in medicines],
+            created_by=self.user,
+            customer=self.customer,
+            customer_name='Asha',
+        )
+
+    def test_cancel_restores_stock_and_writes_returns(self):
+        first, second = make_medicine('First', quantity=10), make_medicine('Second', quantity=10)
+        bills = [self._post([first, second]), self._post([first])]
+
+        cancelled = cancel_bills([bill.id for bill in bills], performed_by=self.user)
+
+        self.assertEqual(len(cancelled), 2)
+        self.assertEqual(
+            dict(Medicine.objects.values_list('name', 'quantity')), {'First': 10, 'Second': 10}
+        )
+        self.assertEqual(set(Bill.objects.values_list('status', flat=True)), {'cancelled'})
+        returns = StockTransaction.objects.filter(transaction_type='return')
+        self.assertEqual(returns.count(), 3)
+        self.assertEqual(set(returns.values_list('bill_reference', flat=True)), {b.bill_number for b in bills})
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.completed_bills, self.customer.lifetime_spend), (0, 0))
+        self.assertEqual(sales_totals(status='completed')['total_bills'], 0)
+        self.assertEqual(sales_totals(status='cancelled')['total_bills'], 2)
+
+    def test_already_cancelled_bills_are_skipped(self):
+        medicine = make_medicine(quantity=10)
+        bill = self._post([medicine])
+        cancel_bills([bill.id])
+
+        self.assertEqual(cancel_bills([bill.id, 999]), [])
+        medicine.refresh_from_db()
+        self.assertEqual(medicine.quantity, 10)
+        response = self.client.post(reverse('cancel_bill', args=[bill.id]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_independent_of_item_count(self):
+        small = [make_medicine(f'Small {i}') for i in range(1)]
+        large = [make_medicine(f'Large {i}') for i in range(20)]
+        small_bills = [self._post(small) for _ in range(2)]
+        large_bills = [self._post(large) for _ in range(2)]
+        cancel_bills([self._post(small).id])  # creates today's cancelled rollup row
+
+        with CaptureQueriesContext(connection) as few_items:
+            cancel_bills([bill.id for bill in small_bills])
+        with CaptureQueriesContext(connection) as many_items:
+            cancel_bills([bill.id for bill in large_bills])
+
+        self.assertEqual(len(few_items), len(many_items))
+
+    def test_void_view(self):
+        medicine = make_medicine(quantity=10)
+        bills = [self._post([medicine]) for _ in range(3)]
+
+        response = self.client.post(
+            reverse('void_bills'),
+            data=json.dumps({'bill_ids': [bills[0].id, bills[2].id]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['cancelled'], sorted([bills[0].bill_number, bills[2].bill_number])
+        )
+        medicine.refresh_from_db()
+        self.assertEqual(medicine.quantity, 8)
+        bad = self.client.post(reverse('void_bills'), data='{"bill_ids": ["x"]}',
+                               content_type='application/json')
+        self.assertEqual(bad.status_code, 400)
+
+
+class RefundBillTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        self.customer = Customer.objects.create(name='Asha', phone='9999999999')
+        self.first = make_medicine('First', quantity=10)
+        self.second = make_medicine('Second', quantity=10)
+        self.bill = post_bill(
+            [{'medicine_id': self.first.id, 'quantity': 4, 'unit_price': '10.00'},
+             {'medicine_id': self.second.id, 'quantity': 2, 'unit_price': '5.00'}],
+            created_by=self.user,
+            customer=self.customer,
+            customer_name='Asha',
+            tax_percentage=Decimal('10'),
+        )
+        self.items = {item.medicine_id: item for item in self.bill.items.all()}
+
+    def _refund(self, **quantities):
+        lines = [
+            {'item_id': self.items[getattr(self, name).id].id, 'quantity': quantity}
+            for name, quantity in quantities.items()
+        ]
+        return refund_bill(self.bill.id, lines, reason='Recall', processed_by=self.user)
+
+    def test_partial_refund(self):
+        bill_refund = self._refund(first=1, second=2)
+
+        refund = bill_refund.refund_bill
+        self.assertEqual(refund.status, 'refunded')
+        self.assertEqual(refund.total_amount, Decimal('22.00'))  # (10 + 10) + 10% tax
+        self.assertEqual(bill_refund.refund_amount, Decimal('22.00'))
+        self.assertEqual(refund.items.count(), 2)
+        self.assertEqual(
+            dict(Medicine.objects.values_list('name', 'quantity')), {'First': 7, 'Second': 10}
+        )
+        self.bill.refresh_from_db()
+        self.assertEqual(self.bill.status, 'completed')
+        self.assertEqual(self.bill.refunded_amount, Decimal('22.00'))
+        self.assertEqual(
+            sorted(self.bill.items.values_list('refunded_quantity', flat=True)), [1, 2]
+        )
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.completed_bills, 1)
+        self.assertEqual(self.customer.lifetime_spend, Decimal('33.00'))
+        self.assertEqual(sales_totals()['total_sales'], Decimal('33.00'))
+
+    def test_refund_settles_credit_before_paying_back(self):
+        credit = post_bill(
+            [{'medicine_id': self.first.id, 'quantity': 5, 'unit_price': '10.00'}],
+            customer_name='Asha', payment_method='credit',
+        )
+        paid = post_bill(
+            [{'medicine_id': self.second.id, 'quantity': 5, 'unit_price': '10.00'}],
+            customer_name='Asha', payments=[{'payment_method': 'cash', 'amount': '20.00'}],
+        )
+        lines = lambda bill: [{'item_id': item.id, 'quantity': item.quantity} for item in bill.items.all()]
+
+        refund = refund_bill(credit.id, lines(credit)).refund_bill
+        self.assertEqual((refund.total_amount, refund.amount_paid), (Decimal('50.00'), Decimal('0.00')))
+        credit.refresh_from_db()
+        self.assertEqual(credit.amount_due, Decimal('0.00'))
+        self.assertNotIn(credit, outstanding_bills())
+
+        # 20.00 of 50.00 was paid: 30.00 owed comes off first, 20.00 goes back in cash
+        refund = refund_bill(paid.id, lines(paid)).refund_bill
+        self.assertEqual(refund.amount_paid, Decimal('20.00'))
+        paid.refresh_from_db()
+        self.assertEqual(paid.amount_due, Decimal('0.00'))
+
+    def test_cannot_refund_more_than_sold(self):
+        self._refund(first=3)
+        with self.assertRaises(ValueError):
+            self._refund(first=2)
+
+        self.assertEqual(Medicine.objects.get(pk=self.first.pk).quantity, 9)
+        self.assertEqual(BillRefund.objects.count(), 1)
+
+    def test_refunding_a_line_in_parts_returns_its_exact_total(self):
+        bill = post_bill(
+            [{'medicine_id': self.first.id, 'quantity': 3, 'unit_price': '3.24'}],
+            customer=self.customer, customer_name='Asha', tax_percentage=Decimal('10'),
+        )
+        item = bill.items.get()  # 9.72 + 10% tax = 10.69, while each unit alone rounds to 3.56
+
+        refunds = [refund_bill(bill.id, [{'item_id': item.id, 'quantity': 1}]).refund_amount for _ in range(3)]
+
+        self.assertEqual(sum(refunds), Decimal('10.69'))
+        bill.refresh_from_db()
+        self.assertEqual(bill.refunded_amount, Decimal('10.69'))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.lifetime_spend, Decimal('55.00'))
+        self.assertEqual(sales_totals()['total_sales'], Decimal('55.00'))
+
+    def test_aggregates_survive_a_rebuild(self):
+        self._refund(first=1)
+        customer_before = Customer.objects.values_list('completed_bills', 'lifetime_spend').get()
+        totals_before = sales_totals()
+
+        recompute_customer_stats()
+        rebuild_daily_sales()
+
+        self.assertEqual(Customer.objects.values_list('completed_bills', 'lifetime_spend').get(), customer_before)
+        self.assertEqual(sales_totals(), totals_before)
+
+    def test_bills_with_refunds_cannot_be_cancelled(self):
+        refund = self._refund(first=1).refund_bill
+
+        self.assertEqual(cancel_bills([self.bill.id, refund.id]), [])
+
+    def test_query_count_independent_of_line_count(self):
+        medicines = [make_medicine(f'Med {i}') for i in range(20)]
+        big = post_bill([{'medicine_id': m.id, 'quantity': 1} for m in medicines], customer_name='X')
+        self._refund(first=1)  # creates today's refunded rollup row
+
+        with CaptureQueriesContext(connection) as one_line:
+            self._refund(first=1)
+        with CaptureQueriesContext(connection) as twenty_lines:
+            refund_bill(big.id, [{'item_id': pk, 'quantity': 1} for pk in big.items.values_list('pk', flat=True)])
+
+        self.assertEqual(len(one_line), len(twenty_lines))
+
+    def test_refund_view(self):
+        response = self.client.post(
+            reverse('refund_bill', args=[self.bill.id]),
+            data=json.dumps({'items': [{'item_id': self.items[self.first.id].id, 'quantity': 2}]}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['refund_amount'], '22.00')
+        over = self.client.post(
+            reverse('refund_bill', args=[self.bill.id]),
+            data=json.dumps({'items': [{'item_id': self.items[self.first.id].id, 'quantity': 5}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(over.status_code, 400)
+
+
+class SplitPaymentTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        self.medicine = make_medicine(quantity=50)
+
+    def _post(self, payments=None, **fields):
+        return post_bill(
+            [{'medicine_id': self.medicine.id, 'quantity': 5, 'unit_price': '20.00'}],
+            created_by=self.user,
+            payments=payments,
+            customer_name='Asha',
+            **fields,
+        )
+
+    def test_split_checkout(self):
+        bill = self._post([
+            {'payment_method': 'cash', 'amount': '40'},
+            {'payment_method': 'upi', 'amount': '35.50', 'transaction_reference': 'UPI123'},
+            {'payment_method': 'card', 'amount': 10},
+        ])
+
+        bill.refresh_from_db()
+        self.assertEqual(bill.payment_method, 'split')
+        self.assertEqual(bill.amount_paid, Decimal('85.50'))
+        self.assertEqual(bill.amount_due, Decimal('14.50'))
+        self.assertEqual(
+            sorted(bill.payments.values_list('payment_method', 'amount')),
+            [('card', Decimal('10.00')), ('cash', Decimal('40.00')), ('upi', Decimal('35.50'))],
+        )
+        self.assertEqual(list(outstanding_bills()), [bill])
+
+    def test_credit_is_not_a_tender(self):
+        with self.assertRaises(ValueError):
+            self._post([{'payment_method': 'credit', 'amount': 10}])
+        self.assertFalse(Bill.objects.exists())
+
+    def test_collecting_payments_settles_balance(self):
+        bill = self._post(payment_method='credit')
+        self.assertEqual(list(outstanding_bills()), [bill])
+
+        record_payments(bill.id, [{'payment_method': 'cash', 'amount': 60}])
+        bill = record_payments(bill.id, [{'payment_method': 'upi', 'amount': 40}])
+
+        self.assertEqual((bill.amount_paid, bill.amount_due), (Decimal('100.00'), Decimal('0.00')))
+        self.assertEqual(bill.payments.count(), 2)
+        self.assertFalse(outstanding_bills().exists())
+
+    def test_create_bill_records_single_tender(self):
+        response = self.client.post(reverse('create_bill'), data=json.dumps({
+            'items': [{'medicine_id': self.medicine.id, 'quantity': 1}],
+            'customer_name': 'Asha',
+            'payment_method': 'upi',
+            'amount_paid': 2,
+        }), content_type='application/json')
+
+        bill = Bill.objects.get(pk=response.json()['bill_id'])
+        self.assertEqual(list(bill.payments.values_list('payment_method', 'amount')), [('upi', Decimal('2.00'))])
+
+    def test_credit_ledger_view(self):
+        bill = self._post(payment_method='credit')
+        self._post([{'payment_method': 'cash', 'amount': 100}])
+
+        response = self.client.get(reverse('credit_ledger'))
+        self.assertEqual([b.pk for b in response.context['bills']], [bill.pk])
+        self.assertEqual(response.context['total_due'], Decimal('100.00'))
+
+        collect = self.client.post(
+            reverse('collect_payment', args=[bill.id]),
+            data=json.dumps({'payments': [{'payment_method': 'cash', 'amount': 30}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(collect.json()['amount_due'], '70.00')
+
+
+class FefoAllocationTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.expired = make_medicine(quantity=50, batch_number='OLD', expiry_date=today - timedelta(days=1))
+        self.late = make_medicine(quantity=10, batch_number='LATE', expiry_date=today + timedelta(days=300))
+        self.soon = make_medicine(quantity=3, batch_number='SOON', expiry_date=today + timedelta(days=20))
+        self.other = make_medicine('Ibuprofen', quantity=5)
+
+    def test_sells_earliest_expiring_lots_first(self):
+        bill = post_bill(
+            [{'medicine_id': self.late.id, 'quantity': 5, 'fefo': True}],
+            customer_name='Walk-in Customer',
+        )
+
+        self.assertEqual(
+            list(bill.items.order_by('id').values_list('batch_number', 'quantity')),
+            [('SOON', 3), ('LATE', 2)],
+        )
+        self.assertEqual(
+            dict(Medicine.objects.filter(name='Paracetamol').values_list('batch_number', 'quantity')),
+            {'OLD': 50, 'SOON': 0, 'LATE': 8},
+        )
+
+    def test_expired_stock_is_never_sold(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            post_bill([{'medicine_id': self.expired.id, 'quantity': 14, 'fefo': True}], customer_name='X')
+        self.assertEqual(raised.exception.available, 13)
+
+        with self.assertRaises(ValueError):
+            post_bill([{'medicine_id': self.expired.id, 'quantity': 1}], customer_name='X')
+        self.assertEqual(Medicine.objects.get(pk=self.expired.pk).quantity, 50)
+
+    def test_lines_for_the_same_product_share_the_lots(self):
+        bill = post_bill(
+            [{'medicine_id': self.soon.id, 'quantity': 2, 'fefo': True},
+             {'medicine_id': self.other.id, 'quantity': 1},
+             {'medicine_id': self.late.id, 'quantity': 2, 'fefo': True}],
+            customer_name='Walk-in Customer',
+        )
+
+        self.assertEqual(
+            list(bill.items.order_by('id').values_list('batch_number', 'quantity')),
+            [('SOON', 2), ('B-Ibuprofen', 1), ('SOON', 1), ('LATE', 1)],
+        )
+
+    def test_query_count_independent_of_lot_count(self):
+        today = timezone.now().date()
+        for i in range(20):
+            make_medicine('Cetirizine', quantity=1, batch_number=f'C{i}', expiry_date=today + timedelta(days=30 + i))
+        cetirizine = Medicine.objects.filter(name='Cetirizine').first()
+        post_bill([{'medicine_id': self.other.id, 'quantity': 1, 'fefo': True}], customer_name='X')
+
+        with CaptureQueriesContext(connection) as one_lot:
+            post_bill([{'medicine_id': self.other.id, 'quantity': 1, 'fefo': True}], customer_name='X')
+        with CaptureQueriesContext(connection) as many_lots:
+            post_bill([{'medicine_id': cetirizine.id, 'quantity': 20, 'fefo': True}], customer_name='X')
+
+        self.assertEqual(len(one_lot), len(many_lots))
+
+    def test_search_returns_one_row_per_product(self):
+        index = MedicineSearchIndex()
+        products = index.search_products('para')
+
+        self.assertEqual([(lot.batch_number, units, lots) for lot, units, lots in products], [('SOON', 13, 2)])
+
+        # A warm index answers a keystroke with one stock query, which sees sales
+        post_bill([{'medicine_id': self.soon.id, 'quantity': 3}], customer_name='X')
+        with self.assertNumQueries(1):
+            products = index.search_products('para')
+        lot, units, lots = products[0]
+        self.assertEqual((lot.pk, lot.quantity, lot.selling_price, units, lots), (self.late.pk, 10, Decimal('2.00'), 10, 1))
+
+
+class ExpiryWriteOffTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.expired = make_medicine('Expired', quantity=7, expiry_date=today - timedelta(days=3))
+        self.empty = make_medicine('Empty', quantity=0, expiry_date=today - timedelta(days=3))
+        self.soon = make_medicine('Soon', quantity=4, expiry_date=today + timedelta(days=10))
+        self.fresh = make_medicine('Fresh', quantity=9)
+
+    def test_write_off_is_idempotent(self):
+        self.assertEqual(write_off_expired(batch_size=1), (1, 7))
+        self.assertEqual(write_off_expired(), (0, 0))
+
+        self.expired.refresh_from_db()
+        self.assertEqual(self.expired.quantity, 0)
+        written_off = StockTransaction.objects.get(transaction_type='expired')
+        self.assertEqual((written_off.medicine, written_off.quantity), (self.expired, 7))
+        self.assertEqual(written_off.total_amount, Decimal('10.50'))
+
+    def test_writes_off_lots_expiring_today(self):
+        today = make_medicine('Today', quantity=50, expiry_date=timezone.now().date())
+
+        self.assertEqual(write_off_expired(), (2, 57))
+        today.refresh_from_db()
+        self.assertEqual(today.quantity, 0)
+        self.assertNotIn(today, Medicine.objects.expiring_within(30))
+
+    def test_expiring_within(self):
+        self.assertEqual(list(Medicine.objects.expiring_within(30)), [self.soon])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('expire_stock', '--days', '30', stdout=out)
+
+        self.assertIn('Soon (B-Soon): 4 units', out.getvalue())
+        self.assertIn('Wrote off 7 units across 1 expired lot(s)', out.getvalue())
+
+    def test_dry_run_writes_nothing(self):
+        call_command('expire_stock', '--dry-run', stdout=StringIO())
+
+        self.assertFalse(StockTransaction.objects.filter(transaction_type='expired').exists())
+
+
+class ReorderPlannerTests(TestCase):
+
+    def setUp(self):
+        self.medicine = make_medicine(quantity=100)
+        for _ in range(3):
+            post_bill([{'medicine_id': self.medicine.id, 'quantity': 10}], customer_name='X')
+        # Stock edits are 'sale' rows too, but not demand
+        StockTransaction.objects.create(
+            medicine=self.medicine, transaction_type='sale', quantity=50,
+            price_per_unit=1, total_amount=50, notes='Stock adjusted from 120 to 70 via edit',
+        )
+
+    def test_rollup_is_incremental(self):
+        self.assertEqual(refresh_daily_demand(settle_lag=timedelta(0)), 4)
+        self.assertEqual(refresh_daily_demand(settle_lag=timedelta(0)), 0)
+
+        bill = post_bill([{'medicine_id': self.medicine.id, 'quantity': 5}], customer_name='X')
+        cancel_bills([bill.id])
+        self.assertEqual(refresh_daily_demand(settle_lag=timedelta(0)), 2)
+
+        row = MedicineDailyDemand.objects.get()
+        self.assertEqual((row.units_sold, row.units_returned), (35, 5))
+
+    def test_recent_rows_wait_for_the_settle_lag(self):
+        self.assertEqual(refresh_daily_demand(), 0)
+        self.assertFalse(MedicineDailyDemand.objects.exists())
+
+    def test_suggestions(self):
+        refresh_daily_demand(settle_lag=timedelta(0))
+
+        [suggestion] = reorder_suggestions(lead_time_days=7, review_days=14, service_level=0.95)
+
+        self.assertEqual(suggestion['product'], 'Paracetamol')
+        self.assertEqual(suggestion['units_30d'], 30)
+        self.assertEqual(suggestion['daily_demand'], 1.0)
+        self.assertEqual(suggestion['on_hand'], 70)
+        # 7 days of demand plus safety stock for a single 30 unit day
+        self.assertEqual(suggestion['reorder_point'], 7 + math.ceil(1.6448536 * pstdev([30] + [0] * 29) * math.sqrt(7)))
+        self.assertEqual(suggestion['suggested_quantity'], 0)
+
+        Medicine.objects.filter(pk=self.medicine.pk).update(quantity=5)
+        [suggestion] = reorder_suggestions(lead_time_days=7, review_days=14, service_level=0.95)
+        self.assertEqual(suggestion['suggested_quantity'], suggestion['reorder_point'] + 14 - 5)
+
+    def test_rebuild_matches_incremental(self):
+        refresh_daily_demand(settle_lag=timedelta(0))
+        incremental = list(MedicineDailyDemand.objects.values_list('medicine', 'date', 'units_sold', 'units_returned'))
+
+        rebuild_daily_demand(settle_lag=timedelta(0))
+
+        self.assertEqual(
+            list(MedicineDailyDemand.objects.values_list('medicine', 'date', 'units_sold', 'units_returned')),
+            incremental,
+        )
+
+
+class PurchasingTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pw')
+        self.para = make_medicine(quantity=10)  # 10 on hand at 1.50
+        self.amox = make_medicine('Amoxicillin', quantity=0, batch_number='B-Amox')
+
+    def test_receipt_updates_stock_cost_and_ledger(self):
+        lines = [
+            {'medicine_id': self.para.id, 'quantity': 20, 'unit_cost': '2.00'},
+            {'medicine_id': self.amox.id, 'quantity': 5, 'unit_cost': '3.10'},
+            {'medicine_id': self.para.id, 'quantity': 10, 'unit_cost': '2.50'},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            receipt = receive_goods(lines, received_by=self.user, supplier_name='Wholesaler')
+        writes = len(ctx.captured_queries)
+
+        self.para.refresh_from_db()
+        self.amox.refresh_from_db()
+        self.assertEqual(self.para.quantity, 40)
+        # (10 * 1.50 + 20 * 2.00 + 10 * 2.50) / 40
+        self.assertEqual(self.para.unit_price, Decimal('2.00'))
+        self.assertEqual((self.amox.quantity, self.amox.unit_price), (5, Decimal('3.10')))
+        self.assertEqual(receipt.total_amount, Decimal('80.50'))
+        self.assertEqual(
+            sorted(receipt.items.values_list('medicine_id', 'quantity', 'unit_cost')),
+            sorted([(self.para.id, 30, Decimal('2.17')), (self.amox.id, 5, Decimal('3.10'))]),
+        )
+        purchases = StockTransaction.objects.filter(transaction_type='purchase', bill_reference=receipt.number)
+        self.assertEqual(sorted(purchases.values_list('quantity', flat=True)), [5, 30])
+
+        # The statement count doesn't grow with the number of lines
+        more = [make_medicine(f'Extra {i}', batch_number=f'B-X{i}') for i in range(20)]
+        lines = [{'medicine_id': m.id, 'quantity': 1, 'unit_cost': 1} for m in more]
+        with CaptureQueriesContext(connection) as ctx:
+            receive_goods(lines, supplier_name='Wholesaler')
+        self.assertEqual(len(ctx.captured_queries), writes)
+
+    def test_bad_line_rolls_back_everything(self):
+        lines = [
+            {'medicine_id': self.para.id, 'quantity': 5, 'unit_cost': 1},
+            {'medicine_id': 999999, 'quantity': 5, 'unit_cost': 1},
+        ]
+        with self.assertRaises(Medicine.DoesNotExist):
+            receive_goods(lines, supplier_name='Wholesaler')
+        with self.assertRaises(ValueError):
+            receive_goods([{'medicine_id': self.para.id, 'quantity': 0, 'unit_cost': 1}],
+                          supplier_name='Wholesaler')
+
+        self.para.refresh_from_db()
+        self.assertEqual(self.para.quantity, 10)
+        self.assertFalse(GoodsReceipt.objects.exists())
+
+    def test_receiving_against_purchase_order(self):
+        order = create_purchase_order('Wholesaler', [
+            {'medicine_id': self.para.id, 'quantity': 20, 'unit_cost': '1.50'},
+            {'medicine_id': self.amox.id, 'quantity': 10, 'unit_cost': '3.00'},
+        ])
+
+        receive_goods([{'medicine_id': self.para.id, 'quantity': 20, 'unit_cost': '1.50'}],
+                      purchase_order_id=order.id)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'partially_received')
+
+        with self.assertRaises(ValueError):
+            receive_goods([{'medicine_id': self.amox.id, 'quantity': 11, 'unit_cost': 3}],
+                          purchase_order_id=order.id)
+        with self.assertRaises(ValueError):
+            receive_goods([{'medicine_id': self.para.id, 'quantity': 1, 'unit_cost': 1}],
+                          purchase_order_id=order.id)
+
+        receipt = receive_goods([{'medicine_id': self.amox.id, 'quantity': 10, 'unit_cost': 3}],
+                                purchase_order_id=order.id)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'received')
+        self.assertEqual(receipt.supplier_name, 'Wholesaler')
+        self.assertEqual(
+            list(order.items.values_list('quantity_received', flat=True)), [20, 10]
+        )
+
+    def test_receive_goods_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse('receive_goods'),
+            data=json.dumps({
+                'supplier_name': 'Wholesaler',
+                'invoice_number': 'INV-1',
+                'items': [{'medicine_id': self.para.id, 'quantity': 5, 'unit_cost': '1.50'}],
+            }),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+
+        response = self.client.post(
+            reverse('receive_goods'),
+            data=json.dumps({
+                'purchase_order_id': 999999,
+                'items': [{'medicine_id': self.para.id, 'quantity': 5, 'unit_cost': 1}],
+            }),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+
+        response = self.client.get(reverse('purchase_orders'))
+        self.assertEqual(response.status_code, 200)
+
+
+class StockReconciliationTests(TestCase):
+
+    def setUp(self):
+        self.medicine = make_medicine(quantity=100)
+        StockTransaction.objects.create(
+            medicine=self.medicine, transaction_type='purchase', quantity=100,
+            price_per_unit=1, total_amount=100, notes='Initial stock',
+        )
+        # Settled, so the default lag replays it too
+        StockTransaction.objects.update(transaction_date=timezone.now() - timedelta(hours=1))
+        self.lag = timedelta(0)
+
+    def test_replays_only_rows_since_the_checkpoint(self):
+        first = reconcile_stock(settle_lag=self.lag)
+        self.assertEqual((first.replayed, first.discrepancies), (1, []))
+        self.assertEqual(list(first.checkpoint.snapshots.values_list('quantity', flat=True)), [100])
+
+        post_bill([{'medicine_id': self.medicine.id, 'quantity': 10}], customer_name='X')
+        second = reconcile_stock(settle_lag=self.lag)
+        self.assertEqual((second.replayed, second.discrepancies), (1, []))
+        self.assertEqual(list(second.checkpoint.snapshots.values_list('quantity', flat=True)), [90])
+
+    def test_unsettled_rows_are_not_reported_as_drift(self):
+        reconcile_stock(settle_lag=self.lag)
+        post_bill([{'medicine_id': self.medicine.id, 'quantity': 10}], customer_name='X')
+
+        result = reconcile_stock()
+        self.assertEqual((result.replayed, result.discrepancies), (0, []))
+        self.assertEqual(reconcile_stock(settle_lag=self.lag).replayed, 1)
+
+    def test_reports_and_repairs_drift(self):
+        Medicine.objects.filter(pk=self.medicine.pk).update(quantity=97)
+
+        result = reconcile_stock(checkpoint=False, settle_lag=self.lag)
+        self.assertEqual(result.discrepancies, [(self.medicine.id, 100, 97)])
+        self.assertFalse(StockCheckpoint.objects.exists())
+
+        self.assertTrue(reconcile_stock(repair=True, settle_lag=self.lag).repaired)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 100)
+        self.assertEqual(reconcile_stock(settle_lag=self.lag).discrepancies, [])
+
+    def test_sale_between_the_stock_and_ledger_reads_is_not_drift(self):
+        movements, calls = reconciliation._movements, []
+
+        def sell_after_the_stock_read(transactions):
+            calls.append(transactions)
+            if len(calls) == 2:
+                # The unlocked pass has read stock and now reads the ledger tail
+                post_bill([{'medicine_id': self.medicine.id, 'quantity': 10}], customer_name='X')
+            return movements(transactions)
+
+        with mock.patch.object(reconciliation, '_movements', side_effect=sell_after_the_stock_read):
+            result = reconcile_stock(repair=True, settle_lag=self.lag)
+
+        # The sale made the medicine a candidate; the locked re-check cleared it
+        self.assertEqual(len(calls), 3)
+        self.assertEqual((result.discrepancies, result.repaired, result.checkpoint.discrepancies), ([], False, 0))
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity, 90)
+
+    def test_old_checkpoints_are_pruned(self):
+        for _ in range(KEEP_CHECKPOINTS + 2):
+            reconcile_stock(settle_lag=self.lag)
+        self.assertEqual(StockCheckpoint.objects.count(), KEEP_CHECKPOINTS)
+        self.assertEqual(StockSnapshot.objects.count(), KEEP_CHECKPOINTS)
+
+    def test_command(self):
+        Medicine.objects.filter(pk=self.medicine.pk).update(quantity=95)
+        out = StringIO()
+        call_command('reconcile_stock', '--no-checkpoint', stdout=out)
+
+        self.assertIn('Paracetamol (B-Paracetamol): ledger 100, stock 95, drift -5', out.getvalue())
+
+
+class DashboardMetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cashier', password='pw')
+        self.para = make_medicine(quantity=50)
+        make_medicine('Low', quantity=3, reorder_level=10)
+        make_medicine('Out', quantity=0)
+        make_medicine('Old', quantity=5, expiry_date=timezone.now().date() - timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bill = post_bill(
+                [{'medicine_id': self.para.id, 'quantity': 2, 'unit_price': '2.00'}],
+                created_by=self.user, customer_name='Walk-in Customer', payment_method='credit',
+            )
+
+    def test_metrics_and_cache_hit(self):
+        with self.assertNumQueries(7):
+            metrics = dashboard.dashboard_metrics()
+
+        self.assertEqual(
+            (metrics['total_medicines'], metrics['low_stock_count'], metrics['expired_count'], metrics['out_of_stock']),
+            (4, 3, 1, 1),
+        )
+        self.assertEqual((metrics['today_bills'], metrics['today_sales']), (1, Decimal('4.00')))
+        self.assertEqual((metrics['pending_bills'], metrics['pending_amount']), (1, Decimal('4.00')))
+        self.assertEqual(metrics['stock_value'], Decimal('84.00'))  # (48 + 3 + 5) * 1.50
+        self.assertEqual(
+            metrics['cashier_shifts'],
+            [{'user_id': self.user.pk, 'username': 'cashier', 'bills': 1, 'sales': Decimal('4.00')}],
+        )
+        self.assertEqual([b['bill_number'] for b in metrics['recent_bills']], [self.bill.bill_number])
+        self.assertEqual([m['name'] for m in metrics['low_stock_medicines']], ['Out', 'Low'])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard.dashboard_metrics(), metrics)
+
+    def test_writes_invalidate_after_commit(self):
+        dashboard.dashboard_metrics()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_payments(self.bill.pk, [{'payment_method': 'cash', 'amount': '4.00'}])
+        self.assertEqual(dashboard.dashboard_metrics()['pending_bills'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            receive_goods([{'medicine_id': self.para.id, 'quantity': 10, 'unit_cost': '1.50'}], supplier_name='W')
+        self.assertEqual(dashboard.dashboard_metrics()['stock_value'], Decimal('99.00'))
+
+        # While another worker is refreshing, the previous figures are served as they are
+        cache.add(dashboard.DASHBOARD_REFRESH_KEY, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            cancel_bills([self.bill.pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard.dashboard_metrics()['today_bills'], 1)
+        cache.delete(dashboard.DASHBOARD_REFRESH_KEY)
+        self.assertEqual(dashboard.dashboard_metrics()['today_bills'], 0)
+
+    def test_dashboards_render(self):
+        for name in ('dashboard', 'user_dashboard'):
+            self.assertEqual(self.client.get(reverse(name)).status_code, 302)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, self.bill.bill_number)
+        response = self.client.get(reverse('user_dashboard'))
+        self.assertEqual(response.context['total_orders'], 1)
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        view_metrics.reset()
+        self.user = User.objects.create_user('cashier', password='pw', is_staff=True)
+        self.client.force_login(self.user)
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(reverse('bill_list'))
+        self.assertRegex(
+            response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, total;dur=[\d.]+$'
+        )
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('medical_view_requests_total{view="bill_list",method="GET"} 1', body)
+        self.assertIn('medical_view_duration_seconds_count{view="bill_list",method="GET"} 1', body)
+
+    @override_settings(PROFILING_METRICS_TOKEN='s3cret')
+    def test_metrics_need_staff_or_token(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403
+        )
+        self.assertEqual(
+            self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200
+        )
+
+        self.client.force_login(User.objects.create_user('counter', password='pw'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    def test_flags_repeated_query_shapes(self):
+        medicines = [make_medicine(f'Med {i}', batch_number=f'B{i}') for i in range(5)]
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            for medicine in medicines:
+                Medicine.objects.get(pk=medicine.pk)
+            Medicine.objects.filter(pk__in=[m.pk for m in medicines[:2]]).count()
+            Medicine.objects.filter(pk__in=[m.pk for m in medicines]).count()
+
+        repeated = profile.repeated_queries(5)
+        self.assertEqual([count for _, count in repeated], [5])
+        self.assertEqual(profile.queries, 7)
+
+    def test_disabled_by_default(self):
+        with override_settings(PROFILING_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+class BenchmarkSuiteTests(TestCase):
+
+    def setUp(self):
+        call_command('generate_dataset', '--medicines', '40', '--customers', '5', '--bills', '60',
+                     '--days', '3', stdout=StringIO())
+
+    def test_generated_dataset_is_consistent(self):
+        self.assertEqual(Bill.objects.count(), 60)
+        self.assertEqual(Medicine.objects.count(), 40)
+        self.assertEqual(
+            StockTransaction.objects.filter(transaction_type='sale').count(), BillItem.objects.count()
+        )
+        self.assertEqual(reconcile_stock(checkpoint=False, settle_lag=timedelta(0)).discrepancies, [])
+        self.assertEqual(
+            DailySalesSummary.objects.aggregate(n=Sum('bill_count'))['n'], Bill.objects.count()
+        )
+
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', '--medicines', '1', stdout=StringIO())
+
+    def test_runner_reports_every_path_and_rolls_back(self):
+        bills = Bill.objects.count()
+        report = BenchmarkRunner(iterations=2, warmup=0).run()
+
+        self.assertEqual(set(report['results']), set(BenchmarkRunner.PATHS))
+        self.assertEqual(report['results']['create_bill']['status_codes'], {'200': 2})
+        self.assertGreater(report['results']['bill_list']['queries_p50'], 0)
+        self.assertEqual(Bill.objects.count(), bills)
+        self.assertEqual(compare(report, report)['bill_list']['p50_change_pct'], 0)
+
+
+class MedicineStockStatusTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.in_stock = make_medicine('Fine', quantity=50)
+        self.low = make_medicine('Low', quantity=5)
+        self.out = make_medicine('Out', quantity=0)
+        self.expired = make_medicine('Old', quantity=50, expiry_date=today - timedelta(days=1))
+
+    def test_annotation_matches_property(self):
+        for medicine in Medicine.objects.with_stock_status():
+            self.assertEqual(
+                medicine.stock_status,
+                Medicine.objects.get(pk=medicine.pk).stock_status,
+            )
+        statuses = dict(Medicine.objects.with_stock_status().values_list('name', 'stock_status'))
+        self.assertEqual(statuses, {
+            'Fine': 'in_stock', 'Low': 'low_stock', 'Out': 'out_of_stock', 'Old': 'expired',
+        })
+
+    def test_a_lot_expiring_today_is_expired_everywhere(self):
+        today = make_medicine('Today', quantity=50, expiry_date=timezone.now().date())
+
+        self.assertEqual(today.stock_status, 'expired')
+        self.assertEqual(Medicine.objects.with_stock_status().get(pk=today.pk).stock_status, 'expired')
+        self.assertIn(today, Medicine.objects.expired())
+        self.assertNotIn(today, Medicine.objects.not_expired())
+        self.assertEqual(MedicineSearchIndex().search('today'), [])
+        with self.assertRaises(ValueError):
+            post_bill([{'medicine_id': today.id, 'quantity': 1}], customer_name='X')
+
+    def test_stock_counts(self):
+        with self.assertNumQueries(1):
+            counts = Medicine.objects.stock_counts()
+
+        self.assertEqual(counts, {
+            'total_medicines': 4, 'low_stock_count': 2, 'expired_count': 1, 'out_of_stock': 1,
+        })
+
+    def test_medicine_stock_view_filters(self):
+        user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('medicine_stock'), {'stock_status': 'low'})
+        self.assertEqual({m.name for m in response.context['medicines']}, {'Low', 'Out'})
+
+        response = self.client.get(reverse('medicine_stock'), {'stock_status': 'expired'})
+        self.assertEqual({m.name for m in response.context['medicines']}, {'Old'})
+        self.assertEqual(response.context['low_stock_count'], 2)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        # Two bills share a timestamp to exercise the id tie-breaker
+        stamp = timezone.now()
+        for i in range(5):
+            bill = Bill.objects.create(customer_name=f'Customer {i}')
+            Bill.objects.filter(pk=bill.pk).update(
+                created_at=stamp - timedelta(minutes=min(i, 3))
+            )
+        self.expected = list(Bill.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def _page(self, **params):
+        request = RequestFactory().get('/bills/', {'status': 'completed', **params})
+        return paginate_keyset(request, Bill.objects.all(), per_page=2)
+
+    def test_walks_forward_and_back(self):
+        seen = []
+        page = self._page()
+        self.assertFalse(page.has_previous)
+        while True:
+            seen.extend(bill.pk for bill in page)
+            if not page.has_next:
+                break
+            page = self._page(after=page.next_cursor)
+        self.assertEqual(seen, self.expected)
+
+        back = self._page(before=page.previous_cursor)
+        self.assertEqual([bill.pk for bill in back], self.expected[2:4])
+        self.assertTrue(back.has_previous)
+        self.assertIn('status=completed', back.next_querystring)
+        self.assertNotIn('before=', back.next_querystring)
+
+    def test_query_count_is_flat(self):
+        page = self._page()
+        with self.assertNumQueries(1):
+            self._page(after=page.next_cursor)
+
+    def test_malformed_cursor_falls_back_to_first_page(self):
+        self.assertIsNone(decode_cursor('not-a-cursor'))
+        page = self._page(after='not-a-cursor')
+        self.assertEqual([bill.pk for bill in page], self.expected[:2])
+
+    def test_list_views_are_paginated(self):
+        user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(user)
+
+        for name in ('bill_list', 'medicine_stock', 'staff_list'):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('page', response.context)
+
+
+class MedicineSearchIndexTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.index = MedicineSearchIndex()
+        make_medicine('Paracetamol 500', generic_name='Acetaminophen', batch_number='PX100')
+        make_medicine('Calpol', generic_name='Paracetamol', batch_number='CP200')
+        make_medicine('Pantoprazole', generic_name='Pantoprazole', batch_number='PT300')
+        make_medicine('Paracetamol Syrup', quantity=0, batch_number='PS400')
+        make_medicine('Paracip', expiry_date=today - timedelta(days=1), batch_number='PC500')
+
+    def _names(self, query):
+        return [m.name for m in self.index.search(query)]
+
+    def test_ranks_name_prefix_before_generic_name(self):
+        self.assertEqual(self._names('para'), ['Paracetamol 500', 'Calpol'])
+
+    def test_skips_out_of_stock_and_expired(self):
+        self.assertNotIn('Paracetamol Syrup', self._names('paracetamol'))
+        self.assertNotIn('Paracip', self._names('parac'))
+
+    def test_multi_word_and_batch_queries(self):
+        self.assertEqual(self._names('para 500'), ['Paracetamol 500'])
+        self.assertEqual(self._names('pt3'), ['Pantoprazole'])
+        self.assertEqual(self._names('zzz'), [])
+
+    def test_medicine_save_invalidates_index(self):
+        self.assertEqual(self._names('amox'), [])
+        make_medicine('Amoxicillin')
+        self.assertEqual(self._names('amox'), ['Amoxicillin'])
+
+    def test_only_text_and_expiry_edits_invalidate_index(self):
+        medicine = Medicine.objects.get(name='Calpol')
+        version = MedicineSearchIndex.current_version()
+
+        medicine.quantity = 5
+        medicine.save()
+        # The edit form posts the unchanged expiry date back as a string
+        medicine.expiry_date = medicine.expiry_date.isoformat()
+        medicine.save()
+        self.assertEqual(MedicineSearchIndex.current_version(), version)
+
+        medicine.name = 'Calpol Plus'
+        medicine.save()
+        self.assertNotEqual(MedicineSearchIndex.current_version(), version)
+        self.assertEqual(self._names('calpol p'), ['Calpol Plus'])
+
+    def test_search_view(self):
+        user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(user)
+
+        response = self.client.get(reverse('search_medicine_ajax'), {'q': 'pan'})
+
+        self.assertEqual([m['name'] for m in response.json()['medicines']], ['Pantoprazole'])
+
+
+class AsyncLookupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cashier', password='pw')
+        self.async_client.force_login(self.user)
+        self.medicine = make_medicine('Paracetamol 500', quantity=10)
+        make_medicine('Calpol', generic_name='Paracetamol', quantity=0)
+        Customer.objects.create(name='Asha Rao', phone='9876500000')
+        Customer.objects.create(name='Ravi', phone='9123400000')
+
+    async def test_search_and_details(self):
+        response = await self.async_client.get(reverse('search_medicine_ajax'), {'q': 'para'})
+        self.assertEqual([m['id'] for m in response.json()['medicines']], [self.medicine.id])
+
+        response = await self.async_client.get(reverse('get_medicine_details', args=[self.medicine.id]))
+        self.assertEqual(response.json()['available_quantity'], 10)
+        response = await self.async_client.get(reverse('get_medicine_details', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_customer_lookup(self):
+        for query, names in (('98765', ['Asha Rao']), ('ash', ['Asha Rao']), ('91', [])):
+            response = await self.async_client.get(reverse('lookup_customers'), {'q': query})
+            self.assertEqual([c['name'] for c in response.json()['customers']], names)
+
+    async def test_requires_login(self):
+        response = await AsyncClient().get(reverse('lookup_customers'), {'q': 'ash'})
+        self.assertEqual(response.status_code, 302)
+
+
+class MedicineRecordTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cashier', password='pw')
+        self.client.force_login(self.user)
+        self.first = make_medicine('Paracetamol 500', quantity=10)
+        self.second = make_medicine('Cetirizine', quantity=5)
+
+    def test_details_etag_and_invalidation(self):
+        url = reverse('get_medicine_details', args=[self.first.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(response.json()['available_quantity'], 10)
+
+        with self.assertNumQueries(0):
+            records.get_records([self.first.id])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # A sale moves the stock: the record is reloaded and the old tag no longer matches
+        with self.captureOnCommitCallbacks(execute=True):
+            take_stock({self.first.id: 3})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['available_quantity'], 7)
+        self.assertNotEqual(response['ETag'], etag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Medicine.objects.filter(pk=self.first.pk).get().delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_multi_get(self):
+        ids = [self.second.id, self.first.id, self.second.id, 0]
+        with self.assertNumQueries(1):
+            found = records.get_records(ids)
+        self.assertEqual(list(found), [self.second.id, self.first.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.selling_price = Decimal('9.50')
+            self.second.save()
+        with self.assertNumQueries(1):
+            found = records.get_records(ids)
+        self.assertEqual(found[self.second.id]['data']['selling_price'], '9.50')
+
+        url = reverse('get_medicine_records')
+        response = self.client.get(url, {'ids': f'{self.first.id},{self.second.id},0'})
+        self.assertEqual([m['id'] for m in response.json()['medicines']], [self.first.id, self.second.id])
+        self.assertEqual(response.json()['missing'], [0])
+        response = self.client.get(
+            url, {'ids': f'{self.first.id},{self.second.id},0'}, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(url, {'ids': 'a,b'}).status_code, 400)
+
+
+class BarcodeScanTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='pw')
+        self.client.force_login(self.user)
+        today = timezone.now().date()
+        self.later = make_medicine('Dolo 650', quantity=5, batch_number='D2', expiry_date=today + timedelta(days=400))
+        self.first = make_medicine('Dolo 650', quantity=3, batch_number='D1', expiry_date=today + timedelta(days=40))
+        make_medicine('Dolo 650', quantity=9, batch_number='D0', expiry_date=today - timedelta(days=1))
+        make_medicine('Calpol', quantity=0)
+        register_barcodes({'8901234567890': 'Dolo 650', 'SHOP-0001': 'Dolo 650', '4006381333931': 'Calpol'})
+
+    def test_normalizes_gtins(self):
+        self.assertEqual(normalize_code(' 036000291452 '), '00036000291452')
+        self.assertEqual(normalize_code('shop-1'), 'shop-1')
+        self.assertTrue(is_valid_gtin(normalize_code('036000291452')))
+        self.assertFalse(is_valid_gtin(normalize_code('036000291453')))
+        # A code already registered stays on its product
+        self.assertEqual(register_barcodes({'08901234567890': 'Calpol', '96385074': 'Calpol'}), ['00000096385074'])
+        self.assertEqual(MedicineBarcode.objects.get(code='08901234567890').name, 'Dolo 650')
+
+    def test_codes_belong_to_existing_products_and_follow_renames(self):
+        with self.assertRaisesMessage(ValueError, 'No medicine named Dolo 65'):
+            register_barcodes({'SHOP-0002': 'Dolo 65', 'SHOP-0003': 'Calpol'})
+        self.assertFalse(MedicineBarcode.objects.filter(code__in=['SHOP-0002', 'SHOP-0003']).exists())
+
+        lots = list(Medicine.objects.filter(name='Dolo 650'))
+        for lot in lots[:-1]:
+            lot.name = 'Dolo-650'
+            lot.save()
+        # The last lot still carries the old name, so the codes stay with it
+        self.assertEqual(MedicineBarcode.objects.filter(name='Dolo 650').count(), 2)
+
+        lots[-1].name = 'Dolo-650'
+        lots[-1].save()
+        self.assertEqual(MedicineBarcode.objects.filter(name='Dolo-650').count(), 2)
+        lot, units, _ = resolve_code('8901234567890')
+        self.assertEqual((lot.pk, units), (self.first.pk, 8))
+
+    def test_scan_resolves_the_fefo_lot_in_one_query(self):
+        with self.assertNumQueries(1):
+            lot, units, lots = resolve_code('8901234567890')
+        self.assertEqual((lot.pk, units, lots), (self.first.pk, 8, 2))
+
+        response = self.client.get(reverse('scan_barcode'), {'code': 'SHOP-0001'})
+        medicine = response.json()['medicine']
+        self.assertEqual((medicine['id'], medicine['available_quantity']), (self.first.pk, 8))
+
+        for code, message in (('4006381333931', 'No sellable stock for this product'), ('123', 'Unknown barcode')):
+            response = self.client.get(reverse('scan_barcode'), {'code': code})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response.json()['message'], message)
+
+    def test_resolves_a_basket(self):
+        codes = ['SHOP-0001', '8901234567890', 'SHOP-0001', '123', '4006381333931']
+        with self.assertNumQueries(2):
+            resolved, unknown, unavailable = resolve_codes(codes)
+        self.assertEqual(
+            [(code, count, product[0].pk) for code, count, product in resolved],
+            [('SHOP-0001', 2, self.first.pk), ('08901234567890', 1, self.first.pk)],
+        )
+        self.assertEqual((unknown, unavailable), (['123'], ['04006381333931']))
+
+        response = self.client.get(reverse('resolve_barcodes'), {'codes': ','.join(codes)})
+        data = response.json()
+        self.assertEqual([(m['code'], m['scanned']) for m in data['medicines']], [('SHOP-0001', 2), ('08901234567890', 1)])
+        self.assertEqual(data['unknown'], ['123'])
+
+
+class CustomerAggregateTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        self.customer = Customer.objects.create(name='Asha', phone='9999999999')
+        self.medicine = make_medicine(quantity=100)
+
+    def _post(self, quantity):
+        return post_bill(
+            [{'medicine_id': self.medicine.id, 'quantity': quantity, 'unit_price': '2.00'}],
+            customer=self.customer,
+            customer_name=self.customer.name,
+        )
+
+    def test_posting_and_cancelling_maintain_aggregates(self):
+        first = self._post(2)
+        second = self._post(3)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_purchases, 2)
+        self.assertEqual(self.customer.total_spent, Decimal('10.00'))
+        self.assertEqual(self.customer.last_purchase_date, second.created_at)
+
+        response = self.client.post(reverse('cancel_bill', args=[second.id]))
+        self.assertTrue(response.json()['success'])
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_purchases, 1)
+        self.assertEqual(self.customer.total_spent, Decimal('4.00'))
+        self.assertEqual(self.customer.last_purchase_date, first.created_at)
+
+    def test_recompute_command(self):
+        bill = self._post(2)
+        self._post(1)
+        Bill.objects.filter(pk=bill.pk).update(status='cancelled')
+        Customer.objects.update(completed_bills=99, lifetime_spend=0)
+        idle = Customer.objects.create(name='Idle', phone='1', completed_bills=5)
+
+        call_command('recompute_customer_stats', stdout=StringIO())
+
+        self.customer.refresh_from_db()
+        idle.refresh_from_db()
+        self.assertEqual(self.customer.completed_bills, 1)
+        self.assertEqual(self.customer.lifetime_spend, Decimal('2.00'))
+        self.assertEqual(idle.completed_bills, 0)
+        self.assertIsNone(idle.last_purchase_at)
+
+    def test_migration_backfills_existing_customers(self):
+        bill = self._post(2)
+        Customer.objects.update(completed_bills=0, lifetime_spend=0, last_purchase_at=None)
+
+        migration = import_module('medical.migrations.0019_backfill_customer_aggregates')
+        state = MigrationLoader(connection).project_state(('medical', '0019_backfill_customer_aggregates'))
+        migration.backfill_customer_aggregates(state.apps, connection.schema_editor())
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.completed_bills, 1)
+        self.assertEqual(self.customer.lifetime_spend, Decimal('4.00'))
+        self.assertEqual(self.customer.last_purchase_at, bill.created_at)
+
+
+class DailySalesSummaryTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='secret')
+        self.client.force_login(self.user)
+        self.medicine = make_medicine(quantity=100)
+
+    def _post(self, quantity, payment_method='cash'):
+        return post_bill(
+            [{'medicine_id': self.medicine.id, 'quantity': quantity, 'unit_price': '2.00'}],
+            customer_name='Walk-in Customer',
+            payment_method=payment_method,
+        )
+
+    def test_posting_and_cancelling_update_rollup(self):
+        self._post(2)
+        self._post(3, payment_method='upi')
+        cancelled = self._post(4)
+
+        self.client.post(reverse('cancel_bill', args=[cancelled.id]))
+
+        cash = DailySalesSummary.objects.get(payment_method='cash', status='completed')
+        self.assertEqual((cash.bill_count, cash.items_sold, cash.total_amount), (1, 2, Decimal('4.00')))
+        voided = DailySalesSummary.objects.get(payment_method='cash', status='cancelled')
+        self.assertEqual((voided.bill_count, voided.items_sold), (1, 4))
+        self.assertEqual(sales_totals(), {'total_bills': 3, 'total_sales': Decimal('10.00')})
+        self.assertEqual(sales_totals(payment_method='upi')['total_bills'], 1)
+
+    def test_backfill_matches_incremental(self):
+        self._post(2)
+        self._post(3, payment_method='card')
+        incremental = list(DailySalesSummary.objects.order_by('payment_method').values(
+            'date', 'payment_method', 'status', 'bill_count', 'items_sold', 'total_amount'
+        ))
+
+        DailySalesSummary.objects.all().delete()
+        call_command('backfill_daily_sales', stdout=StringIO())
+
+        rebuilt = list(DailySalesSummary.objects.order_by('payment_method').values(
+            'date', 'payment_method', 'status', 'bill_count', 'items_sold', 'total_amount'
+        ))
+        self.assertEqual(rebuilt, incremental)
+
+    def test_migration_backfills_existing_bills(self):
+        self._post(2)
+        DailySalesSummary.objects.all().delete()
+
+        migration = import_module('medical.migrations.0020_backfill_daily_sales')
+        state = MigrationLoader(connection).project_state(('medical', '0020_backfill_daily_sales'))
+        migration.backfill_daily_sales(state.apps, connection.schema_editor())
+
+        self.assertEqual(sales_totals(), {'total_bills': 1, 'total_sales': Decimal('4.00')})
+        self.assertEqual(DailySalesSummary.objects.get().items_sold, 2)
+
+    def test_bill_list_totals_come_from_rollup(self):
+        self._post(2)
+        today = timezone.localdate().isoformat()
+
+        DailySalesSummary.objects.update(bill_count=7)
+
+        response = self.client.get(reverse('bill_list'), {'date_from': today})
+
+        self.assertEqual(response.context['total_bills'], 7)
+        self.assertEqual(response.context['total_sales'], Decimal('4.00'))
+
+
+IMPORT_HEADER = 'name,generic_name,category,manufacturer,quantity,unit_price,selling_price,manufacturing_date,expiry_date,batch_number\n'
+
+
+class MedicineImportTests(TestCase):
+
+    def _import(self, body, batch_size=1000):
+        return import_medicines(csv_rows(StringIO(IMPORT_HEADER + body)), batch_size=batch_size)
+
+    def test_creates_and_upserts_with_stock_transactions(self):
+        make_medicine('Calpol', quantity=5, batch_number='C1')
+
+        result = self._import(
+            'Paracetamol,Acetaminophen,tablet,Acme,40,1.00,2.00,2026-01-01,2028-01-01,P1\n'
+            'Calpol,Paracetamol,Syrup,Acme,12,3.00,4.00,2026-01-01,2028-01-01,C1\n'
+        )
+
+        self.assertEqual((result.created, result.updated, result.errors), (1, 1, []))
+        calpol = Medicine.objects.get(name='Calpol')
+        self.assertEqual((calpol.quantity, calpol.category), (12, 'syrup'))
+        self.assertEqual(
+            sorted(StockTransaction.objects.values_list('medicine__name', 'transaction_type', 'quantity')),
+            [('Calpol', 'purchase', 7), ('Paracetamol', 'purchase', 40)],
+        )
+
+    def test_repeated_rows_for_a_lot_make_one_adjustment(self):
+        make_medicine('Calpol', quantity=5, batch_number='C1')
+
+        result = self._import(
+            'Calpol,Paracetamol,syrup,Acme,40,3.00,4.00,2026-01-01,2028-01-01,C1\n'
+            'Calpol,Paracetamol,syrup,Acme,70,3.00,4.00,2026-01-01,2028-01-01,C1\n'
+        )
+
+        self.assertEqual((result.updated, result.errors), (1, []))
+        self.assertEqual(Medicine.objects.get(name='Calpol').quantity, 70)
+        self.assertEqual(
+            list(StockTransaction.objects.values_list('transaction_type', 'quantity', 'notes')),
+            [('purchase', 65, 'Stock adjusted from 5 to 70 via import')],
+        )
+
+    def test_attaches_barcodes_to_the_product(self):
+        result = import_medicines(csv_rows(StringIO(
+            IMPORT_HEADER.replace('\n', ',barcode\n')
+            + 'Dolo 650,Paracetamol,tablet,Acme,10,1,2,2026-01-01,2028-01-01,D1,8901234567890;SHOP-1\n'
+            + 'Dolo 650,Paracetamol,tablet,Acme,10,1,2,2026-01-01,2028-06-01,D2,8901234567890\n'
+            + 'Calpol,Paracetamol,syrup,Acme,10,1,2,2026-01-01,2028-01-01,C1,8901234567894\n'
+        )))
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.errors, [(4, 'barcode 8901234567894 has a wrong GTIN check digit')])
+        self.assertEqual(
+            sorted(MedicineBarcode.objects.values_list('code', 'name')),
+            [('08901234567890', 'Dolo 650'), ('SHOP-1', 'Dolo 650')],
+        )
+
+    def test_reports_row_errors_and_keeps_going(self):
+        result = self._import(
+            'Bad,,tablet,Acme,-1,1,2,2026-01-01,2028-01-01,B1\n'
+            'Worse,,pill,Acme,1,1,2,2026-01-01,2028-01-01,B2\n'
+            'Good,,tablet,Acme,1,1,2,2026-01-01,2028-01-01,B3\n'
+            'Late,,tablet,Acme,1,1,2,2026-01-01,2025-01-01,B4\n',
+            batch_size=2,
+        )
+
+        self.assertEqual(result.created, 1)
+        self.assertEqual([row for row, _ in result.errors], [2, 3, 5])
+        self.assertEqual(list(Medicine.objects.values_list('name', flat=True)), ['Good'])
+
+    def test_query_count_per_chunk_is_constant(self):
+        rows = ''.join(
+            f'Med {i},,tablet,Acme,5,1,2,2026-01-01,2028-01-01,B{i}\n' for i in range(50)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self._import(rows)
+        self.assertLessEqual(len(queries), 8)
+
+    def test_upload_view(self):
+        user = User.objects.create_user('admin', password='secret')
+        self.client.force_login(user)
+        upload = SimpleUploadedFile(
+            'catalogue.csv',
+            (IMPORT_HEADER + 'Paracetamol,,tablet,Acme,40,1,2,2026-01-01,2028-01-01,P1\n').encode(),
+        )
+
+        response = self.client.post(reverse('import_medicines'), {'file': upload})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 1)
+        self.assertEqual(Medicine.objects.get().created_by, user)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('admin', password='secret')
+        self.medicine = make_medicine(quantity=100)
+        for _ in range(3):
+            post_bill([{'medicine_id': self.medicine.id, 'quantity': 2}], created_by=self.user)
+
+    def test_rows_are_chunked_in_pk_order(self):
+        rows = list(export_rows('bill-items', chunk_size=2))
+
+        self.assertEqual(rows[0][:3], ['id', 'bill_id', 'bill__bill_number'])
+        ids = [row[0] for row in rows[1:]]
+        self.assertEqual(ids, sorted(BillItem.objects.values_list('id', flat=True)))
+
+    def test_date_filter(self):
+        tomorrow = timezone.now().date() + timedelta(days=1)
+        self.assertEqual(len(list(export_rows('bills', date_from=tomorrow))), 1)
+        self.assertEqual(len(list(export_rows('bills', date_to=tomorrow))), 4)
+
+    def test_csv_view_streams(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_data', args=['stock-transactions']))
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'transaction_date', 'medicine_id'])
+        self.assertEqual(len(lines), 1 + StockTransaction.objects.count())
+
+    def test_jsonl_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_data', args=['bills']), {'format': 'jsonl'})
+
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]['total_amount'], str(Bill.objects.order_by('pk')[0].total_amount))
+
+    def test_view_rejects_bad_parameters(self):
+        self.client.force_login(self.user)
+        url = reverse('export_data', args=['bills'])
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'date_from': '2026-13-01'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_data', args=['users'])).status_code, 404)
+
+    def test_command_writes_jsonl(self):
+        out = StringIO()
+        call_command('export_data', 'bill-items', '--format', 'jsonl', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
@@ -10,6 +10,7 @@ urlpatterns = [
     path('add-medicine/', views.add_medicine, name='add_medicine'),
     path('edit-medicine/<int:pk>/', views.add_medicine, name='edit_medicine'),
     path('medicine-stock/', views.medicine_stock, name='medicine_stock'),
+    path('import-medicines/', views.import_medicines, name='import_medicines'),
     path('delete-medicine/<int:pk>/', views.delete_medicine, name='delete_medicine'),
     
     
@@ -17,13 +18,31 @@ urlpatterns = [
     path('billing/', views.billing_page, name='billing'),
     path('api/search-medicine/', views.search_medicine_ajax, name='search_medicine_ajax'),
     path('api/medicine/<int:medicine_id>/', views.get_medicine_details, name='get_medicine_details'),
+    path('api/medicines/', views.get_medicine_records, name='get_medicine_records'),
+    path('api/scan/', views.scan_barcode, name='scan_barcode'),
+    path('api/scan/basket/', views.resolve_barcodes, name='resolve_barcodes'),
+    path('api/customers/lookup/', views.lookup_customers, name='lookup_customers'),
     path('api/create-bill/', views.create_bill, name='create_bill'),
+    path('api/sync-bills/', views.sync_bills, name='sync_bills'),
     
     # Bill Management
     path('bills/', views.bill_list, name='bill_list'),
     path('bills/<int:bill_id>/', views.bill_detail, name='bill_detail'),
     path('bills/<int:bill_id>/print/', views.print_bill, name='print_bill'),
     path('bills/<int:bill_id>/cancel/', views.cancel_bill, name='cancel_bill'),
+    path('bills/<int:bill_id>/refund/', views.refund_bill, name='refund_bill'),
+    path('bills/<int:bill_id>/payments/', views.collect_payment, name='collect_payment'),
+    path('bills/void/', views.void_bills, name='void_bills'),
+    path('credit-ledger/', views.credit_ledger, name='credit_ledger'),
+    
+    # Purchasing
+    path('purchase-orders/', views.purchase_orders, name='purchase_orders'),
+    path('api/purchase-orders/', views.create_purchase_order, name='create_purchase_order'),
+    path('api/goods-receipts/', views.receive_goods, name='receive_goods'),
+    
+    # Exports
+    path('export/<str:kind>/', views.export_data, name='export_data'),
+    path('metrics/', views.metrics, name='metrics'),
     
     # Customer Management
     path('customers/', views.customer_list, name='customer_list'),
@@ -3,15 +3,25 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
 from django.contrib.auth import logout
+from django.contrib.auth.decorators import login_required
+
+from .dashboard import dashboard_metrics
 
 def landing_page(request):
     return render(request, "landing.html")
 
+@login_required
 def dashboard(request):
-    return render(request,"dashboard.html")
+    return render(request, "dashboard.html", dashboard_metrics())
 
+@login_required
 def user_dashboard(request):
-    return render(request,"user_dashboard.html")
+    metrics = dashboard_metrics()
+    my_shift = next(
+        (shift for shift in metrics['cashier_shifts'] if shift['user_id'] == request.user.pk),
+        {'bills': 0, 'sales': 0},
+    )
+    return render(request, "user_dashboard.html", {**metrics, 'my_shift': my_shift, 'total_orders': my_shift['bills']})
 
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
@@ -46,10 +56,19 @@ def logout_view(request):
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q
 from .models import Medicine, StockTransaction
+from . import importers, inventory
 from datetime import datetime
 
+# Fields the edit form saves directly; stock moves through the inventory service
+MEDICINE_EDIT_FIELDS = [
+    'name', 'generic_name', 'category', 'manufacturer', 'description', 'reorder_level', 'unit_price',
+    'selling_price', 'manufacturing_date', 'expiry_date', 'batch_number', 'rack_number', 'updated_at',
+]
+
+
 @login_required
 def add_medicine(request, pk=None):
     # Check if we're editing an existing medicine
@@ -60,8 +79,9 @@ def add_medicine(request, pk=None):
     if request.method == 'POST':
         try:
             if medicine:
-                # Editing existing medicine - Store old quantity BEFORE any changes
-                old_quantity = medicine.quantity
+                # The quantity the form was opened with: the edit moves stock
+                # by the change made on it, so sales since then are kept
+                shown_quantity = int(request.POST.get('original_quantity', medicine.quantity))
                 
                 # Update all fields
                 medicine.name = request.POST.get('name')
@@ -79,24 +99,20 @@ def add_medicine(request, pk=None):
                 
                 # Handle quantity separately
                 new_quantity = int(request.POST.get('quantity', 0))
-                medicine.quantity = new_quantity
                 
-                # Save the medicine
-                medicine.save()
+                # Save the other fields without the (possibly stale) quantity,
+                # then move stock and log it through the inventory service
+                with transaction.atomic():
+                    medicine.save(update_fields=MEDICINE_EDIT_FIELDS)
+                    if new_quantity != shown_quantity:
+                        inventory.record_adjustment(
+                            medicine, new_quantity - shown_quantity,
+                            notes=f'Stock adjusted from {shown_quantity} to {new_quantity} via edit',
+                            performed_by=request.user,
+                        )
+                medicine.refresh_from_db(fields=['quantity'])
                 
-                # Log stock change if quantity changed
-                if old_quantity != new_quantity:
-                    quantity_diff = new_quantity - old_quantity
-                    StockTransaction.objects.create(
-                        medicine=medicine,
-                        transaction_type='purchase' if quantity_diff > 0 else 'sale',
-                        quantity=abs(quantity_diff),
-                        price_per_unit=medicine.unit_price,
-                        notes=f'Stock adjusted from {old_quantity} to {new_quantity} via edit',
-                        performed_by=request.user
-                    )
-                
-                messages.success(request, f'Medicine "{medicine.name}" updated successfully! Stock: {new_quantity} units')
+                messages.success(request, f'Medicine "{medicine.name}" updated successfully! Stock: {medicine.quantity} units')
             else:
                 # Creating new medicine
                 medicine = Medicine.objects.create(
@@ -152,7 +168,7 @@ def medicine_stock(request):
     stock_filter = request.GET.get('stock_status', '')
     
     # Base queryset
-    medicines = Medicine.objects.all()
+    medicines = Medicine.objects.with_stock_status()
     
     # Apply search
     if search_query:
@@ -168,32 +184,57 @@ def medicine_stock(request):
     
     # Apply stock status filter
     if stock_filter == 'low':
-        medicines = [m for m in medicines if m.is_low_stock and not m.is_expired]
+        medicines = medicines.low_stock().not_expired()
     elif stock_filter == 'expired':
-        medicines = [m for m in medicines if m.is_expired]
+        medicines = medicines.expired()
     elif stock_filter == 'out':
-        medicines = medicines.filter(quantity=0)
+        medicines = medicines.out_of_stock()
     
     # Calculate stats
-    total_medicines = Medicine.objects.count()
-    low_stock_count = len([m for m in Medicine.objects.all() if m.is_low_stock])
-    expired_count = len([m for m in Medicine.objects.all() if m.is_expired])
-    out_of_stock = Medicine.objects.filter(quantity=0).count()
+    stats = Medicine.objects.stock_counts()
+    
+    page = paginate_keyset(request, medicines)
     
     context = {
-        'medicines': medicines,
+        'medicines': page,
+        'page': page,
         'categories': Medicine.CATEGORY_CHOICES,
         'search_query': search_query,
         'category_filter': category_filter,
         'stock_filter': stock_filter,
-        'total_medicines': total_medicines,
-        'low_stock_count': low_stock_count,
-        'expired_count': expired_count,
-        'out_of_stock': out_of_stock,
+        **stats,
     }
     return render(request, 'medicine_stock.html', context)
 
 
+@login_required
+def import_medicines(request):
+    """Bulk add/update medicines from an uploaded CSV or Excel file"""
+    result = None
+    
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if not upload:
+            messages.error(request, 'Please choose a CSV or Excel file to import')
+        else:
+            try:
+                result = importers.import_medicines(
+                    importers.rows_for_upload(upload, upload.name),
+                    user=request.user
+                )
+                messages.success(request, f'Import finished: {result}')
+            except Exception as e:
+                messages.error(request, f'Error importing medicines: {str(e)}')
+    
+    context = {
+        'result': result,
+        'errors': result.errors[:100] if result else [],
+        'required_columns': importers.REQUIRED_COLUMNS,
+        'optional_columns': importers.OPTIONAL_COLUMNS,
+    }
+    return render(request, 'import_medicines.html', context)
+
+
 @login_required
 def delete_medicine(request, pk):
     medicine = get_object_or_404(Medicine, pk=pk)
@@ -209,15 +250,27 @@ def delete_medicine(request, pk):
 
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
+from django.contrib.auth.views import redirect_to_login
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.utils.dateparse import parse_date
 from django.db.models import Q, Sum, Count
 from django.views.decorators.http import require_http_methods
 from django.contrib import messages
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.conf import settings
 from decimal import Decimal
+import functools
+import hmac
 import json
 
-from .models import Medicine, Bill, BillItem, Customer, StockTransaction
+from .models import Medicine, MedicineBarcode, Bill, BillItem, Customer, PurchaseOrder, StockTransaction
+from . import barcodes, exports, profiling, purchasing, records, services
+from .pagination import paginate_keyset
+from .search import medicine_search_index
+from .services import (
+    InsufficientStock, cancel_bills, post_bill, sales_totals,
+)
 
 
 @login_required
@@ -226,57 +279,191 @@ def billing_page(request):
     return render(request, 'billing.html')
 
 
-@login_required
-def search_medicine_ajax(request):
-    """AJAX endpoint to search medicines"""
-    query = request.GET.get('q', '')
-    
-    if len(query) < 2:
-        return JsonResponse({'medicines': []})
-    
-    medicines = Medicine.objects.filter(
-        Q(name__icontains=query) | 
-        Q(generic_name__icontains=query) |
-        Q(batch_number__icontains=query)
-    ).filter(
-        quantity__gt=0,  # Only in-stock medicines
-        expiry_date__gt=timezone.now().date()  # Not expired
-    )[:10]  # Limit to 10 results
-    
-    data = [{
+def async_login_required(view):
+    """login_required for async views (Django's decorator only wraps sync views before 5.1)"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _product_json(m, available, lots):
+    """A product as the billing screen adds it to the cart: its FEFO lot plus stock across lots"""
+    return {
         'id': m.id,
         'name': m.name,
         'generic_name': m.generic_name,
         'batch_number': m.batch_number,
         'category': m.get_category_display(),
         'selling_price': str(m.selling_price),
-        'available_quantity': m.quantity,
+        'available_quantity': available,
+        'lots': lots,
+        'fefo': True,
         'manufacturer': m.manufacturer,
         'expiry_date': m.expiry_date.strftime('%Y-%m-%d')
-    } for m in medicines]
+    }
+
+
+# The billing screen's lookups are async so that, under an ASGI server, a
+# request waiting on the database doesn't hold a worker thread while the
+# next keystrokes queue behind it. Under WSGI they run as before.
+
+@async_login_required
+async def search_medicine_ajax(request):
+    """AJAX endpoint to search medicines"""
+    query = request.GET.get('q', '')
+    
+    if len(query) < 2:
+        return JsonResponse({'medicines': []})
+    
+    # Ranked prefix search over in-stock, non-expired medicines, one row per
+    # product; the sale is spread over its lots first-expiry-first
+    products = await medicine_search_index.asearch_products(query, limit=10)
+    
+    data = [_product_json(*product) for product in products]
     
     return JsonResponse({'medicines': data})
 
 
-@login_required
-def get_medicine_details(request, medicine_id):
+def _conditional_json(request, data, etag):
+    """JsonResponse tagged with `etag`, or a 304 when the client already has it"""
+    response = get_conditional_response(request, etag=etag) or JsonResponse(data)
+    response['ETag'] = etag
+    # Browsers revalidate on every fetch, sending If-None-Match themselves
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@async_login_required
+async def get_medicine_details(request, medicine_id):
     """Get detailed information about a specific medicine"""
-    medicine = get_object_or_404(Medicine, id=medicine_id)
+    record = (await records.aget_records([medicine_id])).get(medicine_id)
+    if record is None:
+        raise Http404('Medicine not found')
+    
+    return _conditional_json(request, record['data'], record['etag'])
+
+
+@async_login_required
+async def get_medicine_records(request):
+    """Details of every medicine in `ids` (comma separated), for a whole cart in one request"""
+    try:
+        ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk.strip()]
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'ids must be comma separated integers'}, status=400)
+    if len(ids) > records.MAX_RECORDS:
+        return JsonResponse(
+            {'success': False, 'message': f'At most {records.MAX_RECORDS} ids per request'}, status=400
+        )
     
+    found = await records.aget_records(ids)
     data = {
-        'id': medicine.id,
-        'name': medicine.name,
-        'generic_name': medicine.generic_name,
-        'batch_number': medicine.batch_number,
-        'category': medicine.get_category_display(),
-        'selling_price': str(medicine.selling_price),
-        'available_quantity': medicine.quantity,
-        'manufacturer': medicine.manufacturer,
-        'expiry_date': medicine.expiry_date.strftime('%Y-%m-%d'),
-        'rack_number': medicine.rack_number
+        'medicines': [record['data'] for record in found.values()],
+        'missing': [pk for pk in dict.fromkeys(ids) if pk not in found],
     }
+    etag = records.etag([[record['etag'] for record in found.values()], data['missing']])
+    return _conditional_json(request, data, etag)
+
+
+# Scans are sync views: the lookup is one indexed query of a tenth of a
+# millisecond, less than handing it to a thread from an async view costs
+
+@login_required
+def scan_barcode(request):
+    """Product for one scanned barcode (`code`), ready to add to the cart"""
+    code = request.GET.get('code', '')
+    product = barcodes.resolve_code(code)
+    if product is None:
+        known = MedicineBarcode.objects.filter(code=barcodes.normalize_code(code)).exists()
+        message = 'No sellable stock for this product' if known else 'Unknown barcode'
+        return JsonResponse({'success': False, 'message': message}, status=404)
     
-    return JsonResponse(data)
+    return JsonResponse({'success': True, 'medicine': _product_json(*product)})
+
+
+@login_required
+def resolve_barcodes(request):
+    """Products for a whole basket of scans (`codes`, comma separated; repeats count as quantity)"""
+    codes = [code for code in request.GET.get('codes', '').split(',') if code.strip()]
+    if len(codes) > barcodes.MAX_CODES:
+        return JsonResponse(
+            {'success': False, 'message': f'At most {barcodes.MAX_CODES} codes per request'}, status=400
+        )
+    
+    resolved, unknown, unavailable = barcodes.resolve_codes(codes)
+    return JsonResponse({
+        'success': True,
+        'medicines': [
+            dict(_product_json(*product), code=code, scanned=count) for code, count, product in resolved
+        ],
+        'unknown': unknown,
+        'unavailable': unavailable,
+    })
+
+
+@async_login_required
+async def lookup_customers(request):
+    """Customers whose phone (digits) or name starts with `q`, for the billing screen"""
+    query = request.GET.get('q', '').strip()
+    
+    if len(query) < 3:
+        return JsonResponse({'customers': []})
+    
+    customers = Customer.objects.filter(is_active=True)
+    if query.isdigit():
+        customers = customers.filter(phone__startswith=query).order_by('phone', 'id')
+    else:
+        customers = customers.filter(name__istartswith=query).order_by('name', 'id')
+    
+    data = [{
+        'id': customer.id,
+        'name': customer.name,
+        'phone': customer.phone,
+        'address': customer.address,
+        'doctor_name': customer.doctor_name,
+        'prescription_number': customer.prescription_number,
+        'completed_bills': customer.completed_bills,
+        'lifetime_spend': str(customer.lifetime_spend),
+    } async for customer in customers[:10]]
+    
+    return JsonResponse({'customers': data})
+
+
+def _customer_details(data):
+    """services.customer_for() details from a billing screen payload, or None for a walk-in"""
+    if not data.get('customer_name'):
+        return None
+    return {
+        'phone': data.get('customer_phone', ''),
+        'name': data.get('customer_name', ''),
+        'address': data.get('customer_address', ''),
+        'doctor_name': data.get('doctor_name', ''),
+        'prescription_number': data.get('prescription_number', ''),
+    }
+
+
+def _bill_arguments(data):
+    """post_bill() payments and bill fields (less the customer) from a billing screen payload"""
+    # Split tenders come in as a payments list; a single payment method
+    # and amount is recorded as one tender
+    payment_method = data.get('payment_method', 'cash')
+    amount_paid = Decimal(str(data.get('amount_paid', 0)))
+    payments = data.get('payments')
+    if payments is None and amount_paid > 0 and payment_method != 'credit':
+        payments = [{'payment_method': payment_method, 'amount': amount_paid}]
+    
+    return payments, {
+        'customer_name': data.get('customer_name', 'Walk-in Customer'),
+        'customer_phone': data.get('customer_phone', ''),
+        'discount_percentage': Decimal(str(data.get('discount_percentage', 0))),
+        'tax_percentage': Decimal(str(data.get('tax_percentage', 0))),
+        'payment_method': payment_method,
+        'amount_paid': amount_paid,
+        'notes': data.get('notes', ''),
+    }
 
 
 @login_required
@@ -293,55 +480,12 @@ def create_bill(request):
                 'message': 'Please add at least one item to the bill'
             }, status=400)
         
-        # Create or get customer
-        customer = None
-        if data.get('customer_name'):
-            customer, created = Customer.objects.get_or_create(
-                phone=data.get('customer_phone', ''),
-                defaults={
-                    'name': data.get('customer_name', ''),
-                    'address': data.get('customer_address', ''),
-                    'doctor_name': data.get('doctor_name', ''),
-                    'prescription_number': data.get('prescription_number', '')
-                }
-            )
-        
-        # Create bill
-        bill = Bill.objects.create(
-            customer=customer,
-            customer_name=data.get('customer_name', 'Walk-in Customer'),
-            customer_phone=data.get('customer_phone', ''),
-            subtotal=Decimal(data.get('subtotal', 0)),
-            discount_percentage=Decimal(data.get('discount_percentage', 0)),
-            tax_percentage=Decimal(data.get('tax_percentage', 0)),
-            payment_method=data.get('payment_method', 'cash'),
-            amount_paid=Decimal(data.get('amount_paid', 0)),
-            notes=data.get('notes', ''),
-            created_by=request.user
-        )
-        
-        # Create bill items
-        for item_data in data['items']:
-            medicine = Medicine.objects.get(id=item_data['medicine_id'])
-            
-            # Check stock availability
-            if medicine.quantity < int(item_data['quantity']):
-                bill.delete()  # Rollback
-                return JsonResponse({
-                    'success': False,
-                    'message': f'Insufficient stock for {medicine.name}. Available: {medicine.quantity}'
-                }, status=400)
-            
-            # Create bill item
-            BillItem.objects.create(
-                bill=bill,
-                medicine=medicine,
-                quantity=int(item_data['quantity']),
-                unit_price=Decimal(item_data['unit_price'])
-            )
+        payments, bill_fields = _bill_arguments(data)
+        details = _customer_details(data)
+        bill_fields['customer'] = services.customer_for(details) if details else None
         
-        # Recalculate bill totals
-        bill.calculate_totals()
+        # Create bill, items, payments and stock movements in one transaction
+        bill = post_bill(data['items'], created_by=request.user, payments=payments, **bill_fields)
         
         return JsonResponse({
             'success': True,
@@ -356,6 +500,67 @@ def create_bill(request):
             'success': False,
             'message': 'Medicine not found'
         }, status=404)
+    except InsufficientStock as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+    except (ValueError, ArithmeticError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=500)
+
+
+@login_required
+@require_http_methods(["POST"])
+def sync_bills(request):
+    """Post a batch of bills queued offline by a counter, each at most once"""
+    try:
+        data = json.loads(request.body)
+        
+        bills = []
+        for entry in data.get('bills', []):
+            payments, bill_fields = _bill_arguments(entry)
+            bill = {
+                'client_reference': entry.get('client_reference'),
+                'items': entry.get('items'),
+                'payments': payments,
+                # Customers are created with the bills, in the batch's transaction
+                'customer_details': _customer_details(entry),
+                **bill_fields,
+            }
+            if entry.get('created_at'):
+                bill['created_at'] = entry['created_at']
+            bills.append(bill)
+        if not bills:
+            return JsonResponse({
+                'success': False,
+                'message': 'No bills to sync'
+            }, status=400)
+        
+        results = services.sync_bills(bills, created_by=request.user)
+        
+        counts = {status: 0 for status in ('created', 'duplicate', 'failed')}
+        for result in results:
+            counts[result['status']] += 1
+        return JsonResponse({
+            'success': True,
+            'message': f"{counts['created']} bills created, {counts['duplicate']} already synced, {counts['failed']} failed",
+            'results': results,
+            **counts,
+        })
+        
+    except (AttributeError, TypeError, ValueError, ArithmeticError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -391,16 +596,25 @@ def bill_list(request):
         bills = bills.filter(created_at__date__lte=date_to)
     
     # Statistics
-    total_sales = bills.filter(status='completed').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
+    if search:
+        # Free-text search can't be answered from the daily rollup
+        totals = bills.aggregate(
+            completed=Sum('total_amount', filter=Q(status='completed')),
+            refunded=Sum('total_amount', filter=Q(status='refunded')),
+        )
+        stats = {
+            'total_sales': (totals['completed'] or 0) - (totals['refunded'] or 0),
+            'total_bills': bills.count(),
+        }
+    else:
+        stats = sales_totals(date_from, date_to, status, payment_method)
     
-    total_bills = bills.count()
+    page = paginate_keyset(request, bills)
     
     context = {
-        'bills': bills[:50],  # Paginate in production
-        'total_sales': total_sales,
-        'total_bills': total_bills,
+        'bills': page,
+        'page': page,
+        **stats,
     }
     
     return render(request, 'bill_list.html', context)
@@ -443,37 +657,54 @@ def cancel_bill(request, bill_id):
     try:
         bill = get_object_or_404(Bill, id=bill_id)
         
-        if bill.status == 'cancelled':
+        # Nothing is cancelled when the bill already was (possibly just now
+        # by another request) or has been refunded
+        if not cancel_bills([bill.id], performed_by=request.user):
             return JsonResponse({
                 'success': False,
-                'message': 'Bill is already cancelled'
+                'message': 'Bill is already cancelled or has refunds'
             }, status=400)
         
-        # Restore stock for all items
-        for item in bill.items.all():
-            item.medicine.quantity += item.quantity
-            item.medicine.save()
-            
-            # Create reverse stock transaction
-            StockTransaction.objects.create(
-                medicine=item.medicine,
-                transaction_type='return',
-                quantity=item.quantity,
-                price_per_unit=item.unit_price,
-                total_amount=item.total_price,
-                notes=f'Bill Cancelled: {bill.bill_number}',
-                performed_by=request.user
-            )
+        return JsonResponse({
+            'success': True,
+            'message': 'Bill cancelled successfully'
+        })
+        
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=500)
+
+
+
+@login_required
+@require_http_methods(["POST"])
+def void_bills(request):
+    """Cancel several bills at once (e.g. end-of-day voids) and restore their stock"""
+    try:
+        data = json.loads(request.body)
+        bill_ids = [int(bill_id) for bill_id in data.get('bill_ids', [])]
+        
+        if not bill_ids:
+            return JsonResponse({
+                'success': False,
+                'message': 'No bills selected'
+            }, status=400)
         
-        # Update bill status
-        bill.status = 'cancelled'
-        bill.save()
+        cancelled = cancel_bills(bill_ids, performed_by=request.user)
         
         return JsonResponse({
             'success': True,
-            'message': 'Bill cancelled successfully'
+            'message': f'{len(cancelled)} bill(s) cancelled successfully',
+            'cancelled': [bill.bill_number for bill in cancelled],
         })
         
+    except (ValueError, TypeError):
+        return JsonResponse({
+            'success': False,
+            'message': 'bill_ids must be a list of bill ids'
+        }, status=400)
     except Exception as e:
         return JsonResponse({
             'success': False,
@@ -481,12 +712,108 @@ def cancel_bill(request, bill_id):
         }, status=500)
 
 
+@login_required
+@require_http_methods(["POST"])
+def refund_bill(request, bill_id):
+    """Refund selected line quantities of a bill and restore their stock"""
+    try:
+        data = json.loads(request.body)
+        
+        bill_refund = services.refund_bill(
+            bill_id,
+            data.get('items', []),
+            reason=data.get('reason', ''),
+            processed_by=request.user,
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Refund processed successfully',
+            'refund_bill_id': bill_refund.refund_bill_id,
+            'refund_bill_number': bill_refund.refund_bill.bill_number,
+            'refund_amount': str(bill_refund.refund_amount),
+        })
+        
+    except Bill.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'message': 'Bill not found'
+        }, status=404)
+    except (KeyError, TypeError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=500)
+
+
+@login_required
+@require_http_methods(["POST"])
+def collect_payment(request, bill_id):
+    """Take one or more payments against a bill's outstanding balance"""
+    try:
+        data = json.loads(request.body)
+        
+        bill = services.record_payments(bill_id, data.get('payments', []), created_by=request.user)
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Payment recorded successfully',
+            'amount_paid': str(bill.amount_paid),
+            'amount_due': str(bill.amount_due),
+        })
+        
+    except Bill.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'message': 'Bill not found'
+        }, status=404)
+    except (AttributeError, TypeError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=500)
+
+
+@login_required
+def credit_ledger(request):
+    """Bills with an outstanding balance, for collections"""
+    bills = services.outstanding_bills().select_related('customer')
+    
+    search = request.GET.get('search')
+    if search:
+        bills = bills.filter(
+            Q(bill_number__icontains=search) |
+            Q(customer_name__icontains=search) |
+            Q(customer_phone__icontains=search)
+        )
+    
+    totals = bills.aggregate(total_due=Sum('amount_due'), total_bills=Count('pk'))
+    page = paginate_keyset(request, bills)
+    
+    context = {
+        'bills': page,
+        'page': page,
+        'total_due': totals['total_due'] or 0,
+        'total_bills': totals['total_bills'],
+        'search': search,
+    }
+    
+    return render(request, 'credit_ledger.html', context)
+
 @login_required
 def customer_list(request):
     """List all customers"""
-    customers = Customer.objects.annotate(
-        total_purchases=Count('bill')
-    ).order_by('-created_at')
+    customers = Customer.objects.all()
     
     search = request.GET.get('search')
     if search:
@@ -496,8 +823,11 @@ def customer_list(request):
             Q(email__icontains=search)
         )
     
+    page = paginate_keyset(request, customers)
+    
     context = {
-        'customers': customers[:50],
+        'customers': page,
+        'page': page,
     }
     
     return render(request, 'customer_list.html', context)
@@ -509,20 +839,182 @@ def customer_detail(request, customer_id):
     customer = get_object_or_404(Customer, id=customer_id)
     bills = Bill.objects.filter(customer=customer).order_by('-created_at')
     
-    total_spent = bills.filter(status='completed').aggregate(
-        total=Sum('total_amount')
-    )['total'] or 0
-    
     context = {
         'customer': customer,
         'bills': bills,
-        'total_spent': total_spent,
+        'total_spent': customer.total_spent,
     }
     
     return render(request, 'customer_detail.html', context)
 
 
 
+@login_required
+def export_data(request, kind):
+    """Stream bills, bill items or the stock ledger as CSV or JSON lines"""
+    if kind not in exports.EXPORTS:
+        raise Http404('Unknown export')
+    
+    output_format = request.GET.get('format', 'csv')
+    if output_format not in exports.FORMATS:
+        return HttpResponse('format must be csv or jsonl', status=400)
+    
+    dates = {}
+    for param in ('date_from', 'date_to'):
+        value = request.GET.get(param, '')
+        try:
+            dates[param] = parse_date(value) if value else None
+        except ValueError:
+            dates[param] = None
+        if value and dates[param] is None:
+            return HttpResponse(f'{param} must be a date in YYYY-MM-DD format', status=400)
+    
+    response = StreamingHttpResponse(
+        exports.export_lines(kind, output_format, **dates),
+        content_type=exports.FORMATS[output_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{output_format}"'
+    return response
+
+
+def _metrics_token_matches(request):
+    """Whether the request carries the configured PROFILING_METRICS_TOKEN as a bearer token"""
+    token = getattr(settings, 'PROFILING_METRICS_TOKEN', '')
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme == 'Bearer' and hmac.compare_digest(given.encode(), token.encode())
+
+
+def metrics(request):
+    """Per-view query and timing metrics in the Prometheus text format (staff or bearer token only)"""
+    if not profiling.profiling_enabled():
+        raise Http404('Profiling is disabled')
+    if not (request.user.is_staff or _metrics_token_matches(request)):
+        return HttpResponse('Staff login or a metrics token is required', status=403)
+    return HttpResponse(
+        profiling.view_metrics.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+# ============================================================================
+# PURCHASING
+# ============================================================================
+
+@login_required
+def purchase_orders(request):
+    """Purchase orders with their received progress"""
+    orders = PurchaseOrder.objects.annotate(
+        line_count=Count('items'),
+        units_ordered=Sum('items__quantity_ordered'),
+        units_received=Sum('items__quantity_received'),
+    )
+    
+    status = request.GET.get('status')
+    if status:
+        orders = orders.filter(status=status)
+    
+    search = request.GET.get('search')
+    if search:
+        orders = orders.filter(supplier_name__icontains=search)
+    
+    page = paginate_keyset(request, orders)
+    
+    context = {
+        'orders': page,
+        'page': page,
+        'status_choices': PurchaseOrder.STATUS_CHOICES,
+        'status': status,
+        'search': search,
+    }
+    
+    return render(request, 'purchase_orders.html', context)
+
+
+@login_required
+@require_http_methods(["POST"])
+def create_purchase_order(request):
+    """Create a purchase order from JSON lines of medicine_id, quantity and unit_cost"""
+    try:
+        data = json.loads(request.body)
+        
+        order = purchasing.create_purchase_order(
+            data.get('supplier_name', ''),
+            data.get('items', []),
+            created_by=request.user,
+            notes=data.get('notes', ''),
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Purchase order created successfully',
+            'purchase_order_id': order.id,
+            'purchase_order_number': order.number,
+        })
+        
+    except Medicine.DoesNotExist as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+    except (AttributeError, TypeError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=500)
+
+
+@login_required
+@require_http_methods(["POST"])
+def receive_goods(request):
+    """Take a whole supplier delivery into stock in one request"""
+    try:
+        data = json.loads(request.body)
+        
+        receipt = purchasing.receive_goods(
+            data.get('items', []),
+            received_by=request.user,
+            purchase_order_id=data.get('purchase_order_id'),
+            supplier_name=data.get('supplier_name', ''),
+            invoice_number=data.get('invoice_number', ''),
+            notes=data.get('notes', ''),
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Goods received successfully',
+            'receipt_id': receipt.id,
+            'receipt_number': receipt.number,
+            'total_amount': str(receipt.total_amount),
+        })
+        
+    except PurchaseOrder.DoesNotExist:
+        return JsonResponse({
+            'success': False,
+            'message': 'Purchase order not found'
+        }, status=404)
+    except Medicine.DoesNotExist as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+    except (AttributeError, TypeError, ValueError) as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=400)
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'message': str(e)
+        }, status=500)
+
+
+
 # <----------old------------>
 
 from django.shortcuts import render, redirect, get_object_or_404
@@ -533,6 +1025,7 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.db.models import Q
 from .models import StaffProfile
+from .pagination import paginate_keyset
 import random
 import string
 
@@ -761,8 +1254,11 @@ def staff_list(request):
     on_leave = StaffProfile.objects.filter(status='on_leave').count()
     inactive_staff = StaffProfile.objects.filter(status='inactive').count()
     
+    page = paginate_keyset(request, staff_members)
+    
     context = {
-        'staff_members': staff_members,
+        'staff_members': page,
+        'page': page,
         'search_query': search_query,
         'role_filter': role_filter,
         'status_filter': status_filter,